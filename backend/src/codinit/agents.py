@@ -1,16 +1,25 @@
+import asyncio
 import inspect
 import json
+import logging
 import re
-import time
+from functools import lru_cache
 from inspect import Parameter
 from typing import Any, Callable, Dict, List, Optional, Union
 
 import openai
 from openai import RateLimitError
 from pydantic import create_model
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
-from codinit.config import secrets
+from codinit.config import AgentSettings, agent_settings, secrets
+from codinit.conversation_memory import ConversationMemory, render_messages
+from codinit.llm_scheduler import create_chat_completion, create_chat_completion_async
 from codinit.prompts import (
     code_corrector_system_prompt,
     code_corrector_user_prompt_template,
@@ -18,6 +27,7 @@ from codinit.prompts import (
     coder_user_prompt_template,
     dependency_tracker_system_prompt,
     dependency_tracker_user_prompt_template,
+    history_summarizer_system_prompt,
     linter_system_prompt,
     linter_user_prompt_template,
     planner_system_prompt,
@@ -28,6 +38,29 @@ from codinit.queries import get_classes, get_files, get_functions, get_imports
 openai.api_key = secrets.openai_api_key
 
 
+@lru_cache(maxsize=None)
+def get_function_schema(function: Callable[..., Any]) -> Dict[str, Any]:
+    """
+    Tool schema of a function for the OpenAI ChatCompletion API, extracted from its
+    signature and docstring. Cached, since building the pydantic model is expensive.
+    """
+    kw = {
+        n: (o.annotation, ... if o.default == Parameter.empty else o.default)
+        for n, o in inspect.signature(function).parameters.items()
+    }
+    config_dict = {"arbitrary_types_allowed": True}
+    parameters = create_model(f"Input for `{function.__name__}`", __config__=config_dict, **kw).model_json_schema()  # type: ignore
+    function_schema = dict(
+        type="function",
+        function=dict(
+            name=function.__name__,
+            description=function.__doc__,
+            parameters=parameters,
+        ),
+    )
+    return function_schema
+
+
 class OpenAIAgent:
     def __init__(
         self,
@@ -35,52 +68,162 @@ class OpenAIAgent:
         system_prompt: str = "",
         user_prompt_template="",
         functions: List[Callable[..., Any]] = [],
+        agent_settings: AgentSettings = agent_settings,
     ):
         self.model = model
         self.functions = functions
         self.func_names = [func.__name__ for func in self.functions]
+        # tool registry, maps the function names the model may call to the functions
+        self.tools: Dict[str, Callable[..., Any]] = {
+            func.__name__: func for func in self.functions
+        }
+        self.tool_schemas = [get_function_schema(func) for func in self.functions]
         self.system_prompt = system_prompt
         self.user_prompt_template = user_prompt_template
-        self.messages = [{"role": "system", "content": system_prompt}]
+        self.agent_settings = agent_settings
+        self.memory = ConversationMemory(
+            system_prompt=system_prompt,
+            policy=agent_settings.history_policy,  # type: ignore
+            window=agent_settings.history_window,
+            max_tokens=agent_settings.history_max_tokens,
+            encoding=agent_settings.tokenizer,
+            summarize=self.summarize_messages,
+        )
+        # prompt tokens reported by the API for each call of the session
+        self.prompt_tokens: List[int] = []
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """Messages sent with the next call, bounded by the history policy."""
+        return self.memory.messages
+
+    def new_session(self) -> "OpenAIAgent":
+        """Agent with the same prompts and tools and an empty history, one per task."""
+        return OpenAIAgent(
+            model=self.model,
+            system_prompt=self.system_prompt,
+            user_prompt_template=self.user_prompt_template,
+            functions=self.functions,
+            agent_settings=self.agent_settings,
+        )
+
+    def summarize_messages(self, messages: List[Dict[str, Any]]) -> str:
+        """Summary of older messages, used by the summarize history policy."""
+        response = create_chat_completion(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": history_summarizer_system_prompt},
+                {"role": "user", "content": render_messages(messages)},
+            ],
+        )
+        return response.choices[0].message.content or ""
 
     def get_schema(self, function: Callable[..., Any]):
         # function to extract schema of a function from the function code
-        kw = {
-            n: (o.annotation, ... if o.default == Parameter.empty else o.default)
-            for n, o in inspect.signature(function).parameters.items()
-        }
-        config_dict = {"arbitrary_types_allowed": True}
-        parameters = create_model(f"Input for `{function.__name__}`", __config__=config_dict, **kw).model_json_schema()  # type: ignore
-        function_schema = dict(
-            type="function",
-            function=dict(
-                name=function.__name__,
-                description=function.__doc__,
-                parameters=parameters,
-            ),
-        )
-        return function_schema
+        return get_function_schema(function)
 
     def call_func(self, tool_call) -> Any:
         """
         Extract name and arguments of the function from the response from the OpenAI ChatCompletion API,
-        Get the corresponding function from the current file,
+        Get the corresponding function from the tool registry of the agent,
         then call the function with extracted arguments.
         """
         function_name = tool_call.function.name
-        if function_name not in self.func_names:
+        if function_name not in self.tools:
             return print(f"Not allowed: {function_name}")
         function_args = json.loads(tool_call.function.arguments)
-        function_response = globals()[function_name](**function_args)
+        function_response = self.tools[function_name](**function_args)
         return function_response
 
+    def add_prompt(self, user_prompt: str, chat_history: List[Dict[str, Any]]) -> None:
+        for message in chat_history:
+            self.memory.add(message)
+        # print(f"{messages=}")
+        # Start by adding the user's message to the messages list
+        self.memory.add({"role": "user", "content": user_prompt})
+
+    async def add_prompt_async(
+        self, user_prompt: str, chat_history: List[Dict[str, Any]]
+    ) -> None:
+        if self.memory.policy == "summarize":
+            # adding a message may call the summarizer, keep it off the event loop
+            await asyncio.to_thread(self.add_prompt, user_prompt, chat_history)
+        else:
+            self.add_prompt(user_prompt, chat_history)
+
+    def get_tool_choice(self, tool_choice: Optional[str]) -> Union[str, Dict[str, Any]]:
+        if tool_choice:
+            return {"type": "function", "function": {"name": tool_choice}}
+        return "auto"
+
+    def record_usage(self, response) -> None:
+        if response.usage is not None:
+            self.prompt_tokens.append(response.usage.prompt_tokens)
+            logging.info(
+                f"{self.model=} prompt_tokens={response.usage.prompt_tokens}, "
+                f"{len(self.messages)} messages in the history"
+            )
+
+    def build_request(
+        self, tools=None, tool_choice: Optional[str] = None, **kwargs
+    ) -> Dict[str, Any]:
+        """Arguments of the chat completion for the current history."""
+        return dict(
+            model=self.model,
+            messages=self.messages,
+            tools=tools,
+            tool_choice=self.get_tool_choice(tool_choice),
+            response_format={"type": "json_object"},
+            **kwargs,
+        )
+
+    def report_error(self, e: Exception) -> None:
+        if isinstance(e, RateLimitError):
+            print("Rate limit reached after all retries of the scheduler")
+        else:
+            print("Unable to generate ChatCompletion response")
+        print(f"Exception: {e}")
+
+    def build_execute_request(
+        self,
+        tool_choice: Optional[str],
+        chat_history: List[Dict[str, Any]],
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Arguments of call_gpt for a call of execute with the prompt variables."""
+        return dict(
+            user_prompt=self.user_prompt_template.format(**kwargs),
+            tools=self.tool_schemas,
+            tool_choice=tool_choice,
+            chat_history=chat_history,
+        )
+
+    def handle_response(self, gpt_response) -> List[Any]:
+        """Adds the response to the history and returns its tool calls."""
+        message = gpt_response.choices[0].message
+        self.memory.add(message)
+        return message.tool_calls or []
+
+    def add_tool_output(self, tool_call, tool_output: Any) -> None:
+        self.memory.add(
+            dict(
+                tool_call_id=tool_call.id,
+                role="tool",
+                name=tool_call.function.name,
+                content=json.dumps(tool_output),
+            )
+        )
+
+    # rate limited requests are already retried by the scheduler
     @retry(
-        wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3)
+        wait=wait_random_exponential(multiplier=1, max=40),
+        stop=stop_after_attempt(3),
+        retry=retry_if_not_exception_type(RateLimitError),
     )
     def call_gpt(
         self,
         user_prompt: str,
-        chat_history: List[Dict] = [],
+        chat_history: List[Dict[str, Any]] = [],
         tools=None,
         tool_choice: Optional[str] = None,
         **kwargs,
@@ -98,69 +241,82 @@ class OpenAIAgent:
         Returns:
         - Any: The result from ChatCompletion.
         """
-        if len(chat_history) > 0:
-            self.messages += chat_history
-        # print(f"{messages=}")
-        # Start by adding the user's message to the messages list
-        self.messages.append({"role": "user", "content": user_prompt})
-        if tool_choice:
-            choice = {"type": "function", "function": {"name": tool_choice}}
-        else:
-            choice = "auto"  # type: ignore
+        self.add_prompt(user_prompt, chat_history)
         try:
             # Call the ChatCompletion API to get the model's response and return the result
-            response = openai.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tools,
-                tool_choice=choice,
-                response_format={"type": "json_object"},
-                **kwargs,
+            response = create_chat_completion(
+                **self.build_request(tools=tools, tool_choice=tool_choice, **kwargs)
             )
-            return response
-        except RateLimitError as e:
-            print("Rate limit reached, waiting to retry...")
-            print(f"Exception: {e}")
-            # TODO adjust this constant time to extract the wait time is reported in the exception
-            wait_time = 10
-            time.sleep(wait_time)
-            raise
         except Exception as e:
-            print("Unable to generate ChatCompletion response")
-            print(f"Exception: {e}")
+            self.report_error(e)
             raise  # Re-raise the exception to trigger the retry mechanism
+        self.record_usage(response)
+        return response
 
     def execute(
-        self, tool_choice: Optional[str] = None, chat_history: List[Dict] = [], **kwargs
+        self,
+        tool_choice: Optional[str] = None,
+        chat_history: List[Dict[str, Any]] = [],
+        **kwargs,
     ):
-        user_prompt = self.user_prompt_template.format(**kwargs)
-        function_schemas = [self.get_schema(function=func) for func in self.functions]
         gpt_response = self.call_gpt(
-            user_prompt=user_prompt,
-            tools=function_schemas,
-            tool_choice=tool_choice,
-            chat_history=chat_history,
+            **self.build_execute_request(tool_choice, chat_history, **kwargs)
         )
-        self.messages.append(gpt_response.choices[0].message)
-        # print(gpt_response)
-        tool_calls = gpt_response.choices[0].message.tool_calls
+        tool_calls = self.handle_response(gpt_response)
         print(tool_calls)
         # TODO handle having multiple functions vs. one single function
         tool_outputs = []
-        if tool_calls:
-            for tool_call in tool_calls:
-                tool_output = self.call_func(tool_call)
-                tool_outputs.append(tool_output)
-                self.messages.append(
-                    dict(
-                        tool_call_id=tool_call.id,
-                        role="tool",
-                        name=tool_call.function.name,
-                        content=json.dumps(tool_output),
-                    )
-                )
+        for tool_call in tool_calls:
+            tool_output = self.call_func(tool_call)
+            tool_outputs.append(tool_output)
+            self.add_tool_output(tool_call, tool_output)
+        return tool_outputs
+
+    # rate limited requests are already retried by the scheduler
+    @retry(
+        wait=wait_random_exponential(multiplier=1, max=40),
+        stop=stop_after_attempt(3),
+        retry=retry_if_not_exception_type(RateLimitError),
+    )
+    async def call_gpt_async(
+        self,
+        user_prompt: str,
+        chat_history: List[Dict[str, Any]] = [],
+        tools=None,
+        tool_choice: Optional[str] = None,
+        **kwargs,
+    ):
+        """Async variant of call_gpt, awaits the completion with the AsyncOpenAI client."""
+        await self.add_prompt_async(user_prompt, chat_history)
+        try:
+            response = await create_chat_completion_async(
+                **self.build_request(tools=tools, tool_choice=tool_choice, **kwargs)
+            )
+        except Exception as e:
+            self.report_error(e)
+            raise  # Re-raise the exception to trigger the retry mechanism
+        self.record_usage(response)
+        return response
+
+    async def execute_async(
+        self,
+        tool_choice: Optional[str] = None,
+        chat_history: List[Dict[str, Any]] = [],
+        **kwargs,
+    ):
+        """
+        Async variant of execute. Tools run in a worker thread, since they query
+        weaviate with the blocking client.
+        """
+        gpt_response = await self.call_gpt_async(
+            **self.build_execute_request(tool_choice, chat_history, **kwargs)
+        )
+        tool_outputs = []
+        for tool_call in self.handle_response(gpt_response):
+            tool_output = await asyncio.to_thread(self.call_func, tool_call)
+            tool_outputs.append(tool_output)
+            self.add_tool_output(tool_call, tool_output)
         return tool_outputs
-        # print(function_output)
 
 
 def extract_code_from_text(text):
@@ -3,6 +3,7 @@ import csv
 import datetime
 import logging
 from typing import List
+from uuid import uuid4
 
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
@@ -65,7 +66,8 @@ async def generate(websocket: WebSocket):
             fieldnames = [fieldname for fieldname in eval_settings.eval_columns]
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
-            code_editor = PythonCodeEditor()
+            # sessions run concurrently, each one edits and runs its own file
+            code_editor = PythonCodeEditor(filename=f"magic_code_{uuid4().hex}.py")
             config = TaskExecutionConfig()
             # libraries = item.libraries
             task = item.prompt
@@ -82,7 +84,7 @@ async def generate(websocket: WebSocket):
             )
             client = get_weaviate_client()
             attempt = 0
-            initial_code_generation = task_executor.initial_code_generation(
+            initial_code_generation = await task_executor.initial_code_generation_async(
                 library=library, client=client
             )
             plan = initial_code_generation.Generated_Plan.Plan
@@ -92,7 +94,7 @@ async def generate(websocket: WebSocket):
                     "code": initial_code_generation.Coding_Agent.Generated_Code,
                 }
             )
-            error, new_code = task_executor.code_correction_with_linting(
+            error, new_code = await task_executor.code_correction_with_linting_async(
                 new_code=initial_code_generation.Coding_Agent.Generated_Code,
                 deps=initial_code_generation.Dependencies.Dependencies,
                 relevant_docs=initial_code_generation.Documentation_Scraping.Relevant_Docs,
@@ -113,7 +115,10 @@ async def generate(websocket: WebSocket):
                     {"plan": "\n".join(plan), "code": new_code, "error": error}
                 )
                 # corrected code
-                error, new_code = task_executor.code_correction_with_linting(
+                (
+                    error,
+                    new_code,
+                ) = await task_executor.code_correction_with_linting_async(
                     new_code=new_code,
                     deps=initial_code_generation.Dependencies.Dependencies,
                     relevant_docs=initial_code_generation.Documentation_Scraping.Relevant_Docs,
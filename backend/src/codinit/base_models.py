@@ -7,7 +7,7 @@ import os
 import random
 import string
 import subprocess
-from typing import List
+from typing import List, Optional
 
 from virtualenv import cli_run
 
@@ -92,16 +92,24 @@ class CodeEditorTooling:
     The class maintains the code in memory and persistently in a file, which can be executed using a Python interpreter.
     """
 
-    def __init__(self, filename="magic_code.py", interpreter="python3") -> None:
+    def __init__(
+        self,
+        filename="magic_code.py",
+        interpreter="python3",
+        workdir: Optional[str] = None,
+    ) -> None:
         """
         Initialize the class with a filename and interpreter. By default, these are "magic_code.py" and "python3" respectively.
+        A relative filename is placed in workdir, which is the working directory of the code,
+        the linter and the checks. Without a workdir they run in the working directory of the process.
         """
         self.source_code: List[
             str
         ] = []  # Initialize an empty list to hold source code lines.
+        self.workdir = workdir
         self.filename = (
-            filename  # Store the filename where the code will be saved and run from.
-        )
+            os.path.join(workdir, filename) if workdir else filename
+        )  # Store the filename where the code will be saved and run from.
         self.interpreter = (
             interpreter  # Store the name of the interpreter to run the code with.
         )
@@ -163,6 +171,22 @@ class CodeEditorTooling:
         self.save_code()  # Save the updated code to the file.
         return self.display_code()  # Display the updated code.
 
+    @property
+    def relative_filename(self) -> str:
+        """
+        Path of the code file relative to workdir, the subprocesses get it instead of
+        the absolute path so that their outputs are the same in every run directory.
+        """
+        return os.path.relpath(self.filename, self.workdir or os.curdir)
+
+    def strip_workdir(self, output: bytes) -> bytes:
+        """Removes the workdir from the absolute paths Python prints in tracebacks."""
+        if not self.workdir:
+            return output
+        return output.replace(
+            os.fsencode(os.path.join(os.path.abspath(self.workdir), "")), b""
+        )
+
     def save_code(self):
         """
         Save the source code to a file.
@@ -176,7 +200,10 @@ class CodeEditorTooling:
         """
         # Use the subprocess module to run the code in a separate process.
         completed_process = subprocess.run(
-            [self.interpreter, self.filename], capture_output=True, timeout=30
+            [self.interpreter, self.relative_filename],
+            capture_output=True,
+            timeout=30,
+            cwd=self.workdir,
         )
 
         # Print the completed process and any stderr.
@@ -186,8 +213,8 @@ class CodeEditorTooling:
         succeeded = "Succeeded" if completed_process.returncode == 0 else "Failed"
 
         # Extract the stdout and stderr from the completed process.
-        stdout = completed_process.stdout
-        stderr = completed_process.stderr
+        stdout = self.strip_workdir(completed_process.stdout)
+        stderr = self.strip_workdir(completed_process.stderr)
 
         # Return a string containing the results.
         return f"Program {succeeded}\nStdout:{stdout}\nStderr:{stderr}"
@@ -210,7 +237,10 @@ class CodeEditorTooling:
 
         # Execute the script using the virtual environment's Python interpreter
         process = subprocess.run(
-            [self.interpreter, script_path] + list(args), capture_output=True, text=True
+            [self.interpreter, script_path] + list(args),
+            capture_output=True,
+            text=True,
+            cwd=self.workdir,
         )
 
         return process
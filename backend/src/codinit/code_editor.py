@@ -4,31 +4,38 @@ Just added comments
 """
 import json
 import logging
+import os
 import subprocess
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import isort
 
 from codinit.base_models import CodeEditorTooling, VirtualenvManager
 from codinit.checks.get_imports import extract_library_usages
 from codinit.checks.move_imports import refactor_code
+from codinit.symbol_index import get_symbol_index
 
 # Set up the logger
 logger = logging.getLogger(__name__)
 
+# scripts run inside the virtual environment, independent of the working directory
+CHECKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checks")
+
 
 class PythonCodeEditor(CodeEditorTooling):
     """A class for managing Python code editing in a virtual Python environment."""
 
-    def __init__(self, filename="magic_code.py") -> None:
+    def __init__(self, filename="magic_code.py", workdir: Optional[str] = None) -> None:
         """
         Initialize the PythonCodeEditor instance.
 
         Args:
             filename (str): The name of the file to store the code. Defaults to "magic_code.py".
+            workdir (Optional[str]): Directory the code is saved, linted and run in,
+                e.g. the directory of a task. Defaults to the working directory of the process.
         """
         # Call the parent class initializer with the provided filename and "python3" as the interpreter
-        super().__init__(filename, interpreter="python3")
+        super().__init__(filename, interpreter="python3", workdir=workdir)
 
         # Instantiate a VirtualenvManager
         self.venv = VirtualenvManager()
@@ -89,13 +96,23 @@ class PythonCodeEditor(CodeEditorTooling):
             # it returns: ['langchain.llms', 'langchain.prompts', 'langchain.LLMChain', 'langchain.agents']
             imports = extract_library_usages(code=code, library_name=library_name)
             print(imports)
+            # answer from the symbol index of the library without starting its venv,
+            # the index misses e.g. star re-exports and lazy module attributes,
+            # so only the imports it does not contain are checked in the venv
+            symbol_index = get_symbol_index(library_name)
+            if symbol_index is not None:
+                found = {name for name in imports if name in symbol_index}
+                final_result |= dict.fromkeys(found, True)
+                imports = [name for name in imports if name not in found]
+                if not imports:
+                    continue
             # imports = ["langchain.llms", "langchain.prompts", "langchain.LLMChain", "langchain.agents"]
             json_imports = json.dumps(imports)  # Convert list to JSON string
             # Writing to sample.json
-            with open("sample.json", "w") as file:
+            with open(os.path.join(self.workdir or "", "sample.json"), "w") as file:
                 json.dump(imports, file)
             result = self.run_script_inside_env(
-                "src/codinit/checks/check_import_existence.py",
+                os.path.join(CHECKS_DIR, "check_import_existence.py"),
                 json_imports,
                 library_name,
             )
@@ -112,8 +129,8 @@ class PythonCodeEditor(CodeEditorTooling):
         final_result: Dict[str, bool] = {}
         for library_name in dependencies:
             result = self.run_script_inside_env(
-                "src/codinit/checks/check_reference_existence.py",
-                self.filename,
+                os.path.join(CHECKS_DIR, "check_reference_existence.py"),
+                self.relative_filename,
                 library_name,
             )
             if result.stderr:
@@ -130,16 +147,18 @@ class PythonCodeEditor(CodeEditorTooling):
         """
         cmd = [
             "pylint",
-            self.filename,
+            self.relative_filename,
             "--disable=all",
             "--enable=E0401,E0611,E0402,E0602,E0603,E0604,W1505,E1102,E1101",
         ]
 
         # Run pylint
-        linter_output = subprocess.run(cmd, text=True, capture_output=True, check=False)
+        linter_output = subprocess.run(
+            cmd, text=True, capture_output=True, check=False, cwd=self.workdir
+        )
         linter_output = linter_output.stdout.splitlines()
         error_messages = [
-            line for line in linter_output if line.startswith(self.filename)
+            line for line in linter_output if line.startswith(self.relative_filename)
         ]
         # Extract the number of issues from the output
         return error_messages
@@ -1,17 +1,45 @@
 import logging
+import multiprocessing
 import os
-import time
-from typing import Union
+import queue
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import libcst
-import openai
 import weaviate
 import weaviate.classes as wvc
-from git import Repo
+from git import (
+    BadName,
+    BadObject,
+    GitCommandError,
+    InvalidGitRepositoryError,
+    NoSuchPathError,
+    Repo,
+)
 from openai import RateLimitError
-from weaviate.classes.query import Filter
-
+from weaviate.classes.query import Filter, QueryReference
+
+from codinit.config import IngestionSettings, ingestion_settings
+from codinit.embeddings import get_embedder
+from codinit.kg_pydantic_models import (
+    ClassRecord,
+    FileRecord,
+    FunctionRecord,
+    ImportRecord,
+)
+from codinit.llm_scheduler import create_chat_completion
+from codinit.symbol_index import build_symbol_index, get_symbol_index_path
+from codinit.weaviate_batch import WeaviateBatchWriter
 from codinit.weaviate_client import get_weaviate_client
+from codinit.weaviate_utils import compute_content_hash, get_object_uuid
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -32,7 +60,7 @@ def call_GPT(user_prompt: str, modelname: str = "gpt-3.5-turbo-1106"):
     messages.append({"role": "user", "content": user_prompt})
     try:
         # Call the ChatCompletion API to get the model's response and return the result
-        response = openai.chat.completions.create(
+        response = create_chat_completion(
             model=modelname,
             messages=messages,
         )
@@ -40,12 +68,9 @@ def call_GPT(user_prompt: str, modelname: str = "gpt-3.5-turbo-1106"):
         return response.choices[0].message.content
     except RateLimitError as e:
         logging.error(
-            "Rate limit reached for ChatCompletion API while code base analysis, waiting to retry..."
+            "Rate limit reached for ChatCompletion API while code base analysis, retries exhausted"
         )
         logging.error(f"Exception: {e}")
-        # TODO adjust this constant time to extract the wait time is reported in the exception
-        wait_time = 10
-        time.sleep(wait_time)
         raise
     except Exception as e:
         logging.error(
@@ -55,35 +80,39 @@ def call_GPT(user_prompt: str, modelname: str = "gpt-3.5-turbo-1106"):
         raise  # Re-raise the exception to trigger the retry mechanism
 
 
-def file_already_exists(
-    filename: str, link: str, client: weaviate.WeaviateClient
-) -> bool:
+def get_file_index(
+    directory: str, client: weaviate.WeaviateClient
+) -> Dict[str, Optional[str]]:
     """
-    Checks if a file has already been visited before so it can be skipped.
+    Prefetches the links and content hashes of all files of a directory that are
+    already in the KG with a single query for the files of its repository, so that
+    existence checks during the directory walk are local lookups instead of one query
+    per file.
     """
     client.connect()
+    file_index: Dict[str, Optional[str]] = {}
+    directory_prefix = os.path.join(directory, "")
     try:
-        file_collection = client.collections.get("File")
-        # query if library already exists and has documentation files
-        query_file_result = file_collection.query.fetch_objects(
+        repository_collection = client.collections.get("Repository")
+        result = repository_collection.query.fetch_objects(
+            filters=wvc.query.Filter.by_property("name").equal(directory),
             return_properties=["name"],
-            filters=wvc.query.Filter.by_property("name").equal(filename),
+            return_references=QueryReference(
+                link_on="hasFile", return_properties=["link", "content_hash"]
+            ),
             limit=5,
         )
-        logging.debug(f"Query if file already exists: {query_file_result=}")
-        client.close()
-        # Process the result to check if a file with the same link exists
-        file_exists = False
-        for item in query_file_result.objects:
-            if item.properties["link"] == link:
-                file_exists = True
-                break
-        return file_exists
-
+        for repository in result.objects:
+            if repository.properties["name"] != directory or not repository.references:
+                continue
+            for item in repository.references["hasFile"].objects:
+                link = item.properties.get("link")
+                if link and link.startswith(directory_prefix):
+                    file_index[link] = item.properties.get("content_hash")
     except Exception as e:
         logging.error(f"Error in querying Weaviate: {e}")
-        client.close()
-        return False
+    logging.info(f"Found {len(file_index)} files of {directory=} in the KG")
+    return file_index
 
 
 # Function that queries Weaviate db to find if repo has been processed there.
@@ -98,7 +127,6 @@ def check_if_repo_has_been_embedded(
         filters=wvc.query.Filter.by_property("name").equal(repo_dir),
         limit=5,
     )
-    client.close()
     library_exists = repository_query_result.objects
     if len(library_exists) == 0:
         return False
@@ -119,6 +147,44 @@ def get_full_name(node):
         return get_full_name(node.value) + "." + node.attr.value
 
 
+def hash_file(file_path: str) -> Optional[str]:
+    """Content hash of a file on disk, None if it can not be decoded."""
+    try:
+        with open(file_path, "r") as f:
+            return compute_content_hash(f.read())
+    except UnicodeDecodeError:
+        return None
+
+
+def get_import_names(node: Union[libcst.Import, libcst.ImportFrom]) -> List[str]:
+    """
+    Full names of everything imported by an import statement.
+    `from module import function, Class` gives ["module.function", "module.Class"],
+    relative imports keep their leading dots, star imports end with "*" and aliased
+    imports end with the name they are bound to, e.g. "module.Class as Alias".
+    """
+    if isinstance(node, libcst.Import):
+        return [
+            get_import_alias_name(get_full_name(name.name), name) for name in node.names
+        ]
+    module_name = "." * len(node.relative)
+    if node.module is not None:
+        module_name += get_full_name(node.module)
+    if isinstance(node.names, libcst.ImportStar):
+        return [module_name + ".*"]
+    separator = "" if module_name.endswith(".") else "."
+    return [
+        get_import_alias_name(module_name + separator + get_full_name(name.name), name)
+        for name in node.names
+    ]
+
+
+def get_import_alias_name(import_name: str, alias: libcst.ImportAlias) -> str:
+    if alias.asname is None:
+        return import_name
+    return f"{import_name} as {get_full_name(alias.asname.name)}"
+
+
 class FunctionInfoCollector(libcst.CSTVisitor):
     """
     Visitor for functions in the code file that is being parsed
@@ -192,7 +258,11 @@ def parse_file(
     # takes the Python source code (stored as a string in file_content) and parses it into an AST, which is stored in module.
     module = libcst.parse_module(file_content)
     # File entity
-    file = {"name": file_name, "link": link}
+    file = {
+        "name": file_name,
+        "link": link,
+        "content_hash": compute_content_hash(file_content),
+    }
 
     file_collection = weaviate_client.collections.get("File")
     import_collection = weaviate_client.collections.get("Import")
@@ -393,19 +463,261 @@ def parse_file(
     return file_id
 
 
+def extract_file_record(file_content: str, file_name: str, link: str) -> FileRecord:
+    """
+    Parse a single file into a FileRecord holding its imports, functions and classes.
+    Entities get deterministic UUIDs, so relationships between them are known
+    before anything has been sent to weaviate.
+    Does not touch weaviate, which allows to run it in a separate process.
+    """
+    module = libcst.parse_module(file_content)
+    # counts repeated names in the same file, e.g. redefined functions or property setters
+    occurrences: Counter[Tuple[str, str]] = Counter()
+
+    def object_uuid(collection: str, name: str) -> str:
+        occurrences[(collection, name)] += 1
+        return get_object_uuid(collection, link, name, occurrences[(collection, name)])
+
+    def function_record(
+        function_node: libcst.FunctionDef, class_name: str = ""
+    ) -> FunctionRecord:
+        function_name = function_node.name.value
+        qualified_name = (
+            f"{class_name}.{function_name}" if class_name else function_name
+        )
+        return FunctionRecord(
+            uuid=object_uuid("Function", qualified_name),
+            name=function_name,
+            **extract_function_info(function_node),
+        )
+
+    file_record = FileRecord(
+        uuid=get_object_uuid("File", link),
+        name=file_name,
+        link=link,
+        content_hash=compute_content_hash(file_content),
+    )
+    for node in module.children:
+        if isinstance(node, libcst.SimpleStatementLine):
+            for statement in node.body:
+                if not isinstance(statement, (libcst.Import, libcst.ImportFrom)):
+                    continue
+                for import_name in get_import_names(statement):
+                    file_record.imports.append(
+                        ImportRecord(
+                            uuid=object_uuid("Import", import_name), name=import_name
+                        )
+                    )
+
+        elif isinstance(node, libcst.FunctionDef):
+            file_record.functions.append(function_record(node))
+
+        elif isinstance(node, libcst.ClassDef):
+            class_name = node.name.value
+            class_record = ClassRecord(
+                uuid=object_uuid("Class", class_name),
+                name=class_name,
+                attributes=extract_attributes(node),
+            )
+            for sub_node in node.body.body:
+                if isinstance(sub_node, libcst.FunctionDef):
+                    class_record.methods.append(
+                        function_record(sub_node, class_name=class_name)
+                    )
+            file_record.classes.append(class_record)
+
+    return file_record
+
+
+def write_file_record(
+    file_record: FileRecord, batch_writer: WeaviateBatchWriter
+) -> str:
+    """Add the entities of a FileRecord and their relationships to a batch writer."""
+    file_id = batch_writer.add_object(
+        collection="File",
+        properties={
+            "name": file_record.name,
+            "link": file_record.link,
+            "content_hash": file_record.content_hash,
+        },
+        uuid=file_record.uuid,
+    )
+
+    def add_function(function_record: FunctionRecord) -> str:
+        function_id = batch_writer.add_object(
+            collection="Function",
+            properties={
+                **function_record.model_dump(exclude={"uuid"}),
+                "description": "",
+            },
+            uuid=function_record.uuid,
+        )
+        # File <-> Function relationship
+        batch_writer.add_reference("File", file_id, "hasFunction", function_id)
+        batch_writer.add_reference("Function", function_id, "belongsToFile", file_id)
+        return function_id
+
+    for import_record in file_record.imports:
+        import_id = batch_writer.add_object(
+            collection="Import",
+            properties={"name": import_record.name},
+            uuid=import_record.uuid,
+        )
+        # File <-> Import relationship
+        batch_writer.add_reference("File", file_id, "hasImport", import_id)
+        batch_writer.add_reference("Import", import_id, "belongsToFile", file_id)
+
+    for function_record in file_record.functions:
+        add_function(function_record)
+
+    for class_record in file_record.classes:
+        class_id = batch_writer.add_object(
+            collection="Class",
+            properties={
+                "name": class_record.name,
+                "attributes": class_record.attributes,
+                "description": "",
+            },
+            uuid=class_record.uuid,
+        )
+        # File <-> Class relationship
+        batch_writer.add_reference("File", file_id, "hasClass", class_id)
+        batch_writer.add_reference("Class", class_id, "belongsToFile", file_id)
+        for method_record in class_record.methods:
+            function_id = add_function(method_record)
+            # Class <-> Function relationship
+            batch_writer.add_reference("Class", class_id, "hasFunction", function_id)
+            batch_writer.add_reference(
+                "Function", function_id, "belongsToClass", class_id
+            )
+
+    return file_id
+
+
+def parse_file_batched(
+    file_content: str,
+    file_name: str,
+    link: str,
+    batch_writer: WeaviateBatchWriter,
+) -> str:
+    """
+    Parse a single file and add its entities and their relationships to a batch writer.
+    """
+    file_record = extract_file_record(file_content, file_name, link)
+    return write_file_record(file_record, batch_writer)
+
+
+def iter_python_files(directory: str) -> Iterator[Tuple[str, str]]:
+    """Yields (file name, file path) of all Python files in a directory tree."""
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith(".py"):  # Process only Python files
+                yield file, os.path.join(root, file)
+
+
+def parse_file_worker(file_name: str, file_path: str) -> Optional[FileRecord]:
+    """
+    Reads and parses a single file into a FileRecord, runs in a worker process.
+    Returns None for files that cannot be read or parsed.
+    """
+    try:
+        with open(file_path, "r") as f:
+            file_content = f.read()
+        return extract_file_record(file_content, file_name, file_path)
+    except (libcst.ParserSyntaxError, UnicodeDecodeError) as e:
+        logging.error(f"Skipping file {file_path=} that cannot be parsed: {e}")
+        return None
+
+
+def write_file_records(
+    record_queue: "queue.Queue[Optional[FileRecord]]",
+    batch_writer: WeaviateBatchWriter,
+    directory_id: str,
+) -> int:
+    """
+    Writer stage of the ingestion pipeline: streams FileRecords from the queue into
+    the batch writer until it receives None. Returns the number of written files.
+    """
+    num_files = 0
+    while True:
+        file_record = record_queue.get()
+        if file_record is None:
+            return num_files
+        file_id = write_file_record(file_record, batch_writer)
+        # Repository -> File relationship
+        batch_writer.add_reference("Repository", directory_id, "hasFile", file_id)
+        num_files += 1
+
+
+def put_record(
+    record_queue: "queue.Queue[Optional[FileRecord]]",
+    file_record: Optional[FileRecord],
+    writer_future: "Future[int]",
+) -> None:
+    """Puts a record on the bounded queue, re-raising the writer error if it stopped."""
+    while True:
+        if writer_future.done():
+            writer_future.result()
+            raise RuntimeError("Writer stage stopped before the end of the ingestion.")
+        try:
+            record_queue.put(file_record, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
+def collect_record(
+    parser_future: "Future[Optional[FileRecord]]",
+    file_path: str,
+    record_queue: "queue.Queue[Optional[FileRecord]]",
+    writer_future: "Future[int]",
+) -> None:
+    """Hands the record of a parser worker to the writer, skipping failed files."""
+    try:
+        file_record = parser_future.result()
+    except Exception as e:
+        logging.error(f"Skipping file {file_path=}, parsing failed: {e}")
+        return
+    if file_record is not None:
+        put_record(record_queue, file_record, writer_future)
+
+
+def stop_writer(
+    record_queue: "queue.Queue[Optional[FileRecord]]", writer_future: "Future[int]"
+) -> None:
+    """Sends the end of ingestion to the writer, unless it already stopped."""
+    while not writer_future.done():
+        try:
+            record_queue.put(None, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
 def analyze_directory(
-    directory: str, repo_url: str, weaviate_client: weaviate.WeaviateClient
+    directory: str,
+    repo_url: str,
+    weaviate_client: weaviate.WeaviateClient,
+    ingestion_settings: IngestionSettings = ingestion_settings,
 ):
     """
     Analyzes all Python files in a directory (and its subdirectories), collects a
     list of dictionaries containing filename, function names, and class names for each file.
     """
+    if ingestion_settings.batch_mode:
+        return analyze_directory_batched(
+            directory=directory,
+            repo_url=repo_url,
+            weaviate_client=weaviate_client,
+            ingestion_settings=ingestion_settings,
+        )
     weaviate_client.connect()
     logging.info(f"Analyzing Code Directory {directory=}")
     # File entity
     directory_obj = {
         "name": directory,
         "link": repo_url,
+        "commit_sha": get_head_commit_sha(directory),
     }
     repository_collection = weaviate_client.collections.get("Repository")
     # Create file in Weaviate and get its id
@@ -413,6 +725,7 @@ def analyze_directory(
     logging.info(
         f"created directory object in weaviate db {directory_obj=} with {directory_id=}"
     )
+    file_index = get_file_index(directory=directory, client=weaviate_client)
     for root, _, files in os.walk(directory):
         logging.info(f"Found following files in directory {root=}: {files=}")
         for file in files:
@@ -423,10 +736,7 @@ def analyze_directory(
                 )
                 with open(file_path, "r") as f:
                     file_content = f.read()
-                file_exists = file_already_exists(
-                    filename=file, link=file_path, client=weaviate_client
-                )
-                if not file_exists:
+                if file_path not in file_index:
                     file_id = parse_file(
                         file_content, file, file_path, weaviate_client
                     )  # Analyze the file and add its data to the weaviate db
@@ -439,7 +749,125 @@ def analyze_directory(
                         from_property="hasFile",
                         to=file_id,
                     )
-    weaviate_client.close()
+    return directory_id
+
+
+def ingest_files(
+    files_to_parse: List[Tuple[str, str]],
+    directory_id: str,
+    batch_writer: WeaviateBatchWriter,
+    ingestion_settings: IngestionSettings = ingestion_settings,
+) -> int:
+    """
+    Producer/consumer pipeline: a process pool parses the given (file name, file path)
+    pairs into FileRecords, and a writer thread streams them through a bounded queue
+    into the batch writer. Returns the number of written files.
+    """
+    num_workers = ingestion_settings.num_workers or os.cpu_count()
+    queue_size = ingestion_settings.queue_size
+    record_queue: "queue.Queue[Optional[FileRecord]]" = queue.Queue(maxsize=queue_size)
+    # the process has threads and an open weaviate channel by now, forking it may
+    # deadlock the workers, so they are started by a fork server or spawned
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    with ProcessPoolExecutor(
+        max_workers=num_workers, mp_context=multiprocessing.get_context(start_method)
+    ) as parser_pool, ThreadPoolExecutor(max_workers=1) as writer_pool:
+        writer_future = writer_pool.submit(
+            write_file_records, record_queue, batch_writer, directory_id
+        )
+        pending: Dict["Future[Optional[FileRecord]]", str] = {}
+        try:
+            for file, file_path in files_to_parse:
+                future = parser_pool.submit(parse_file_worker, file, file_path)
+                pending[future] = file_path
+                # bound the number of parsed records waiting in memory
+                if len(pending) >= queue_size:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect_record(
+                            future, pending.pop(future), record_queue, writer_future
+                        )
+            for future in as_completed(list(pending)):
+                collect_record(future, pending.pop(future), record_queue, writer_future)
+        finally:
+            # the writer thread must stop, otherwise leaving the pools blocks forever
+            stop_writer(record_queue, writer_future)
+        num_files = writer_future.result()
+    logging.info(f"Parsed {num_files} files with {num_workers} parser processes")
+    return num_files
+
+
+def analyze_directory_batched(
+    directory: str,
+    repo_url: str,
+    weaviate_client: weaviate.WeaviateClient,
+    ingestion_settings: IngestionSettings = ingestion_settings,
+):
+    """
+    Batched variant of analyze_directory, runs as a producer/consumer pipeline:
+    a process pool parses the Python files of the directory into FileRecords,
+    and a writer thread streams them through a bounded queue into a batch writer,
+    which flushes objects and references through the weaviate batch API.
+    """
+    logging.info(f"Analyzing Code Directory {directory=} in batch mode")
+    batch_writer = WeaviateBatchWriter(
+        client=weaviate_client,
+        batch_size=ingestion_settings.batch_size,
+        concurrent_requests=ingestion_settings.concurrent_requests,
+        buffer_size=ingestion_settings.buffer_size,
+        embedder=get_embedder(),
+    )
+    directory_id = get_object_uuid("Repository", directory)
+    file_index = get_file_index(directory=directory, client=weaviate_client)
+    files_to_parse = []
+    # changed files are deleted before the repository object is added to the batch
+    for file, file_path in iter_python_files(directory):
+        if file_path in file_index:
+            indexed_hash = file_index[file_path]
+            # files indexed before content hashes were recorded are kept as is
+            if indexed_hash is None or indexed_hash == hash_file(file_path):
+                continue
+            delete_file_entities(
+                link=file_path, repository_id=directory_id, client=weaviate_client
+            )
+        files_to_parse.append((file, file_path))
+    repository_collection = weaviate_client.collections.get("Repository")
+    commit_sha = get_head_commit_sha(directory)
+    # a batch insert replaces the whole object, including its references to the
+    # unchanged files, so existing repositories are only updated after the ingestion
+    repository_exists = repository_collection.data.exists(directory_id)
+    if not repository_exists:
+        batch_writer.add_object(
+            collection="Repository",
+            properties={"name": directory, "link": repo_url, "commit_sha": commit_sha},
+            uuid=directory_id,
+        )
+    logging.info(
+        f"{len(files_to_parse)} new or changed files to parse, "
+        f"{len(file_index)} files already in the KG"
+    )
+    num_files = ingest_files(
+        files_to_parse=files_to_parse,
+        directory_id=directory_id,
+        batch_writer=batch_writer,
+        ingestion_settings=ingestion_settings,
+    )
+    report = batch_writer.close()
+    if repository_exists:
+        repository_collection.data.update(
+            uuid=directory_id, properties={"commit_sha": commit_sha}
+        )
+    logging.info(
+        f"Embedded {num_files} files of {directory=}: {report.num_objects} objects, "
+        f"{report.num_references} references in {report.duration:.1f}s "
+        f"({report.objects_per_second:.1f} objects/sec), "
+        f"{report.failed_objects} failed objects, "
+        f"{report.failed_references} failed references"
+    )
     return directory_id
 
 
@@ -475,10 +903,191 @@ def clone_repo_if_not_exists(repo_url: str, local_dir: Union[str, os.PathLike])
         logging.info(f"Repository has already been cloned to {local_dir}")
 
 
+def pull_repo(local_dir: Union[str, "os.PathLike[str]"]) -> None:
+    """Pulls the latest commits of a cloned repository from its origin."""
+    try:
+        Repo(local_dir).remotes.origin.pull()
+        logging.info(f"Repository {local_dir} pulled successfully")
+    except Exception as e:
+        # keep working on the local state, e.g. when offline
+        logging.error(f"Could not pull repository {local_dir}: {e}")
+
+
+def get_head_commit_sha(repo_dir: Union[str, "os.PathLike[str]"]) -> Optional[str]:
+    """Returns the SHA of the checked out commit, None if repo_dir is no git repository."""
+    try:
+        return Repo(repo_dir).head.commit.hexsha
+    except (InvalidGitRepositoryError, NoSuchPathError, ValueError):
+        return None
+
+
+def get_changed_files(
+    repo_dir: Union[str, "os.PathLike[str]"], old_sha: str, new_sha: str
+) -> Tuple[List[str], List[str]]:
+    """
+    Diffs two commits of a repository and returns the repository relative paths of the
+    Python files to remove from the KG (modified, removed or renamed)
+    and the Python files to index (modified, added or renamed).
+    """
+    removed, added = [], []
+    for diff in Repo(repo_dir).commit(old_sha).diff(new_sha):
+        if diff.change_type != "A" and diff.a_path and diff.a_path.endswith(".py"):
+            removed.append(diff.a_path)
+        if diff.change_type != "D" and diff.b_path and diff.b_path.endswith(".py"):
+            added.append(diff.b_path)
+    return removed, added
+
+
+def get_repository(repo_dir: str, client: weaviate.WeaviateClient):
+    """Returns the Repository object of repo_dir, None if it has not been embedded."""
+    client.connect()
+    repository_collection = client.collections.get("Repository")
+    result = repository_collection.query.fetch_objects(
+        return_properties=["name", "commit_sha"],
+        filters=wvc.query.Filter.by_property("name").equal(repo_dir),
+        limit=5,
+    )
+    for repository in result.objects:
+        if repository.properties["name"] == repo_dir:
+            return repository
+    return None
+
+
+def delete_file_entities(
+    link: str, repository_id: str, client: weaviate.WeaviateClient
+) -> None:
+    """
+    Deletes the File object with the given link together with its Import, Class and
+    Function children and detaches it from its repository, if the repository exists.
+    """
+    client.connect()
+    file_collection = client.collections.get("File")
+    repository_collection = client.collections.get("Repository")
+    repository_exists = repository_collection.data.exists(repository_id)
+    result = file_collection.query.fetch_objects(
+        filters=wvc.query.Filter.by_property("link").equal(link),
+        return_properties=["link"],
+        return_references=[
+            QueryReference(link_on=reference, return_properties=["name"])
+            for reference in ["hasImport", "hasClass", "hasFunction"]
+        ],
+        limit=5,
+    )
+    for file_obj in result.objects:
+        if file_obj.properties["link"] != link:
+            continue
+        for reference, collection_name in [
+            ("hasImport", "Import"),
+            ("hasClass", "Class"),
+            ("hasFunction", "Function"),
+        ]:
+            if not file_obj.references or reference not in file_obj.references:
+                continue
+            child_ids = [child.uuid for child in file_obj.references[reference].objects]
+            if child_ids:
+                client.collections.get(collection_name).data.delete_many(
+                    where=Filter.by_id().contains_any(child_ids)
+                )
+        if repository_exists:
+            repository_collection.data.reference_delete(
+                from_uuid=repository_id, from_property="hasFile", to=file_obj.uuid
+            )
+        file_collection.data.delete_by_id(file_obj.uuid)
+        logging.info(f"Deleted file {link=} and its entities from the KG")
+
+
+def sync_repository(
+    repo_dir: str,
+    repo_url: str,
+    client: weaviate.WeaviateClient,
+    ingestion_settings: IngestionSettings = ingestion_settings,
+) -> bool:
+    """
+    Incrementally updates the KG of a repository to its checked out commit.
+    Diffs the indexed commit against the checked out one, deletes the entities of
+    modified and removed files and re-indexes modified and added files only.
+    Returns whether the KG changed.
+    """
+    repository = get_repository(repo_dir, client)
+    if repository is None:
+        logging.info(f"Found no embedding for library {repo_dir=}, embedding now...")
+        analyze_directory(
+            directory=repo_dir,
+            repo_url=repo_url,
+            weaviate_client=client,
+            ingestion_settings=ingestion_settings,
+        )
+        return True
+    head_sha = get_head_commit_sha(repo_dir)
+    indexed_sha = repository.properties.get("commit_sha")
+    if head_sha is None:
+        logging.warning(f"{repo_dir=} is no git repository, skipping sync")
+        return False
+    if indexed_sha == head_sha:
+        logging.info(f"Repository {repo_dir=} is up to date at commit {head_sha}")
+        return False
+    changed_files: Optional[Tuple[List[str], List[str]]] = None
+    if indexed_sha:
+        try:
+            changed_files = get_changed_files(repo_dir, indexed_sha, head_sha)
+        except (BadName, BadObject, GitCommandError, ValueError) as e:
+            # e.g. the indexed commit is gone after a force-push or in a shallow clone
+            logging.warning(f"Cannot diff {repo_dir=} from {indexed_sha}: {e}")
+    else:
+        logging.warning(f"No indexed commit recorded for {repo_dir=}")
+    if changed_files is not None:
+        removed, added = changed_files
+    else:
+        # re-index every file, removing the indexed files that no longer exist too
+        added = [
+            os.path.relpath(file_path, repo_dir)
+            for _, file_path in iter_python_files(repo_dir)
+        ]
+        indexed_files = get_file_index(directory=repo_dir, client=client)
+        removed = sorted(
+            set(added) | {os.path.relpath(link, repo_dir) for link in indexed_files}
+        )
+    logging.info(
+        f"Syncing {repo_dir=} from {indexed_sha} to {head_sha}: "
+        f"{len(removed)} files to remove, {len(added)} files to index"
+    )
+    for path in removed:
+        delete_file_entities(
+            link=os.path.join(repo_dir, path),
+            repository_id=repository.uuid,
+            client=client,
+        )
+    batch_writer = WeaviateBatchWriter(
+        client=client,
+        batch_size=ingestion_settings.batch_size,
+        concurrent_requests=ingestion_settings.concurrent_requests,
+        buffer_size=ingestion_settings.buffer_size,
+        embedder=get_embedder(),
+    )
+    files_to_parse = [
+        (os.path.basename(path), os.path.join(repo_dir, path))
+        for path in added
+        if os.path.isfile(os.path.join(repo_dir, path))
+    ]
+    ingest_files(
+        files_to_parse=files_to_parse,
+        directory_id=str(repository.uuid),
+        batch_writer=batch_writer,
+        ingestion_settings=ingestion_settings,
+    )
+    batch_writer.close()
+    client.collections.get("Repository").data.update(
+        uuid=repository.uuid, properties={"commit_sha": head_sha}
+    )
+    logging.info(f"Repository {repo_dir=} synced to commit {head_sha}")
+    return True
+
+
 # check if library has been embedded to weaviate, otherwise embed it using analyze_directory
 def embed_repository_if_not_exists(
     repo_dir: str, repo_url: str, client: weaviate.WeaviateClient
-) -> None:
+) -> bool:
+    """Returns whether the repository was embedded now."""
     if not check_if_repo_has_been_embedded(repo_dir, client):
         logging.info(f"Found no embedding for library {repo_dir=}, embedding now...")
         analyze_directory(
@@ -489,8 +1098,9 @@ def embed_repository_if_not_exists(
         logging.info(
             f"Repository {repo_dir=} has now been embedded successfully to Weaviate"
         )
-    else:
-        logging.info(f"Repository {repo_dir=} has already been embedded to Weaviate")
+        return True
+    logging.info(f"Repository {repo_dir=} has already been embedded to Weaviate")
+    return False
 
 
 def run_codebase_analysis(
@@ -499,7 +1109,14 @@ def run_codebase_analysis(
     logging.info(f"Running analysis for {libname=}")
     repo_dir = repo_dir + "/" + libname
     clone_repo_if_not_exists(repo_url, local_dir=repo_dir)
-    embed_repository_if_not_exists(repo_dir, repo_url, client)
+    if ingestion_settings.incremental_sync:
+        pull_repo(local_dir=repo_dir)
+        changed = sync_repository(repo_dir, repo_url, client)
+    else:
+        changed = embed_repository_if_not_exists(repo_dir, repo_url, client)
+    # rewriting an unchanged index would make every reader reopen it
+    if changed or not os.path.isfile(get_symbol_index_path(libname)):
+        build_symbol_index(repo_dir, libname, client)
     logging.info(f"Analysis for {libname=} completed successfully")
 
 
@@ -512,7 +1129,6 @@ def delete_library_KG(libname: str, client: weaviate.WeaviateClient) -> None:
         where=Filter.by_property("name").contains_any([libname])
     )
     logging.info(f"Deleted successfully the codebase KG of {libname=}")
-    client.close()
 
 
 # check if repo has been cloned
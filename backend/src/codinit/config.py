@@ -1,4 +1,4 @@
-from typing import List, Type, TypeVar
+from typing import Dict, List, Type, TypeVar
 
 import yaml
 from dotenv import load_dotenv
@@ -7,10 +7,10 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # Load .env file
 load_dotenv()
-T = TypeVar("T", bound=BaseSettings)  # type: ignore
+T = TypeVar("T", bound=BaseSettings)
 
 
-def from_yaml(cls: Type[T], yaml_file: str) -> T:  # type: ignore
+def from_yaml(cls: Type[T], yaml_file: str) -> T:
     """Load settings from a YAML file and create an instance of the given class.
 
     Args:
@@ -22,10 +22,10 @@ def from_yaml(cls: Type[T], yaml_file: str) -> T:  # type: ignore
     """
     with open(yaml_file, "r") as file:
         config_data = yaml.safe_load(file)
-    return cls(**config_data)  # type: ignore
+    return cls(**config_data)
 
 
-class Secrets(BaseSettings):  # type: ignore
+class Secrets(BaseSettings):
     """settings class representing OpenAI API configuration."""
 
     openai_api_key: str = Field(..., validation_alias="OPENAI_API_KEY")
@@ -37,7 +37,7 @@ class Secrets(BaseSettings):  # type: ignore
     model_config = SettingsConfigDict(env_file="prod.env", env_file_encoding="utf-8")
 
 
-class AgentSettings(BaseSettings):  # type: ignore
+class AgentSettings(BaseSettings):
     """Configuration of coding agents"""
 
     planner_model: str
@@ -45,26 +45,146 @@ class AgentSettings(BaseSettings):  # type: ignore
     coder_model: str
     code_corrector_model: str
     linter_model: str
+    # history sent with every call of an agent: window, tokens or summarize
+    history_policy: str = "window"
+    # number of most recent turns kept by the window and summarize policies
+    history_window: int = 4
+    # token budget of the messages for the tokens policy
+    history_max_tokens: int = 6000
+    tokenizer: str = "cl100k_base"
 
 
-class EvalSettings(BaseSettings):  # type: ignore
+class EvalSettings(BaseSettings):
     """Configuration for LLM output tracking table table"""
 
     eval_columns: List[str]
     eval_dataset_location: str
+    # tasks of a benchmark run executed in parallel, 1 runs them one after another
+    num_workers: int = 1
+    # every task of a run edits and runs its code in its own directory below workdir
+    workdir: str = "data/benchmark_runs"
 
 
-class DocumentationSettings(BaseSettings):  # type: ignore
+class DocumentationSettings(BaseSettings):
     """Configuration for documentation generation"""
 
     chunk_size: int
     overlap: int
     top_k: int
     alpha: float
+    # structure-aware chunking sized in tokens instead of character windows
+    token_chunking: bool = False
+    chunk_tokens: int = 256
+    overlap_tokens: int = 32
+    tokenizer: str = "cl100k_base"
+    # batched upload of documentation chunks
+    batch_size: int = 100
+    concurrent_requests: int = 2
+    buffer_size: int = 5000
+    # concurrent scraping of several libraries and parallel reads of their datasets
+    max_concurrent_crawls: int = 4
+    dataset_page_size: int = 1000
+    max_parallel_pages: int = 4
+    # scraper backend, "apify" for the Apify actor or "local" for the in-process crawler
+    scraper_backend: str = "apify"
+    crawl_max_concurrency: int = 8
+    crawl_max_depth: int = 20
+    crawl_max_pages: int = 10000
+    # minimum seconds between two requests to the same host
+    crawl_host_delay: float = 0.5
+    crawl_timeout: float = 60
+    crawl_user_agent: str = "codinit-crawler"
+    respect_robots_txt: bool = True
+    # rescrape saved docs and only embed again the pages that changed
+    refresh_docs: bool = False
+    # cache of query results, an empty path keeps it in memory, a size of 0 disables it
+    query_cache_size: int = 1024
+    query_cache_ttl: float = 86400
+    query_cache_path: str = ""
+    # assembly of the retrieved chunks into the context of prompts
+    context_tokens: int = 2000
+    rerank: bool = True
+    mmr_lambda: float = 0.7
+
+
+class IngestionSettings(BaseSettings):
+    """Configuration for ingesting code repositories into the knowledge graph"""
+
+    batch_mode: bool = True
+    batch_size: int = 100
+    concurrent_requests: int = 2
+    buffer_size: int = 5000
+    # number of processes parsing files, 0 uses one process per cpu
+    num_workers: int = 0
+    # maximum number of parsed files waiting to be written to weaviate
+    queue_size: int = 64
+    # pull repositories and re-index only the files changed since the indexed commit
+    incremental_sync: bool = True
+    # directory of the symbol indexes of fully qualified names, one file per library
+    symbol_index_dir: str = ".cache/symbols"
+
+
+class EmbeddingSettings(BaseSettings):
+    """Configuration of embedding models and client-side vectorization"""
+
+    # supported embedding models per provider
+    openai: List[str] = []
+    huggingface: List[str] = []
+    # compute vectors in the client and pass them to weaviate instead of
+    # letting the weaviate vectorizer call the embedding API
+    client_side_vectors: bool = False
+    # openai, huggingface or sentence_transformers (local, always client-side)
+    provider: str = "openai"
+    model: str = "text-embedding-ada-002"
+    batch_size: int = 256
+    # torch threads of local models, 0 keeps the torch default
+    num_threads: int = 0
+    # SQLite file caching vectors by model and text hash, empty disables the cache
+    cache_path: str = ".cache/embeddings.sqlite"
+
+
+class RateLimitSettings(BaseSettings):
+    """Configuration of the scheduler sharing the LLM rate limits between calls"""
+
+    # default limits of a model, until the response headers report the actual ones
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 60000
+    # limits per model, e.g. {"gpt-4-1106-preview": {"tokens_per_minute": 150000}}
+    limits_per_model: Dict[str, Dict[str, int]] = {}
+    # retries of a rate limited request
+    max_retries: int = 5
+    # seconds to wait after a rate limited response without retry-after header
+    default_retry_after: float = 1.0
+    # completion tokens counted for a request without max_tokens until it is answered
+    expected_completion_tokens: int = 500
+
+
+class LLMCacheSettings(BaseSettings):
+    """Configuration of the cache of LLM responses, used to replay benchmark runs"""
+
+    # off, record (send requests and store the responses) or replay (never send requests)
+    mode: str = "off"
+    path: str = ".cache/llm_responses.sqlite"
+
+
+class WeaviateSettings(BaseSettings):
+    """Configuration of the shared weaviate connection"""
+
+    port: int = 5001
+    grpc_port: int = 50050
+    # seconds between health checks of the shared client, 0 checks on every use
+    health_check_interval: float = 30.0
+    # threads running the queries of a batch concurrently over the shared client
+    query_workers: int = 8
 
 
 secrets = Secrets()
 
-eval_settings = from_yaml(EvalSettings, "configs/eval.yaml")  # type: ignore
-agent_settings = from_yaml(AgentSettings, "configs/agents.yaml")  # type: ignore
-documentation_settings = from_yaml(DocumentationSettings, "configs/documentation.yaml")  # type: ignore
+eval_settings = from_yaml(EvalSettings, "configs/eval.yaml")
+agent_settings = from_yaml(AgentSettings, "configs/agents.yaml")
+documentation_settings = from_yaml(DocumentationSettings, "configs/documentation.yaml")
+ingestion_settings = from_yaml(IngestionSettings, "configs/ingestion.yaml")
+weaviate_settings = from_yaml(WeaviateSettings, "configs/weaviate.yaml")
+embedding_settings = from_yaml(EmbeddingSettings, "configs/embeddings.yaml")
+rate_limit_settings = from_yaml(RateLimitSettings, "configs/rate_limits.yaml")
+llm_cache_settings = from_yaml(LLMCacheSettings, "configs/llm_cache.yaml")
@@ -0,0 +1,126 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
+
+from codinit.documentation.chunk_documents import Encoding, get_encoding
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+Message = Dict[str, Any]
+HistoryPolicy = Literal["window", "tokens", "summarize"]
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def to_message_dict(message: Any) -> Message:
+    """Chat messages as plain dicts, e.g. the ChatCompletionMessage of a response."""
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
+
+
+def render_messages(messages: List[Message]) -> str:
+    """Plain text transcript of messages, the input of a summarizer."""
+    lines = []
+    for message in messages:
+        if message.get("content"):
+            lines.append(f"{message['role']}: {message['content']}")
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            lines.append(
+                f"{message['role']} called {function['name']}({function['arguments']})"
+            )
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """
+    Bounded history of the messages of an agent. Messages are grouped into turns,
+    each starting with a user message, so tool calls and tool results are always
+    kept or dropped together. The policy decides which turns are sent:
+    - window: the last `window` turns
+    - tokens: the most recent turns fitting into `max_tokens` tokens
+    - summarize: the last `window` turns, older turns are replaced by a summary
+    The system prompt and the current turn are always kept.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        policy: HistoryPolicy = "window",
+        window: int = 4,
+        max_tokens: int = 6000,
+        encoding: Union[str, Encoding] = "cl100k_base",
+        summarize: Optional[Callable[[List[Message]], str]] = None,
+    ) -> None:
+        if policy == "summarize" and summarize is None:
+            raise ValueError("The summarize history policy needs a summarize function")
+        self.system_message: Message = {"role": "system", "content": system_prompt}
+        self.policy = policy
+        self.window = max(window, 1)
+        self.max_tokens = max_tokens
+        self.encoding = encoding
+        self.summarize = summarize
+        self.turns: List[List[Message]] = []
+        self.summary = ""
+
+    def _get_encoding(self) -> Encoding:
+        # loaded on first use, only the tokens policy counts tokens
+        if isinstance(self.encoding, str):
+            self.encoding = get_encoding(self.encoding)
+        return self.encoding
+
+    def count_message_tokens(self, message: Message) -> int:
+        encoding = self._get_encoding()
+        # every message carries a few tokens of formatting
+        num_tokens = 4 + len(encoding.encode(message.get("content") or ""))
+        if message.get("tool_calls"):
+            num_tokens += len(encoding.encode(json.dumps(message["tool_calls"])))
+        return num_tokens
+
+    def count_tokens(self) -> int:
+        return sum(self.count_message_tokens(message) for message in self.messages)
+
+    @property
+    def messages(self) -> List[Message]:
+        """The messages to send, starting with the system prompt."""
+        messages = [self.system_message]
+        if self.summary:
+            messages.append(
+                {"role": "system", "content": SUMMARY_PREFIX + self.summary}
+            )
+        for turn in self.turns:
+            messages.extend(turn)
+        return messages
+
+    def add(self, message: Any) -> None:
+        message = to_message_dict(message)
+        if message["role"] == "user" or not self.turns:
+            self.turns.append([message])
+        else:
+            self.turns[-1].append(message)
+        self._apply_policy()
+
+    def _apply_policy(self) -> None:
+        if self.policy == "window":
+            del self.turns[: -self.window]
+        elif self.policy == "tokens":
+            while len(self.turns) > 1 and self.count_tokens() > self.max_tokens:
+                del self.turns[0]
+        elif self.policy == "summarize" and len(self.turns) > self.window:
+            dropped = [
+                message for turn in self.turns[: -self.window] for message in turn
+            ]
+            if self.summary:
+                dropped.insert(
+                    0, {"role": "system", "content": SUMMARY_PREFIX + self.summary}
+                )
+            self.summary = self.summarize(dropped)  # type: ignore
+            del self.turns[: -self.window]
+            logging.info(f"Summarized {len(dropped)} messages of the history")
+
+    def clear(self) -> None:
+        self.turns = []
+        self.summary = ""
@@ -1,11 +1,23 @@
+import asyncio
 import datetime
 import logging
-from typing import List
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from apify_client import ApifyClient
+from apify_client import ApifyClient, ApifyClientAsync
 from pydantic import HttpUrl, TypeAdapter, ValidationError
 
-from codinit.documentation.pydantic_models import RunInput, StartUrl, WebScrapingData
+from codinit.documentation.pydantic_models import (
+    CrawlManifest,
+    PageState,
+    RescrapeResult,
+    RunInput,
+    StartUrl,
+    WebScrapingData,
+    get_page_url,
+    web_scraping_data_adapter,
+)
+from codinit.weaviate_utils import compute_content_hash
 
 apify_client_logger = logging.getLogger("apify_client")
 apify_client_logger.setLevel(logging.DEBUG)
@@ -25,20 +37,69 @@ ch.setFormatter(formatter)
 apify_client_logger.addHandler(ch)
 
 
-class WebScraper:
+def get_start_urls(urls: List[HttpUrl]) -> List[StartUrl]:
+    # contruct start urls models from url list
+    startUrls = []
+    for url in urls:
+        try:
+            startUrls.append(StartUrl(url=url))
+        except ValidationError as e:
+            print(f"Invalid URL skipped: {url}. Reason: {e}")
+            continue
+    return startUrls
+
+
+def parse_items(items: List[Dict[str, Any]]) -> List[WebScrapingData]:
+    scraped_data_models: List[WebScrapingData] = []
+    for item in items:
+        # handle potential validation errors when parsing items
+        try:
+            scraped_data_models.append(web_scraping_data_adapter.validate_python(item))
+        except ValidationError as e:
+            print("Error parsing item to model:", e)
+    return scraped_data_models
+
+
+def compare_with_manifest(
+    pages: List[WebScrapingData], manifest: CrawlManifest
+) -> RescrapeResult:
+    """Splits freshly scraped pages into changed and unchanged ones by content hash."""
+    result = RescrapeResult()
+    for page in pages:
+        url = get_page_url(page.url)
+        content_hash = compute_content_hash(page.text)
+        previous = manifest.pages.get(url)
+        if previous is not None and previous.content_hash == content_hash:
+            result.unchanged.append(url)
+        else:
+            result.changed.append(page)
+        result.manifest.pages[url] = PageState(content_hash=content_hash)
+    result.removed = [url for url in manifest.pages if url not in result.manifest.pages]
+    return result
+
+
+class DocumentationScraper(ABC):
+    """Scrapes documentation pages starting from a list of urls."""
+
+    @abstractmethod
+    def scrape_urls(self, urls: List[str]) -> List[WebScrapingData]:
+        pass
+
+    def rescrape_urls(self, urls: List[str], manifest: CrawlManifest) -> RescrapeResult:
+        """
+        Scrapes the urls again and compares the pages with the manifest of the
+        previous crawl, backends supporting conditional requests override this.
+        """
+        return compare_with_manifest(self.scrape_urls(urls), manifest)
+
+
+class WebScraper(DocumentationScraper):
     def __init__(self, client: ApifyClient, actor_id: str = "aYG0l9s7dbB7j3gbS"):
         self.client = client
         self.actor_id = actor_id
 
     def run_scraping(self, urls: List[HttpUrl]) -> List[WebScrapingData]:
-        # contruct start urls models from url list
-        startUrls = []
-        for url in urls:
-            try:
-                startUrls.append(StartUrl(url=url))
-            except ValidationError as e:
-                print(f"Invalid URL skipped: {url}. Reason: {e}")
-                continue
+        startUrls = get_start_urls(urls)
         # construct crawling input object
         run_input = RunInput(
             startUrls=startUrls
@@ -48,18 +109,10 @@ class WebScraper:
         # call website content crawler from apify, which has id aYG0l9s7dbB7j3gbS
         run = self.client.actor(self.actor_id).call(run_input=run_input.model_dump())
 
-        # Initialize an empty list to store Pydantic models
-        scraped_data_models: List[WebScrapingData] = []
-
         # Fetch and parse Actor results from the run's dataset (if there are any)
-        for item in self.client.dataset(run["defaultDatasetId"]).iterate_items():
-            # handle potential validation errors when parsing items
-            try:
-                adapter = TypeAdapter(WebScrapingData)
-                model = adapter.validate_python(item)
-                scraped_data_models.append(model)
-            except ValidationError as e:
-                print("Error parsing item to model:", e)
+        scraped_data_models = parse_items(
+            list(self.client.dataset(run["defaultDatasetId"]).iterate_items())
+        )
         end = datetime.datetime.now()
         # Print the duration of the scraping process
         print(f"scraping duration={end-start}")
@@ -74,6 +127,80 @@ class WebScraper:
         return self.run_scraping(urls=parsed_urls)  # type: ignore
 
 
+class AsyncWebScraper:
+    """
+    Asyncio counterpart of WebScraper. Actor runs are awaited without blocking,
+    so crawls of several libraries run concurrently, and the dataset of a run is
+    read in pages of page_size items, up to max_parallel_pages at a time.
+    """
+
+    def __init__(
+        self,
+        client: ApifyClientAsync,
+        actor_id: str = "aYG0l9s7dbB7j3gbS",
+        page_size: int = 1000,
+        max_parallel_pages: int = 4,
+    ):
+        self.client = client
+        self.actor_id = actor_id
+        self.page_size = page_size
+        self.max_parallel_pages = max_parallel_pages
+
+    async def run_actor(self, urls: List[HttpUrl]) -> Optional[str]:
+        """Runs the crawler on the urls and returns the id of its dataset."""
+        startUrls = get_start_urls(urls)
+        if not startUrls:
+            return None
+        run_input = RunInput(startUrls=startUrls)
+        run = await self.client.actor(self.actor_id).call(
+            run_input=run_input.model_dump()
+        )
+        if run is None:
+            logging.error(f"Crawler run for {urls=} not found")
+            return None
+        return run["defaultDatasetId"]
+
+    async def iter_dataset_pages(
+        self, dataset_id: str
+    ) -> AsyncIterator[List[WebScrapingData]]:
+        """Yields the parsed pages of a dataset in the order they arrive."""
+        dataset = self.client.dataset(dataset_id)
+        first_page = await dataset.list_items(offset=0, limit=self.page_size)
+        yield parse_items(first_page.items)
+        semaphore = asyncio.Semaphore(self.max_parallel_pages)
+
+        async def fetch_page(offset: int) -> List[WebScrapingData]:
+            async with semaphore:
+                page = await dataset.list_items(offset=offset, limit=self.page_size)
+            return parse_items(page.items)
+
+        tasks = [
+            asyncio.ensure_future(fetch_page(offset))
+            for offset in range(self.page_size, first_page.total, self.page_size)
+        ]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                yield await next_page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def scrape_urls(
+        self, urls: List[str]
+    ) -> AsyncIterator[List[WebScrapingData]]:
+        ta = TypeAdapter(HttpUrl)
+        parsed_urls: List[HttpUrl] = [ta.validate_python(url) for url in urls]
+        start = datetime.datetime.now()
+        dataset_id = await self.run_actor(urls=parsed_urls)
+        logging.info(
+            f"Crawled {urls=} in {datetime.datetime.now() - start}, {dataset_id=}"
+        )
+        if dataset_id is None:
+            return
+        async for page in self.iter_dataset_pages(dataset_id):
+            yield page
+
+
 if __name__ == "__main__":
     from codinit.config import secrets
 
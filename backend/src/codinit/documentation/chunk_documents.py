@@ -1,5 +1,10 @@
 # import the necessary libraries
-from typing import List
+import io
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Protocol, Union
+
+import tiktoken
 
 # Create a function that chunks a given text document given as a string according to a chunk size
 # The chunks should overlap with an amount specified by an overlap parameter
@@ -38,6 +43,216 @@ def chunk_document(document: str, chunk_size: int, overlap: int = 0) -> List[str
     return chunks
 
 
+class Encoding(Protocol):
+    """Tokenizer interface of tiktoken encodings."""
+
+    def encode(self, text: str) -> List[int]:
+        ...
+
+    def decode(self, tokens: List[int]) -> str:
+        ...
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> Encoding:
+    return tiktoken.get_encoding(encoding_name)
+
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Splits markdown text into blocks that should not be cut: paragraphs,
+    fenced code blocks and headings together with the block directly below them.
+    """
+    block: List[str] = []
+    fence = None
+    for line in lines:
+        line = line.rstrip("\n")
+        if fence is not None:
+            # inside a code block, blank lines and headings do not end the block
+            block.append(line)
+            if line.strip().startswith(fence):
+                yield "\n".join(block)
+                block, fence = [], None
+            continue
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match or HEADING_PATTERN.match(line):
+            if block and not _is_heading_only(block):
+                yield "\n".join(block).rstrip()
+                block = []
+            block.append(line)
+            fence = fence_match.group(1) if fence_match else None
+        elif not line.strip():
+            if _is_heading_only(block):
+                # keep headings with the following block
+                if block[-1]:
+                    block.append("")
+            elif block:
+                yield "\n".join(block)
+                block = []
+        else:
+            block.append(line)
+    if block:
+        yield "\n".join(block).rstrip()
+
+
+def _is_heading_only(block: List[str]) -> bool:
+    return bool(block) and all(
+        HEADING_PATTERN.match(line) or not line.strip() for line in block
+    )
+
+
+def split_block(block: str, chunk_size: int, encoding: Encoding) -> Iterator[str]:
+    """
+    Splits a block larger than chunk_size tokens into fenced parts of whole lines for
+    code blocks and into sentences otherwise. Pieces that are still too large are cut
+    at token boundaries.
+    """
+    lines = block.split("\n")
+    if any(FENCE_PATTERN.match(line) for line in lines):
+        pieces: Iterable[str] = split_code_block(lines, chunk_size, encoding)
+    else:
+        pieces = SENTENCE_END_PATTERN.split(block)
+    for piece in pieces:
+        if not piece.strip():
+            # blank lines of code blocks carry no content on their own
+            continue
+        tokens = encoding.encode(piece)
+        if len(tokens) <= chunk_size:
+            yield piece
+            continue
+        for start in range(0, len(tokens), chunk_size):
+            yield encoding.decode(tokens[start : start + chunk_size])
+
+
+def split_code_block(
+    lines: List[str], chunk_size: int, encoding: Encoding
+) -> Iterator[str]:
+    """
+    Splits the lines of a fenced code block into parts of consecutive lines, each
+    closed with the fence and the next one reopened with it, so that every part is a
+    complete code block. Lines before the opening fence, e.g. a heading, stay in the
+    first part. Falls back to single lines if the fences alone exceed chunk_size.
+    """
+    start = next(i for i, line in enumerate(lines) if FENCE_PATTERN.match(line))
+    opening = lines[start]
+    fence_match = FENCE_PATTERN.match(opening)
+    assert fence_match is not None
+    is_closed = len(lines) > start + 1 and lines[-1].strip().startswith(
+        fence_match.group(1)
+    )
+    closing = lines[-1] if is_closed else fence_match.group(1)
+    body = lines[start + 1 : -1] if is_closed else lines[start + 1 :]
+
+    # each line counts one token for its newline
+    def count(line: str) -> int:
+        return len(encoding.encode(line)) + 1
+
+    fence_tokens = count(opening) + count(closing)
+    if fence_tokens >= chunk_size:
+        yield from lines
+        return
+    part = lines[: start + 1]
+    part_tokens = sum(count(line) for line in part)
+    num_body_lines = 0
+    for line in body:
+        line_tokens = count(line)
+        if num_body_lines and part_tokens + line_tokens + count(closing) > chunk_size:
+            yield "\n".join(part + [closing])
+            part, part_tokens, num_body_lines = [opening], count(opening), 0
+        part.append(line)
+        part_tokens += line_tokens
+        num_body_lines += 1
+    yield "\n".join(part + [closing] if is_closed else part)
+
+
+def iter_token_chunks(
+    document: Union[str, Iterable[str]],
+    chunk_size: int,
+    overlap: int = 0,
+    encoding: Union[str, Encoding] = "cl100k_base",
+) -> Iterator[str]:
+    """
+    Lazily chunks a markdown document into chunks of at most chunk_size tokens,
+    only splitting between headings, paragraphs and code blocks where possible.
+    Chunks overlap by the trailing blocks of the previous chunk that fit in overlap tokens.
+
+    Args:
+        document: The text document, or an iterable over its lines for large documents.
+        chunk_size: The maximum number of tokens of each chunk.
+        overlap: The maximum number of tokens repeated from the previous chunk.
+        encoding: The tokenizer, or the name of the tiktoken encoding.
+
+    Returns:
+        An iterator over the chunks.
+    """
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be positive.")
+    if overlap < 0 or overlap >= chunk_size:
+        raise ValueError("Overlap must be between 0 and chunk size - 1.")
+    if isinstance(encoding, str):
+        encoding = get_encoding(encoding)
+    lines = io.StringIO(document) if isinstance(document, str) else document
+
+    # blocks of the current chunk and their token counts
+    chunk: List[str] = []
+    chunk_tokens: List[int] = []
+    # number of leading blocks of the chunk repeated from the previous chunk
+    num_overlap = 0
+    for block in iter_blocks(lines):
+        num_tokens = len(encoding.encode(block))
+        pieces = (
+            [(block, num_tokens)]
+            if num_tokens <= chunk_size
+            else [
+                (piece, len(encoding.encode(piece)))
+                for piece in split_block(block, chunk_size, encoding)
+            ]
+        )
+        # prefer starting a new chunk at a heading once the chunk is half full
+        is_new_section = HEADING_PATTERN.match(block) is not None
+        if (
+            is_new_section
+            and len(chunk) > num_overlap
+            and sum(chunk_tokens) >= chunk_size // 2
+        ):
+            yield "\n\n".join(chunk)
+            chunk, chunk_tokens = _get_overlap(chunk, chunk_tokens, overlap)
+            num_overlap = len(chunk)
+        for piece, piece_tokens in pieces:
+            # each separator between blocks counts as one token
+            if chunk and sum(chunk_tokens) + len(chunk) + piece_tokens > chunk_size:
+                # a chunk of only the overlap would repeat the previous chunk
+                if len(chunk) > num_overlap:
+                    yield "\n\n".join(chunk)
+                    chunk, chunk_tokens = _get_overlap(chunk, chunk_tokens, overlap)
+                # drop the overlap if the piece would not fit next to it
+                if sum(chunk_tokens) + len(chunk) + piece_tokens > chunk_size:
+                    chunk, chunk_tokens = [], []
+                num_overlap = len(chunk)
+            chunk.append(piece)
+            chunk_tokens.append(piece_tokens)
+    if len(chunk) > num_overlap:
+        yield "\n\n".join(chunk)
+
+
+def _get_overlap(chunk: List[str], chunk_tokens: List[int], overlap: int):
+    """Trailing blocks of a chunk with at most overlap tokens in total."""
+    num_blocks, total = 0, 0
+    for num_tokens in reversed(chunk_tokens):
+        if total + num_tokens > overlap:
+            break
+        total += num_tokens
+        num_blocks += 1
+    if num_blocks == 0:
+        return [], []
+    return chunk[-num_blocks:], chunk_tokens[-num_blocks:]
+
+
 # test the function
 if __name__ == "__main__":
     document = """This is a test document. This document is used to test the chunk_document function.
@@ -0,0 +1,222 @@
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Union
+
+from pydantic import BaseModel
+
+from codinit.documentation.chunk_documents import Encoding, get_encoding
+
+WORD_PATTERN = re.compile(r"\w+")
+# shorter repeated blocks are more likely a coincidence than the chunk overlap
+MIN_OVERLAP_LENGTH = 16
+
+
+class RetrievedChunk(BaseModel):
+    """A documentation chunk returned by a search, or several merged adjacent chunks."""
+
+    source: str
+    chunknumber: int
+    content: str
+    score: float = 0.0
+    vector: Optional[List[float]] = None
+
+
+def count_tokens(text: str, encoding: Union[str, Encoding] = "cl100k_base") -> int:
+    if isinstance(encoding, str):
+        encoding = get_encoding(encoding)
+    return len(encoding.encode(text))
+
+
+def get_overlap_length(first: str, second: str) -> int:
+    """
+    Length of the longest suffix of first that is also a prefix of second,
+    computed in linear time with the prefix function of second + separator + first.
+    """
+    length = min(len(first), len(second))
+    if length == 0:
+        return 0
+    text = second[:length] + "\0" + first[-length:]
+    prefix = [0] * len(text)
+    for i in range(1, len(text)):
+        k = prefix[i - 1]
+        while k > 0 and text[i] != text[k]:
+            k = prefix[k - 1]
+        if text[i] == text[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1]
+
+
+def get_chunk_overlap_length(
+    first: str,
+    second: str,
+    separator: str = "\n\n",
+    overlap: int = 0,
+    min_overlap: int = MIN_OVERLAP_LENGTH,
+) -> int:
+    """
+    Length of the text the loader repeated from first at the start of second.
+    Chunks joined by a separator repeat whole blocks, so the match has to start
+    and end at block boundaries and be at least min_overlap characters long.
+    Character chunks joined without separator repeat exactly overlap characters.
+    Returns 0 if the chunks were loaded without overlap.
+    """
+    if overlap <= 0:
+        return 0
+    if not separator:
+        repeated = second[:overlap]
+        return overlap if len(repeated) == overlap and first.endswith(repeated) else 0
+    length = get_overlap_length(first, second)
+    if length < min_overlap:
+        return 0
+    starts_block = length == len(first) or first[:-length].endswith(separator)
+    ends_block = length == len(second) or second[length:].startswith(separator)
+    return length if starts_block and ends_block else 0
+
+
+def merge_adjacent_chunks(
+    chunks: Sequence[RetrievedChunk],
+    separator: str = "\n\n",
+    overlap: int = 0,
+    min_overlap: int = MIN_OVERLAP_LENGTH,
+) -> List[RetrievedChunk]:
+    """
+    Merges hits that are consecutive chunks of the same source into one passage,
+    removing the text the chunks overlap by if they were loaded with overlap.
+    A merged passage keeps the best score.
+    """
+    by_source: Dict[str, List[RetrievedChunk]] = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk.source, []).append(chunk)
+    merged: List[RetrievedChunk] = []
+    for source_chunks in by_source.values():
+        source_chunks = sorted(source_chunks, key=lambda chunk: chunk.chunknumber)
+        current = source_chunks[0].model_copy()
+        last_number = current.chunknumber
+        for chunk in source_chunks[1:]:
+            if chunk.chunknumber == last_number:
+                continue
+            if chunk.chunknumber == last_number + 1:
+                overlap_length = get_chunk_overlap_length(
+                    current.content, chunk.content, separator, overlap, min_overlap
+                )
+                current.content += (
+                    chunk.content[overlap_length:]
+                    if overlap_length
+                    else separator + chunk.content
+                )
+                current.score = max(current.score, chunk.score)
+                # the vector of the merged passage is the one of its best chunk
+                if chunk.score >= current.score:
+                    current.vector = chunk.vector or current.vector
+            else:
+                merged.append(current)
+                current = chunk.model_copy()
+            last_number = chunk.chunknumber
+        merged.append(current)
+    return sorted(merged, key=lambda chunk: chunk.score, reverse=True)
+
+
+def _cosine_similarity(first: Sequence[float], second: Sequence[float]) -> float:
+    dot = sum(a * b for a, b in zip(first, second))
+    norm = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+    return dot / norm if norm else 0.0
+
+
+def _jaccard_similarity(first: str, second: str) -> float:
+    first_words = set(WORD_PATTERN.findall(first.lower()))
+    second_words = set(WORD_PATTERN.findall(second.lower()))
+    if not first_words or not second_words:
+        return 0.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+
+def chunk_similarity(first: RetrievedChunk, second: RetrievedChunk) -> float:
+    """Cosine similarity of the chunk vectors, word overlap without vectors."""
+    if first.vector and second.vector:
+        return _cosine_similarity(first.vector, second.vector)
+    return _jaccard_similarity(first.content, second.content)
+
+
+def mmr_rerank(
+    chunks: Sequence[RetrievedChunk], lambda_mult: float = 0.7
+) -> List[RetrievedChunk]:
+    """
+    Orders chunks by maximal marginal relevance: each next chunk maximizes
+    lambda_mult * relevance - (1 - lambda_mult) * similarity to the chunks before it,
+    so near-duplicate passages move to the end. Relevance is the min-max normalized
+    search score.
+    """
+    if not chunks:
+        return []
+    scores = [chunk.score for chunk in chunks]
+    low, high = min(scores), max(scores)
+    relevance = [
+        (score - low) / (high - low) if high > low else 1.0 for score in scores
+    ]
+    remaining = list(range(len(chunks)))
+    max_similarity = [0.0] * len(chunks)
+    ranked: List[RetrievedChunk] = []
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: lambda_mult * relevance[i]
+            - (1 - lambda_mult) * max_similarity[i],
+        )
+        remaining.remove(best)
+        ranked.append(chunks[best])
+        for i in remaining:
+            max_similarity[i] = max(
+                max_similarity[i], chunk_similarity(chunks[i], chunks[best])
+            )
+    return ranked
+
+
+def format_chunk(chunk: RetrievedChunk) -> str:
+    return f"Source: {chunk.source}\n{chunk.content}"
+
+
+def pack_chunks(
+    chunks: Sequence[RetrievedChunk],
+    max_tokens: int,
+    encoding: Union[str, Encoding] = "cl100k_base",
+    separator: str = "\n\n",
+) -> str:
+    """
+    Joins the formatted chunks in order, skipping the chunks that do not fit in
+    the remaining token budget.
+    """
+    if isinstance(encoding, str):
+        encoding = get_encoding(encoding)
+    separator_tokens = len(encoding.encode(separator))
+    texts: List[str] = []
+    num_tokens = 0
+    for chunk in chunks:
+        text = format_chunk(chunk)
+        text_tokens = len(encoding.encode(text)) + (separator_tokens if texts else 0)
+        if num_tokens + text_tokens > max_tokens:
+            continue
+        texts.append(text)
+        num_tokens += text_tokens
+    return separator.join(texts)
+
+
+def assemble_context(
+    chunks: Sequence[RetrievedChunk],
+    max_tokens: int,
+    encoding: Union[str, Encoding] = "cl100k_base",
+    lambda_mult: float = 0.7,
+    rerank: bool = True,
+    chunk_separator: str = "\n\n",
+    chunk_overlap: int = 0,
+) -> str:
+    """
+    Builds the documentation context of a prompt from search hits: adjacent chunks
+    are merged, passages are reranked with MMR and packed into max_tokens tokens.
+    """
+    passages = merge_adjacent_chunks(
+        chunks, separator=chunk_separator, overlap=chunk_overlap
+    )
+    if rerank:
+        passages = mmr_rerank(passages, lambda_mult=lambda_mult)
+    return pack_chunks(passages, max_tokens=max_tokens, encoding=encoding)
@@ -1,131 +1,255 @@
+import logging
+import threading
+
 import weaviate
 import weaviate.classes.config as wvcc
+from weaviate.classes.query import Filter, Metrics, QueryReference
+
+from codinit.embeddings import get_vectorizer_config
+from codinit.weaviate_utils import (
+    compute_content_hash,
+    get_collection_properties,
+    get_collection_references,
+)
+
+# added after the first release, existing collections get it in add_documentation_schema_properties
+chunk_content_hash_property = wvcc.Property(
+    name="content_hash",
+    data_type=wvcc.DataType.TEXT,
+    description="SHA-256 hash of the chunk content",
+    skip_vectorization=True,
+    tokenization=wvcc.Tokenization.FIELD,
+)
 
-from codinit.weaviate_utils import get_collection_references
+# name of the library of a chunk, denormalized from the fromLibrary reference
+# so that queries can be scoped to a library with an indexed property filter
+chunk_library_property = wvcc.Property(
+    name="library",
+    data_type=wvcc.DataType.TEXT,
+    description="Name of the library the documentation belongs to",
+    skip_vectorization=True,
+    tokenization=wvcc.Tokenization.FIELD,
+    index_filterable=True,
+)
 
 
 def create_library_schema(client: weaviate.WeaviateClient):
     client.connect()
-    try:
-        # Create the Library collection
-        library_collection = client.collections.create(
-            name="Library",
-            vectorizer_config=wvcc.Configure.Vectorizer.text2vec_openai(
-                model="ada", model_version="002"
-            ),
-            properties=[
-                wvcc.Property(name="name", data_type=wvcc.DataType.TEXT),
-                wvcc.Property(name="links", data_type=wvcc.DataType.TEXT_ARRAY),
-                wvcc.Property(name="description", data_type=wvcc.DataType.TEXT),
-            ],
-        )
-    finally:
-        client.close()
+    # Create the Library collection
+    library_collection = client.collections.create(
+        name="Library",
+        vectorizer_config=get_vectorizer_config(),
+        properties=[
+            wvcc.Property(name="name", data_type=wvcc.DataType.TEXT),
+            wvcc.Property(name="links", data_type=wvcc.DataType.TEXT_ARRAY),
+            wvcc.Property(name="description", data_type=wvcc.DataType.TEXT),
+        ],
+    )
     return library_collection
 
 
 def create_documentation_schema(client: weaviate.WeaviateClient):
     client.connect()
-    try:
-        # Create the DocumentationFile collection
-        documentation_file_collection = client.collections.create(
-            name="DocumentationFile",
-            vectorizer_config=wvcc.Configure.Vectorizer.text2vec_openai(
-                model="ada", model_version="002"
+    # Create the DocumentationFile collection
+    documentation_file_collection = client.collections.create(
+        name="DocumentationFile",
+        vectorizer_config=get_vectorizer_config(),
+        properties=[
+            wvcc.Property(
+                name="title",
+                data_type=wvcc.DataType.TEXT,
+                description="title of the document",
             ),
-            properties=[
-                wvcc.Property(
-                    name="title",
-                    data_type=wvcc.DataType.TEXT,
-                    description="title of the document",
-                ),
-                wvcc.Property(
-                    name="description",
-                    data_type=wvcc.DataType.TEXT,
-                    description="Description of the content of the documentation file",
-                ),
-                wvcc.Property(
-                    name="chunknumber",
-                    data_type=wvcc.DataType.INT,
-                    description="Order of the chunk in the original documentation file",
-                ),
-                wvcc.Property(
-                    name="source",
-                    data_type=wvcc.DataType.TEXT,
-                    description="URL source of the documentation file",
-                ),
-                wvcc.Property(
-                    name="language",
-                    data_type=wvcc.DataType.TEXT,
-                    description="Language of the documentation file",
-                ),
-                wvcc.Property(
-                    name="content",
-                    data_type=wvcc.DataType.TEXT,
-                    description="Content of the documentation file",
-                ),
-            ],
-        )
-    finally:
-        client.close()
+            wvcc.Property(
+                name="description",
+                data_type=wvcc.DataType.TEXT,
+                description="Description of the content of the documentation file",
+            ),
+            wvcc.Property(
+                name="chunknumber",
+                data_type=wvcc.DataType.INT,
+                description="Order of the chunk in the original documentation file",
+            ),
+            wvcc.Property(
+                name="source",
+                data_type=wvcc.DataType.TEXT,
+                description="URL source of the documentation file",
+            ),
+            wvcc.Property(
+                name="language",
+                data_type=wvcc.DataType.TEXT,
+                description="Language of the documentation file",
+            ),
+            wvcc.Property(
+                name="content",
+                data_type=wvcc.DataType.TEXT,
+                description="Content of the documentation file",
+            ),
+            chunk_content_hash_property,
+            chunk_library_property,
+        ],
+    )
     return documentation_file_collection
 
 
 def create_doc_library_schema(client: weaviate.WeaviateClient):
     client.connect()
-    try:
-        collections = client.collections.list_all()
-        collection_names = set(collections.keys())
+    collections = client.collections.list_all()
+    collection_names = set(collections.keys())
 
-        if "Library" not in collection_names:
-            create_library_schema(client)
-        if "DocumentationFile" not in collection_names:
-            create_documentation_schema(client)
-    finally:
-        client.close()
+    if "Library" not in collection_names:
+        create_library_schema(client)
+    if "DocumentationFile" not in collection_names:
+        create_documentation_schema(client)
 
 
 # Create the schema
 def add_documentation_schema_references(client: weaviate.WeaviateClient):
     client.connect()
+    library_collection = client.collections.get("Library")
+    library_references = get_collection_references(collection=library_collection)
+    if "hasDocumentationFile" not in library_references:
+        library_collection.config.add_reference(
+            ref=wvcc.ReferenceProperty(
+                name="hasDocumentationFile",
+                target_collection="DocumentationFile",
+                description="Documentation of the library",
+            )
+        )
 
-    try:
-        library_collection = client.collections.get("Library")
-        library_references = get_collection_references(collection=library_collection)
-        if "hasDocumentationFile" not in library_references:
-            library_collection.config.add_reference(
-                ref=wvcc.ReferenceProperty(
-                    name="hasDocumentationFile",
-                    target_collection="DocumentationFile",
-                    description="Documentation of the library",
-                )
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    documentation_file_references = get_collection_references(
+        collection=documentation_file_collection
+    )
+    if "fromLibrary" not in documentation_file_references:
+        documentation_file_collection.config.add_reference(
+            ref=wvcc.ReferenceProperty(
+                name="fromLibrary",
+                target_collection="Library",
+                description="The library the documentation belongs to",
             )
+        )
+    return library_collection, documentation_file_collection
 
-        documentation_file_collection = client.collections.get("DocumentationFile")
-        documentation_file_references = get_collection_references(
-            collection=documentation_file_collection
+
+def add_documentation_schema_properties(client: weaviate.WeaviateClient):
+    """Adds properties that were introduced later to already existing collections."""
+    client.connect()
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    properties = get_collection_properties(collection=documentation_file_collection)
+    if chunk_content_hash_property.name not in properties:
+        documentation_file_collection.config.add_property(chunk_content_hash_property)
+    if count_chunks_without_content_hash(client):
+        backfill_documentation_content_hash(client)
+    if chunk_library_property.name not in properties:
+        documentation_file_collection.config.add_property(chunk_library_property)
+    # also covers chunks whose backfill was interrupted or that were loaded
+    # by an older version after the property had been added
+    if count_chunks_without_library(client):
+        backfill_documentation_library(client)
+
+
+def count_chunks_without_content_hash(client: weaviate.WeaviateClient) -> int:
+    """Number of documentation chunks with a content but without its hash."""
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    result = documentation_file_collection.aggregate.over_all(
+        return_metrics=[
+            Metrics("content").text(count=True),
+            Metrics("content_hash").text(count=True),
+        ]
+    )
+    num_with_content = result.properties["content"].count or 0
+    return max(num_with_content - (result.properties["content_hash"].count or 0), 0)
+
+
+def count_chunks_without_library(client: weaviate.WeaviateClient) -> int:
+    """Number of documentation chunks with a fromLibrary reference but without library."""
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    result = documentation_file_collection.aggregate.over_all(
+        filters=Filter.by_ref_count("fromLibrary").greater_or_equal(1),
+        total_count=True,
+        return_metrics=Metrics("library").text(count=True),
+    )
+    num_with_library = result.properties["library"].count or 0
+    return (result.total_count or 0) - num_with_library
+
+
+_schema_migrated = False
+_schema_migration_lock = threading.Lock()
+
+
+def migrate_documentation_schema(client: weaviate.WeaviateClient) -> None:
+    """
+    Runs add_documentation_schema_properties once per process, documentation
+    clients initialize the schema on every construction.
+    """
+    global _schema_migrated
+    with _schema_migration_lock:
+        if not _schema_migrated:
+            add_documentation_schema_properties(client)
+            _schema_migrated = True
+
+
+def backfill_documentation_content_hash(client: weaviate.WeaviateClient) -> int:
+    """
+    Sets the content hash of chunks loaded before it existed, so that loads can be
+    deduplicated without reading the content of the chunks.
+    Returns the number of updated chunks.
+    """
+    client.connect()
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    num_updated = 0
+    for doc in documentation_file_collection.iterator(
+        return_properties=["content_hash", "content"]
+    ):
+        # empty contents are hashed too, so that no chunk is counted as fixable forever
+        if doc.properties.get("content_hash") or doc.properties.get("content") is None:
+            continue
+        documentation_file_collection.data.update(
+            uuid=doc.uuid,
+            properties={
+                "content_hash": compute_content_hash(str(doc.properties["content"]))
+            },
         )
-        if "fromLibrary" not in documentation_file_references:
-            documentation_file_collection.config.add_reference(
-                ref=wvcc.ReferenceProperty(
-                    name="fromLibrary",
-                    target_collection="Library",
-                    description="The library the documentation belongs to",
-                )
+        num_updated += 1
+    logging.info(f"Backfilled the content hash of {num_updated} documentation chunks")
+    return num_updated
+
+
+def backfill_documentation_library(client: weaviate.WeaviateClient) -> int:
+    """
+    Sets the library property of chunks loaded before it existed from their
+    fromLibrary reference. Returns the number of updated chunks.
+    """
+    client.connect()
+    documentation_file_collection = client.collections.get("DocumentationFile")
+    num_updated = 0
+    for doc in documentation_file_collection.iterator(
+        return_properties=["library"],
+        return_references=QueryReference(
+            link_on="fromLibrary", return_properties=["name"]
+        ),
+    ):
+        if doc.properties.get("library"):
+            continue
+        if not doc.references or "fromLibrary" not in doc.references:
+            continue
+        libraries = doc.references["fromLibrary"].objects
+        if libraries:
+            documentation_file_collection.data.update(
+                uuid=doc.uuid, properties={"library": libraries[0].properties["name"]}
             )
-    finally:
-        client.close()
-    return library_collection, documentation_file_collection
+            num_updated += 1
+    logging.info(f"Backfilled the library of {num_updated} documentation chunks")
+    return num_updated
 
 
 def init_library_schema_weaviate(client: weaviate.WeaviateClient):
     client.connect()
-
-    try:
-        create_doc_library_schema(client)
-        add_documentation_schema_references(client)
-    finally:
-        client.close()
+    create_doc_library_schema(client)
+    # the migration filters on fromLibrary, which fresh collections only get here
+    add_documentation_schema_references(client)
+    migrate_documentation_schema(client)
 
 
 # Create the schema
@@ -1,7 +1,9 @@
+import itertools
 import logging
 import os
 import re
-from typing import List, Optional
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
 
 import weaviate
 import weaviate.classes as wvc
@@ -14,16 +16,34 @@ from codinit.config import (
     documentation_settings,
     secrets,
 )
-from codinit.documentation.chunk_documents import chunk_document
+from codinit.documentation.chunk_documents import chunk_document, iter_token_chunks
+from codinit.documentation.context_assembly import RetrievedChunk, assemble_context
 from codinit.documentation.doc_schema import init_library_schema_weaviate
-from codinit.documentation.pydantic_models import Library, WebScrapingData
-from codinit.documentation.save_document import load_scraped_data_from_json
+from codinit.documentation.pydantic_models import (
+    Library,
+    RescrapeResult,
+    WebScrapingData,
+    get_page_url,
+)
+from codinit.documentation.query_cache import get_query_cache
+from codinit.documentation.save_document import (
+    iter_scraped_data,
+    load_scraped_data_from_json,
+)
+from codinit.embeddings import get_embedder, get_object_text
+from codinit.weaviate_batch import WeaviateBatchWriter
 from codinit.weaviate_client import get_weaviate_client
+from codinit.weaviate_utils import compute_content_hash, get_object_uuid
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# number of chunks per page when reading or deleting the chunks of a library
+CHUNK_PAGE_SIZE = 1000
+# number of sources per filter when deleting the chunks of pages
+SOURCES_PER_DELETE = 100
+
 
 # TODO: here is an issue: now the weaviate client operations is entangled with the library operations
 # for example, initializing the schema is not related to a single library.
@@ -37,6 +57,7 @@ class BaseWeaviateDocClient:
     def __init__(self, library: Library, client: weaviate.WeaviateClient) -> None:
         self.library = library
         self.client = client
+        self.query_cache = get_query_cache()
         self.init_schema()
 
     def check_library_exists(self):
@@ -47,7 +68,6 @@ class BaseWeaviateDocClient:
             filters=wvc.query.Filter.by_property("name").equal(self.library.libname),
             limit=1,
         )
-        self.client.close()
         print(f"{query_library_result=}")
         if len(query_library_result.objects) == 0:
             return False
@@ -63,7 +83,6 @@ class BaseWeaviateDocClient:
             filters=wvc.query.Filter.by_property("name").equal(self.library.libname),
             limit=1,
         )
-        self.client.close()
         print(result)
         # get the id of a library from weaviate
         if len(result.objects) > 0:  # case where library exists at least once
@@ -90,7 +109,6 @@ class BaseWeaviateDocClient:
                 ),
             ],
         )
-        self.client.close()
         logging.debug(
             f"Querying documentation for library with ID {lib_id} gives {result=}"
         )
@@ -122,72 +140,73 @@ class BaseWeaviateDocClient:
                 logging.error(f"Error getting library with ID {lib_id} from weaviate.")
         return num_docs
 
+    def embed_object(
+        self, collection: str, properties: Dict[str, Any]
+    ) -> Optional[List[float]]:
+        """Client-side vector of an object, None to let weaviate vectorize it."""
+        embedder = get_embedder()
+        if embedder is None:
+            return None
+        return embedder.embed_query(get_object_text(collection, properties))
+
     # TODO create test for this class
     def init_schema(self):
         init_library_schema_weaviate(client=self.client)
 
     def delete_related_documents(self):
         self.client.connect()
-        try:
-            documentation = client.collections.get("DocumentationFile")
-
-            # Construct a filter to find all documents linked to the specific library
-            filter_criteria = (
-                Filter.by_ref(link_on="fromLibrary")
-                .by_property("name")
-                .equal(self.library.libname)
-            )
+        documentation = self.client.collections.get("DocumentationFile")
 
-            # Query to fetch all DocumentationFiles related to the specific Library ID
-            response = documentation.query.fetch_objects(
-                filters=filter_criteria,
-                return_references=QueryReference(
-                    link_on="fromLibrary", return_properties=["name"]
-                ),
-                limit=10000,  # Adjust the limit based on expected maximum or paginate queries
-            )
-            logging.info(f"deleting all documents from library {self.library.libname}")
-            # Delete each DocumentationFile found
-            for doc in response.objects:
-                documentation.data.delete_by_id(doc.uuid)
-                doc_query_response = documentation.query.fetch_object_by_id(doc.uuid)
-                if doc_query_response is None:
-                    logging.info(f"Document {doc.uuid} successfully deleted.")
-                else:
-                    logging.info(f"Document {doc.uuid} still exists.")
-        finally:
-            client.close()
+        # Construct a filter to find all documents linked to the specific library
+        filter_criteria = (
+            Filter.by_ref(link_on="fromLibrary")
+            .by_property("name")
+            .equal(self.library.libname)
+        )
+
+        # Query to fetch all DocumentationFiles related to the specific Library ID
+        response = documentation.query.fetch_objects(
+            filters=filter_criteria,
+            return_references=QueryReference(
+                link_on="fromLibrary", return_properties=["name"]
+            ),
+            limit=10000,  # Adjust the limit based on expected maximum or paginate queries
+        )
+        logging.info(f"deleting all documents from library {self.library.libname}")
+        # Delete each DocumentationFile found
+        for doc in response.objects:
+            documentation.data.delete_by_id(doc.uuid)
+            doc_query_response = documentation.query.fetch_object_by_id(doc.uuid)
+            if doc_query_response is None:
+                logging.info(f"Document {doc.uuid} successfully deleted.")
+            else:
+                logging.info(f"Document {doc.uuid} still exists.")
+        self.query_cache.bump_version(self.library.libname)
 
     def delete_library(self):
         self.client.connect()
-        try:
-            library_collection = self.client.collections.get("Library")
+        library_collection = self.client.collections.get("Library")
 
-            # Query to fetch the library by name
-            library = library_collection.query.fetch_objects(
-                filters=Filter.by_property("name").equal(self.library.libname),
-                limit=1,  # Assuming library names are unique
-            )
-            logging.info(f"Deleting library {self.library.libname}")
-            if library.objects:
-                library_id = library.objects[0].uuid
-                # Delete the library by its ID
-                library_collection.data.delete_by_id(library_id)
-
-                # Verify the deletion
-                lib_query_response = library_collection.query.fetch_object_by_id(
-                    library_id
-                )
-                if lib_query_response is None:
-                    logging.info(
-                        f"Library {self.library.libname} successfully deleted."
-                    )
-                else:
-                    logging.info(f"Library {self.library.libname} still exists.")
+        # Query to fetch the library by name
+        library = library_collection.query.fetch_objects(
+            filters=Filter.by_property("name").equal(self.library.libname),
+            limit=1,  # Assuming library names are unique
+        )
+        logging.info(f"Deleting library {self.library.libname}")
+        if library.objects:
+            library_id = library.objects[0].uuid
+            # Delete the library by its ID
+            library_collection.data.delete_by_id(library_id)
+
+            # Verify the deletion
+            lib_query_response = library_collection.query.fetch_object_by_id(library_id)
+            if lib_query_response is None:
+                logging.info(f"Library {self.library.libname} successfully deleted.")
             else:
-                logging.info(f"No library found with the name {self.library.libname}.")
-        finally:
-            self.client.close()
+                logging.info(f"Library {self.library.libname} still exists.")
+            self.query_cache.bump_version(self.library.libname)
+        else:
+            logging.info(f"No library found with the name {self.library.libname}.")
 
     def delete_library_and_documents(self):
         # First, delete all related documentation files
@@ -219,25 +238,34 @@ class WeaviateDocLoader(BaseWeaviateDocClient):
     def load_json(self, filename: str) -> List[WebScrapingData]:
         return load_scraped_data_from_json(filename=filename)
 
-    def get_raw_documentation(self) -> List[WebScrapingData]:
+    def get_raw_documentation(self) -> Iterator[WebScrapingData]:
         """
-        get the raw documentation from json file
+        lazily get the raw documentation from the JSON Lines file,
+        or from the json file of docs scraped by older versions
         """
-        data = []
         docs_dir = self.secrets.docs_dir
-        filename = docs_dir + "/" + self.library.libname + ".json"
         # TODO check if all urls are present in the json file
-        if os.path.exists(filename):
-            logging.info(
-                f"Loading scraped Documentation for library {self.library.libname} from {filename=}"
+        for filename in [
+            docs_dir + "/" + self.library.libname + ".jsonl",
+            docs_dir + "/" + self.library.libname + ".json",
+        ]:
+            if os.path.exists(filename):
+                logging.info(
+                    f"Loading scraped Documentation for library {self.library.libname} from {filename=}"
+                )
+                return iter_scraped_data(filename=filename)
+        logging.error(f"{filename=} does not exist.")
+        return iter([])
+
+    def chunk_doc(self, doc: WebScrapingData) -> Iterable[str]:
+        if self.documentation_settings.token_chunking:
+            # lazily split at headings, paragraphs and code blocks, sized in tokens
+            return iter_token_chunks(
+                document=doc.text,
+                chunk_size=self.documentation_settings.chunk_tokens,
+                overlap=self.documentation_settings.overlap_tokens,
+                encoding=self.documentation_settings.tokenizer,
             )
-            # load data using load_scraped_data_from_json function from codinit.documentation.save_document
-            data = self.load_json(filename=filename)
-        else:
-            logging.error(f"{filename=} does not exist.")
-        return data
-
-    def chunk_doc(self, doc: WebScrapingData) -> List[str]:
         # chunk document using chunk_document function from codinit.chunk_documents.py
         chunks = chunk_document(
             document=doc.text,
@@ -251,8 +279,10 @@ class WeaviateDocLoader(BaseWeaviateDocClient):
         self.client.connect()
         documentation_collection = self.client.collections.get("DocumentationFile")
         library_collection = self.client.collections.get("Library")
-        doc_id = documentation_collection.data.insert(properties=doc_obj)
-        # TODO create hash of an object and query against object hash in library. If not found then save object.
+        doc_obj = {"library": self.library.libname, **doc_obj}
+        doc_id = documentation_collection.data.insert(
+            properties=doc_obj, vector=self.embed_object("DocumentationFile", doc_obj)
+        )
 
         # DocumentationFile -> Library relationship
         documentation_collection.data.reference_add(
@@ -270,7 +300,6 @@ class WeaviateDocLoader(BaseWeaviateDocClient):
         logging.info(
             f"Saved document with DOC_ID {doc_id=} to library with LIB_ID {lib_id=}"
         )
-        self.client.close()
         return doc_id
 
     # save library to weaviate
@@ -285,8 +314,9 @@ class WeaviateDocLoader(BaseWeaviateDocClient):
         }
         library_collection = self.client.collections.get("Library")
         # save library object to weaviate
-        lib_id = library_collection.data.insert(properties=lib_obj)
-        self.client.close()
+        lib_id = library_collection.data.insert(
+            properties=lib_obj, vector=self.embed_object("Library", lib_obj)
+        )
         logging.info(
             f"Saved library object {lib_id=} to weaviate,library has LIB_ID {lib_id=}"
         )
@@ -314,51 +344,250 @@ class WeaviateDocLoader(BaseWeaviateDocClient):
         doc_id = self.save_doc_to_weaviate(doc_obj=doc_obj, lib_id=lib_id)
         return doc_id
 
+    def iter_library_chunk_hashes(self) -> Iterator[str]:
+        """
+        Iterates over the content hashes of the chunks of the library. The cursor API
+        does not support filters, so the chunks are read in pages filtered on the
+        library and ordered by their hash, each page starting after the last hash.
+        """
+        self.client.connect()
+        documentation_collection = self.client.collections.get("DocumentationFile")
+        library_filter = Filter.by_property("library").equal(self.library.libname)
+        last_hash = None
+        while True:
+            filters = library_filter
+            if last_hash is not None:
+                filters = filters & Filter.by_property("content_hash").greater_than(
+                    last_hash
+                )
+            result = documentation_collection.query.fetch_objects(
+                filters=filters,
+                sort=wvc.query.Sort.by_property("content_hash"),
+                return_properties=["content_hash"],
+                limit=CHUNK_PAGE_SIZE,
+            )
+            for doc in result.objects:
+                if doc.properties.get("content_hash"):
+                    last_hash = doc.properties["content_hash"]
+                    yield last_hash
+            if len(result.objects) < CHUNK_PAGE_SIZE or last_hash is None:
+                return
+
+    def get_existing_chunk_hashes(self) -> Set[str]:
+        """
+        Returns the content hashes of all chunks of the library already in weaviate.
+        """
+        return set(self.iter_library_chunk_hashes())
+
+    def delete_chunks_by_source(self, sources: Iterable[str]) -> int:
+        """Deletes the chunks of the library scraped from the given urls."""
+        sources = sorted(set(sources))
+        if not sources:
+            return 0
+        self.client.connect()
+        documentation_collection = self.client.collections.get("DocumentationFile")
+        library_filter = Filter.by_property("library").equal(self.library.libname)
+        num_deleted = 0
+        for start in range(0, len(sources), SOURCES_PER_DELETE):
+            batch_sources = set(sources[start : start + SOURCES_PER_DELETE])
+            filters = library_filter & Filter.by_property("source").contains_any(
+                list(batch_sources)
+            )
+            offset = 0
+            while True:
+                result = documentation_collection.query.fetch_objects(
+                    filters=filters,
+                    return_properties=["source"],
+                    limit=CHUNK_PAGE_SIZE,
+                    offset=offset,
+                )
+                # source is word tokenized, the filter can match similar urls too
+                chunk_ids = [
+                    doc.uuid
+                    for doc in result.objects
+                    if doc.properties["source"] in batch_sources
+                ]
+                if chunk_ids:
+                    documentation_collection.data.delete_many(
+                        where=Filter.by_id().contains_any(chunk_ids)
+                    )
+                    num_deleted += len(chunk_ids)
+                if len(result.objects) < CHUNK_PAGE_SIZE:
+                    break
+                # the deleted chunks are gone, the kept ones shift the next page
+                offset += len(result.objects) - len(chunk_ids)
+        if num_deleted:
+            self.query_cache.bump_version(self.library.libname)
+        logging.info(
+            f"Deleted {num_deleted} chunks of {len(sources)} pages "
+            f"of library {self.library.libname}"
+        )
+        return num_deleted
+
+    def get_chunk_uuid(self, doc_obj: Dict[str, Any]) -> str:
+        """Deterministic UUID of a chunk from its source, chunk number and content."""
+        return get_object_uuid(
+            "DocumentationFile",
+            doc_obj["source"],
+            doc_obj["chunknumber"],
+            doc_obj.get("content_hash") or compute_content_hash(doc_obj["content"]),
+        )
+
+    def add_doc_to_batch(
+        self, doc_obj: Dict[str, Any], lib_id: str, batch_writer: WeaviateBatchWriter
+    ) -> str:
+        """Queues a chunk and its references to the library in the batch writer."""
+        doc_id = batch_writer.add_object(
+            collection="DocumentationFile",
+            properties=doc_obj,
+            uuid=self.get_chunk_uuid(doc_obj=doc_obj),
+        )
+        # DocumentationFile -> Library relationship
+        batch_writer.add_reference(
+            from_collection="DocumentationFile",
+            from_uuid=doc_id,
+            from_property="fromLibrary",
+            to=lib_id,
+        )
+        # Library -> DocumentationFile relationship
+        batch_writer.add_reference(
+            from_collection="Library",
+            from_uuid=lib_id,
+            from_property="hasDocumentationFile",
+            to=doc_id,
+        )
+        return doc_id
+
     # embed documentation to weaviate
-    def embed_documentation(self, data: List[WebScrapingData], lib_id: str):
-        """Chunk documents and load them to weaviate.
+    def embed_documentation(
+        self,
+        data: Iterable[WebScrapingData],
+        lib_id: str,
+        existing_hashes: Optional[Set[str]] = None,
+    ):
+        """Chunk documents and load them to weaviate through the batch API.
+        Chunks whose content is already in the library, or repeats within the
+        documentation (e.g. navigation bars and footers), are skipped.
 
         Args:
-            data (List[WebScrapingData]): list of WebScrapingData objects
+            data (Iterable[WebScrapingData]): WebScrapingData objects, can be a stream
+            existing_hashes (Set[str]): content hashes of the chunks already loaded
         """
+        seen_hashes = set(existing_hashes or set())
+        num_skipped = 0
+        batch_writer = WeaviateBatchWriter(
+            client=self.client,
+            batch_size=self.documentation_settings.batch_size,
+            concurrent_requests=self.documentation_settings.concurrent_requests,
+            buffer_size=self.documentation_settings.buffer_size,
+            embedder=get_embedder(),
+        )
+        start = time.perf_counter()
+        num_chunks = 0
+        num_docs = 0
         # iterate over data
-        for doc in data:
+        for num_docs, doc in enumerate(data, start=1):
             # chunk document using chunk_document function from codinit.chunk_documents.py
             chunks = self.chunk_doc(doc=doc)
             # iterate over chunks, with chunk and its order in doc
             for chunk_num, chunk in enumerate(chunks):
+                num_chunks += 1
                 # create doc_obj of the chunk according to DocumentationFile schema
+                content_hash = compute_content_hash(chunk)
+                if content_hash in seen_hashes:
+                    num_skipped += 1
+                    continue
+                seen_hashes.add(content_hash)
                 doc_obj = {
+                    "library": self.library.libname,
                     "title": doc.metadata.title,
                     "description": doc.metadata.description,
                     "chunknumber": chunk_num,
-                    "source": str(doc.url),
+                    "source": get_page_url(doc.url),
                     "language": doc.metadata.languageCode,
                     "content": chunk,
+                    "content_hash": content_hash,
                 }
-                # save chunk to weaviate
-                doc_id = self.get_or_create_documentation(
-                    doc_obj=doc_obj, lib_id=lib_id
+                self.add_doc_to_batch(
+                    doc_obj=doc_obj, lib_id=lib_id, batch_writer=batch_writer
                 )
+            if num_docs % 100 == 0:
                 logging.info(
-                    f"Processed loading for chunk document with DOC_ID {doc_id=}"
+                    f"Chunked {num_docs} documents into {num_chunks} chunks "
+                    f"of library {self.library.libname}"
                 )
+        report = batch_writer.close()
+        if report.num_objects:
+            # cached query results do not contain the new chunks
+            self.query_cache.bump_version(self.library.libname)
+        duration = time.perf_counter() - start
+        logging.info(
+            f"Loaded {num_chunks - num_skipped} of {num_chunks} chunks of {num_docs} "
+            f"documents in {duration:.1f}s "
+            f"({num_chunks / duration if duration else 0.0:.1f} chunks/sec), "
+            f"{num_skipped} duplicate or already loaded chunks skipped, "
+            f"{report.failed_objects} failed chunks, "
+            f"{report.failed_references} failed references"
+        )
+        return report
 
     # run
     def run(self):
         # get or create library
         lib_id = self.get_or_create_library()
         data = self.get_raw_documentation()
-        n_docs = self.check_library_has_docs(lib_id=lib_id)
-        if len(data) == 0:
+        # peek at the stream to check that it is not empty
+        first_doc = next(data, None)
+        if first_doc is None:
             logging.error("No raw documentation data found.")
-        elif n_docs == 0:
+        else:
+            data = itertools.chain([first_doc], data)
+            # resumes interrupted loads and tops up libraries with new documents
+            existing_hashes = self.get_existing_chunk_hashes()
             logging.info(
-                "Library has no documentation in weaviate. Embedding documentation now..."
+                f"Library has {len(existing_hashes)} chunks in weaviate. "
+                "Embedding new documentation chunks now..."
+            )
+            self.embed_documentation(
+                data=data, lib_id=lib_id, existing_hashes=existing_hashes
             )
-            self.embed_documentation(data=data, lib_id=lib_id)
             logging.info("Done embedding documentation.")
 
+    def refresh(self, result: RescrapeResult):
+        """
+        Applies a rescrape of the library, only changed pages are chunked and
+        embedded again and the chunks of changed and removed pages are deleted.
+        """
+        lib_id = self.get_or_create_library()
+        changed_sources = {get_page_url(doc.url) for doc in result.changed}
+        refreshed_sources = changed_sources | {
+            get_page_url(url) for url in result.removed
+        }
+        num_deleted = self.delete_chunks_by_source(refreshed_sources)
+        data: Iterable[WebScrapingData] = result.changed
+        if num_deleted:
+            # chunks are stored once per library under the first page that has them,
+            # a deleted chunk may still be part of unchanged pages, which are chunked
+            # again from the saved docs so that the missing chunks are loaded
+            data = itertools.chain(
+                result.changed,
+                (
+                    doc
+                    for doc in self.get_raw_documentation()
+                    if get_page_url(doc.url) not in refreshed_sources
+                ),
+            )
+        if result.changed or num_deleted:
+            self.embed_documentation(
+                data=data,
+                lib_id=lib_id,
+                existing_hashes=self.get_existing_chunk_hashes(),
+            )
+        logging.info(
+            f"Refreshed documentation of library {self.library.libname}, "
+            f"{len(result.unchanged)} unchanged pages kept."
+        )
+
 
 class WeaviateDocQuerier(BaseWeaviateDocClient):
     """
@@ -380,16 +609,39 @@ class WeaviateDocQuerier(BaseWeaviateDocClient):
     def query_weaviate_docs(self, query: str):
         self.client.connect()
         documentation_collection = self.client.collections.get("DocumentationFile")
+        embedder = get_embedder()
         response = documentation_collection.query.hybrid(
             query=query,
+            # only search the chunks of the library instead of the whole collection
+            filters=Filter.by_property("library").equal(self.library.libname),
+            # the keyword part of the search still uses the query text
+            vector=embedder.embed_query(query) if embedder else None,
             alpha=self.documentation_settings.alpha,
             return_metadata=wvc.query.MetadataQuery(score=True, explain_score=True),
             limit=self.documentation_settings.top_k,
+            # vectors measure the redundancy between hits when reranking
+            include_vector=self.documentation_settings.rerank,
         )
         docs = response.objects
-        self.client.close()
         return docs
 
+    def get_retrieved_chunks(self, docs) -> List[RetrievedChunk]:
+        chunks = []
+        for doc in docs:
+            vector = doc.vector
+            if isinstance(vector, dict):
+                vector = vector.get("default")
+            chunks.append(
+                RetrievedChunk(
+                    source=doc.properties["source"],
+                    chunknumber=doc.properties["chunknumber"],
+                    content=doc.properties["content"],
+                    score=doc.metadata.score or 0.0,
+                    vector=vector or None,
+                )
+            )
+        return chunks
+
     # get relevant documents for a query
     def get_relevant_documents(self, query: str) -> str:
         # clean up query that might be produced by an LLM
@@ -397,12 +649,39 @@ class WeaviateDocQuerier(BaseWeaviateDocClient):
         result = re.findall(r'"(.*?)"', query)
         if len(result) > 0:
             query = result[0]
+        settings = self.documentation_settings
+        context_params: Dict[str, Any] = dict(
+            max_tokens=settings.context_tokens,
+            encoding=settings.tokenizer,
+            lambda_mult=settings.mmr_lambda,
+            rerank=settings.rerank,
+            # chunks of the token chunker are joined by blank lines
+            chunk_separator="\n\n" if settings.token_chunking else "",
+            # the overlap the chunks were loaded with, no overlap is removed without it
+            chunk_overlap=settings.overlap_tokens
+            if settings.token_chunking
+            else settings.overlap,
+        )
+        # repeated queries skip both the query embedding and the hybrid search,
+        # the key includes every setting the assembled context depends on
+        cache_key = self.query_cache.make_key(
+            library=self.library.libname,
+            query=query,
+            alpha=settings.alpha,
+            top_k=settings.top_k,
+            **context_params,
+        )
+        cached_docs = self.query_cache.get(cache_key)
+        if cached_docs is not None:
+            logging.info(f"Using cached relevant documents for query: {query}")
+            return cached_docs
         logging.info(f"Retrieving relevant documents for query: {query}")
         docs = self.query_weaviate_docs(query=query)
         logging.info(f"{docs=}")
-        relevant_docs = ""
-        for doc in docs:
-            relevant_docs += doc.properties["content"]
+        relevant_docs = assemble_context(
+            chunks=self.get_retrieved_chunks(docs), **context_params
+        )
+        self.query_cache.put(cache_key, relevant_docs)
         return relevant_docs
 
 
@@ -0,0 +1,453 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from bs4 import BeautifulSoup, Tag
+from bs4.element import NavigableString
+from pydantic import ValidationError
+
+from codinit.config import DocumentationSettings, documentation_settings
+from codinit.documentation.apify_webscraper import DocumentationScraper
+from codinit.documentation.pydantic_models import (
+    Crawl,
+    CrawlManifest,
+    Metadata,
+    PageState,
+    RescrapeResult,
+    RunInput,
+    WebScrapingData,
+    get_page_url,
+)
+from codinit.weaviate_utils import compute_content_hash
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+HEADINGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "body",
+    "dd",
+    "details",
+    "div",
+    "dl",
+    "dt",
+    "figure",
+    "form",
+    "main",
+    "ol",
+    "p",
+    "section",
+    "table",
+    "tbody",
+    "thead",
+    "tr",
+    "ul",
+}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Drops the fragment, pages differing only by their anchor are the same page, and
+    normalizes the url like the saved docs do, so manifest keys match their urls.
+    """
+    return get_page_url(url)
+
+
+def get_url_prefix(url: str) -> str:
+    """Scheme, host and directory of a url, e.g. https://host/docs/ for https://host/docs/page."""
+    parsed = urlparse(url)
+    directory = parsed.path[: parsed.path.rfind("/") + 1] or "/"
+    return f"{parsed.scheme}://{parsed.netloc}{directory}".lower()
+
+
+def is_below_prefix(url: str, prefix: str) -> bool:
+    """Whether a url is on the host of a prefix and below its directory."""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}{parsed.path or '/'}".lower().startswith(
+        prefix
+    )
+
+
+def _inline_text(node: Tag) -> str:
+    return " ".join(node.get_text(" ").split())
+
+
+def html_to_markdown(node: Tag) -> str:
+    """
+    Converts the readable content of an html element to simple markdown,
+    keeping headings, list items and code blocks, which the chunker splits on.
+    """
+    blocks: List[str] = []
+    inline: List[str] = []
+
+    def flush_inline():
+        text = " ".join(" ".join(inline).split())
+        if text:
+            blocks.append(text)
+        inline.clear()
+
+    def walk(element: Tag):
+        for child in element.children:
+            if isinstance(child, NavigableString):
+                inline.append(str(child))
+            elif not isinstance(child, Tag):
+                continue
+            elif child.name in HEADINGS:
+                flush_inline()
+                blocks.append("#" * int(child.name[1]) + " " + _inline_text(child))
+            elif child.name == "pre":
+                flush_inline()
+                blocks.append("```\n" + child.get_text().strip("\n") + "\n```")
+            elif child.name == "li":
+                flush_inline()
+                blocks.append("- " + _inline_text(child))
+            elif child.name in BLOCK_TAGS:
+                flush_inline()
+                walk(child)
+                flush_inline()
+            else:
+                inline.append(child.get_text(" "))
+
+    walk(node)
+    flush_inline()
+    return "\n\n".join(blocks)
+
+
+def _get_meta(soup: BeautifulSoup, *names: str) -> Optional[str]:
+    for name in names:
+        tag = soup.find("meta", attrs={"name": name}) or soup.find(
+            "meta", attrs={"property": name}
+        )
+        if isinstance(tag, Tag) and tag.get("content"):
+            return str(tag["content"]).strip()
+    return None
+
+
+def extract_page(
+    html: str,
+    url: str,
+    loaded_url: str,
+    depth: int,
+    referrer_url: Optional[str] = None,
+    remove_elements_selector: str = RunInput.model_fields[
+        "removeElementsCssSelector"
+    ].default,
+) -> Tuple[WebScrapingData, List[str]]:
+    """
+    Extracts the readable text and metadata of a page, in the same format as the
+    website content crawler of Apify, and the absolute urls of its links.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    links = [
+        normalize_url(urljoin(loaded_url, str(anchor["href"])))
+        for anchor in soup.find_all("a", href=True)
+    ]
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    canonical = soup.find("link", rel="canonical", href=True)
+    canonical_url = (
+        urljoin(loaded_url, str(canonical["href"]))
+        if isinstance(canonical, Tag)
+        else loaded_url
+    )
+    html_tag = soup.find("html")
+    metadata = Metadata(
+        canonicalUrl=canonical_url,  # type: ignore
+        title=title or _get_meta(soup, "og:title") or "",
+        description=_get_meta(soup, "description", "og:description") or "",
+        author=_get_meta(soup, "author"),
+        keywords=_get_meta(soup, "keywords"),
+        languageCode=(
+            str(html_tag.get("lang"))
+            if isinstance(html_tag, Tag) and html_tag.get("lang")
+            else "en"
+        ),
+    )
+    for element in soup.select(remove_elements_selector):
+        element.decompose()
+    content = soup.find("main") or soup.find("article") or soup.body or soup
+    lines = (line.strip() for line in content.get_text("\n").splitlines())
+    data = WebScrapingData(
+        url=url,  # type: ignore
+        crawl=Crawl(
+            loadedUrl=loaded_url,  # type: ignore
+            loadedTime=datetime.datetime.now(datetime.timezone.utc)
+            .isoformat(timespec="milliseconds")
+            .replace("+00:00", "Z"),
+            referrerUrl=referrer_url,  # type: ignore
+            depth=depth,
+        ),
+        metadata=metadata,
+        text="\n".join(line for line in lines if line),
+        markdown=html_to_markdown(content),
+    )
+    return data, links
+
+
+class HostRateLimiter:
+    """
+    Spaces the requests to each host by at least min_interval seconds.
+    Callers reserve the next free slot of the host and sleep until it, so
+    the lock is never held while waiting.
+    """
+
+    def __init__(self, min_interval: float) -> None:
+        self.min_interval = min_interval
+        self.next_slots: Dict[str, float] = {}
+        self.lock = asyncio.Lock()
+
+    async def wait(self, host: str, min_interval: Optional[float] = None) -> None:
+        interval = max(self.min_interval, min_interval or 0.0)
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slots.get(host, now))
+            self.next_slots[host] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class RobotsCache:
+    """Fetches and caches the robots.txt of each host, a missing file allows everything."""
+
+    def __init__(self, user_agent: str) -> None:
+        self.user_agent = user_agent
+        self.parsers: Dict[str, RobotFileParser] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    async def get_parser(
+        self, session: aiohttp.ClientSession, url: str
+    ) -> RobotFileParser:
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        lock = self.locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            if origin not in self.parsers:
+                parser = RobotFileParser(origin + "/robots.txt")
+                lines: List[str] = []
+                try:
+                    async with session.get(origin + "/robots.txt") as response:
+                        if response.status == 200:
+                            lines = (await response.text()).splitlines()
+                except aiohttp.ClientError as e:
+                    logging.warning(f"Could not fetch robots.txt of {origin}: {e}")
+                parser.parse(lines)
+                self.parsers[origin] = parser
+            return self.parsers[origin]
+
+    async def can_fetch(self, session: aiohttp.ClientSession, url: str) -> bool:
+        parser = await self.get_parser(session, url)
+        return parser.can_fetch(self.user_agent, url)
+
+    async def crawl_delay(
+        self, session: aiohttp.ClientSession, url: str
+    ) -> Optional[float]:
+        parser = await self.get_parser(session, url)
+        delay = parser.crawl_delay(self.user_agent)
+        return float(delay) if delay is not None else None
+
+
+class LocalCrawler(DocumentationScraper):
+    """
+    In-process asyncio crawler, an alternative to the Apify actor without its
+    start-up and queueing latency, that also works without internet access.
+    Like the website content crawler of Apify, it follows links below the start urls
+    up to max_depth, with at most max_concurrency requests in flight and requests
+    to the same host spaced by host_delay seconds or the robots.txt crawl delay.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_depth: int = 20,
+        max_pages: int = 10000,
+        host_delay: float = 0.5,
+        timeout: float = 60,
+        user_agent: str = "codinit-crawler",
+        respect_robots_txt: bool = True,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.host_delay = host_delay
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.respect_robots_txt = respect_robots_txt
+
+    @classmethod
+    def from_settings(
+        cls, documentation_settings: DocumentationSettings = documentation_settings
+    ) -> "LocalCrawler":
+        return cls(
+            max_concurrency=documentation_settings.crawl_max_concurrency,
+            max_depth=documentation_settings.crawl_max_depth,
+            max_pages=documentation_settings.crawl_max_pages,
+            host_delay=documentation_settings.crawl_host_delay,
+            timeout=documentation_settings.crawl_timeout,
+            user_agent=documentation_settings.crawl_user_agent,
+            respect_robots_txt=documentation_settings.respect_robots_txt,
+        )
+
+    def scrape_urls(self, urls: List[str]) -> List[WebScrapingData]:
+        start = datetime.datetime.now()
+        results = asyncio.run(self.crawl(urls))
+        logging.info(f"scraping duration={datetime.datetime.now() - start}")
+        return results
+
+    def rescrape_urls(self, urls: List[str], manifest: CrawlManifest) -> RescrapeResult:
+        """
+        Crawls again with conditional requests built from the ETag and Last-Modified
+        of the previous crawl, pages answered with 304 Not Modified are not downloaded.
+        """
+        start = datetime.datetime.now()
+        result = asyncio.run(self.recrawl(urls, manifest))
+        logging.info(f"scraping duration={datetime.datetime.now() - start}")
+        return result
+
+    async def crawl(self, urls: List[str]) -> List[WebScrapingData]:
+        result = await self.recrawl(urls, CrawlManifest())
+        return result.changed
+
+    async def recrawl(self, urls: List[str], manifest: CrawlManifest) -> RescrapeResult:
+        start_urls = []
+        for url in urls:
+            parsed = urlparse(url)
+            if parsed.scheme not in ["http", "https"] or not parsed.netloc:
+                logging.warning(f"Invalid URL skipped: {url}.")
+                continue
+            start_urls.append(normalize_url(url))
+        # only pages below the directory of a start url are crawled
+        prefixes = [get_url_prefix(url) for url in start_urls]
+        result = RescrapeResult()
+        seen: Set[str] = set(start_urls)
+        queue: "asyncio.Queue[Tuple[str, int, Optional[str]]]" = asyncio.Queue()
+        for url in start_urls:
+            queue.put_nowait((url, 0, None))
+        rate_limiter = HostRateLimiter(self.host_delay)
+        robots = RobotsCache(self.user_agent)
+
+        async def worker(session: aiohttp.ClientSession):
+            while True:
+                url, depth, referrer_url = await queue.get()
+                previous = manifest.pages.get(url)
+                try:
+                    page = await self.fetch_page(
+                        session,
+                        rate_limiter,
+                        robots,
+                        url,
+                        depth,
+                        referrer_url,
+                        previous,
+                    )
+                    if page is not None:
+                        data, state = page
+                        result.manifest.pages[url] = state
+                        if data is None:
+                            result.unchanged.append(url)
+                        else:
+                            result.changed.append(data)
+                        if depth < self.max_depth:
+                            for link in state.links:
+                                if (
+                                    link not in seen
+                                    and len(seen) < self.max_pages
+                                    and any(is_below_prefix(link, p) for p in prefixes)
+                                ):
+                                    seen.add(link)
+                                    queue.put_nowait((link, depth + 1, url))
+                except Exception as e:
+                    logging.error(f"Error crawling {url}: {e}")
+                    # keep the previous version of pages that could not be fetched
+                    if previous is not None:
+                        result.manifest.pages[url] = previous
+                        result.unchanged.append(url)
+                finally:
+                    queue.task_done()
+
+        async with aiohttp.ClientSession(
+            headers={"User-Agent": self.user_agent},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as session:
+            workers = [
+                asyncio.create_task(worker(session))
+                for _ in range(self.max_concurrency)
+            ]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        result.removed = [
+            url for url in manifest.pages if url not in result.manifest.pages
+        ]
+        return result
+
+    async def fetch_page(
+        self,
+        session: aiohttp.ClientSession,
+        rate_limiter: HostRateLimiter,
+        robots: RobotsCache,
+        url: str,
+        depth: int,
+        referrer_url: Optional[str],
+        previous: Optional[PageState] = None,
+    ) -> Optional[Tuple[Optional[WebScrapingData], PageState]]:
+        """
+        Fetches a page and returns its data and state, the data is None when the
+        page did not change since the previous crawl. Returns None for skipped pages.
+        """
+        crawl_delay = None
+        if self.respect_robots_txt:
+            if not await robots.can_fetch(session, url):
+                logging.info(f"Skipping {url}, disallowed by robots.txt")
+                return None
+            crawl_delay = await robots.crawl_delay(session, url)
+        headers = {}
+        if previous is not None and previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous is not None and previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+        await rate_limiter.wait(urlparse(url).netloc, crawl_delay)
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and previous is not None:
+                return None, previous
+            if response.status != 200:
+                logging.warning(f"Skipping {url}, status {response.status}")
+                return None
+            if "html" not in response.headers.get("Content-Type", "text/html"):
+                return None
+            html = await response.text()
+            loaded_url = normalize_url(str(response.url))
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        try:
+            data, links = extract_page(
+                html=html,
+                url=url,
+                loaded_url=loaded_url,
+                depth=depth,
+                referrer_url=referrer_url,
+            )
+        except ValidationError as e:
+            logging.error(f"Error parsing item to model: {e}")
+            return None
+        state = PageState(
+            content_hash=compute_content_hash(data.text),
+            etag=etag,
+            last_modified=last_modified,
+            links=links,
+        )
+        # servers without validators send the page again, compare its text instead
+        if previous is not None and previous.content_hash == state.content_hash:
+            return None, state
+        return data, state
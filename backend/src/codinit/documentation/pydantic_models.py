@@ -1,8 +1,31 @@
-from typing import List, Optional
-
-from pydantic import BaseModel, Field, HttpUrl
+from typing import Dict, List, Optional, Union
+from urllib.parse import urldefrag
+
+from pydantic import (
+    BaseModel,
+    Field,
+    HttpUrl,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+)
 from typing_extensions import Annotated
 
+http_url_adapter = TypeAdapter(HttpUrl)
+
+
+def get_page_url(url: Union[str, HttpUrl]) -> str:
+    """
+    Normalized url of a page without its fragment, in the form of str(HttpUrl), e.g.
+    with a trailing slash for a host without path. Pages are keyed by it in crawl
+    manifests and rescrape results, and it is the source of their chunks.
+    """
+    page_url = urldefrag(str(url))[0]
+    try:
+        return str(http_url_adapter.validate_python(page_url))
+    except ValidationError:
+        return page_url
+
 
 # Crawling output model
 class Crawl(BaseModel):
@@ -60,6 +83,10 @@ class WebScrapingData(BaseModel):
         }
 
 
+# shared validator of scraped items, building a TypeAdapter compiles a validator
+web_scraping_data_adapter = TypeAdapter(WebScrapingData)
+
+
 # Crawling input models
 class StartUrl(BaseModel):
     url: HttpUrl
@@ -105,6 +132,34 @@ class RunInput(BaseModel):
     maxResults: Annotated[int, Field(gt=0)] = 9999999
 
 
+# Crawl manifest models, the state of each scraped page used to detect changes
+class PageState(BaseModel):
+    content_hash: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # links of the page, followed when the page is not modified
+    links: List[str] = Field(default_factory=list)
+
+
+class CrawlManifest(BaseModel):
+    pages: Dict[str, PageState] = Field(default_factory=dict)
+
+    @field_validator("pages")
+    @classmethod
+    def normalize_page_urls(cls, pages: Dict[str, PageState]) -> Dict[str, PageState]:
+        # manifests saved by older versions are keyed by the urls as requested
+        return {get_page_url(url): state for url, state in pages.items()}
+
+
+class RescrapeResult(BaseModel):
+    """Pages of a rescraped library compared to its previous crawl manifest."""
+
+    changed: List[WebScrapingData] = Field(default_factory=list)
+    unchanged: List[str] = Field(default_factory=list)
+    removed: List[str] = Field(default_factory=list)
+    manifest: CrawlManifest = Field(default_factory=CrawlManifest)
+
+
 # library
 class Library(BaseModel):
     libname: str
@@ -0,0 +1,185 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from codinit.config import DocumentationSettings, documentation_settings
+from codinit.weaviate_utils import compute_content_hash
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Queries differing only by case or whitespace share their cache entry."""
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """
+    LRU cache with a time to live for the results of documentation queries.
+    Keys contain the index version of the library, which loaders bump after writing
+    or deleting chunks, so results of an outdated index are never returned.
+    With a path, entries and versions are persisted in a SQLite file and shared
+    between processes, the LRU only bounds the entries kept in memory.
+    """
+
+    def __init__(
+        self, max_size: int = 1024, ttl: float = 86400, path: Optional[str] = None
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expiry timestamp, result)
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.versions: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS query_results ("
+                    "key TEXT PRIMARY KEY, library TEXT NOT NULL, "
+                    "result TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS library_versions ("
+                    "library TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+                )
+                self.connection.execute(
+                    "DELETE FROM query_results WHERE expires_at <= ?", (time.time(),)
+                )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get_version(self, library: str) -> int:
+        with self.lock:
+            if self.connection is None:
+                return self.versions.get(library, 0)
+            # read on every call, another process may have loaded the library
+            row = self.connection.execute(
+                "SELECT version FROM library_versions WHERE library = ?", (library,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def bump_version(self, library: str) -> int:
+        """Invalidates all cached results of a library."""
+        with self.lock:
+            self.entries = OrderedDict(
+                (key, entry)
+                for key, entry in self.entries.items()
+                if not key.startswith(library + ":")
+            )
+            if self.connection is None:
+                self.versions[library] = self.versions.get(library, 0) + 1
+                return self.versions[library]
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO library_versions (library, version) VALUES (?, 1) "
+                    "ON CONFLICT(library) DO UPDATE SET version = version + 1",
+                    (library,),
+                )
+                # entries of older versions can never be hit again
+                self.connection.execute(
+                    "DELETE FROM query_results WHERE library = ?", (library,)
+                )
+                version = self.connection.execute(
+                    "SELECT version FROM library_versions WHERE library = ?",
+                    (library,),
+                ).fetchone()[0]
+        logging.info(f"Invalidated cached queries of {library}, {version=}")
+        return version
+
+    def make_key(
+        self, library: str, query: str, alpha: float, top_k: int, **params: object
+    ) -> str:
+        """Key of a query, other parameters changing the result are passed as params."""
+        version = self.get_version(library)
+        query_hash = compute_content_hash(
+            "\n".join(
+                [normalize_query(query), str(alpha), str(top_k), str(version)]
+                + [f"{name}={value}" for name, value in sorted(params.items())]
+            )
+        )
+        return f"{library}:{query_hash}"
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.connection is not None:
+                row = self.connection.execute(
+                    "SELECT expires_at, result FROM query_results WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self.entries[key] = entry
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            self._evict()
+            return result
+
+    def put(self, key: str, result: str) -> None:
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        with self.lock:
+            self.entries[key] = (expires_at, result)
+            self.entries.move_to_end(key)
+            self._evict()
+            if self.connection is not None:
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO query_results "
+                        "(key, library, result, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, key.split(":", 1)[0], result, expires_at),
+                    )
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+_query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def create_query_cache(
+    documentation_settings: DocumentationSettings = documentation_settings,
+) -> QueryCache:
+    return QueryCache(
+        max_size=documentation_settings.query_cache_size,
+        ttl=documentation_settings.query_cache_ttl,
+        path=documentation_settings.query_cache_path or None,
+    )
+
+
+def get_query_cache() -> QueryCache:
+    """Returns the query cache shared by the documentation loaders and queriers."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = create_query_cache(documentation_settings)
+        return _query_cache
@@ -1,14 +1,32 @@
+import asyncio
 import json
 import logging
 import os
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
-from apify_client import ApifyClient
-from pydantic import TypeAdapter
+from apify_client import ApifyClient, ApifyClientAsync
 
-from codinit.config import Secrets, secrets
-from codinit.documentation.apify_webscraper import WebScraper
-from codinit.documentation.pydantic_models import WebScrapingData
+from codinit.config import (
+    DocumentationSettings,
+    Secrets,
+    documentation_settings,
+    secrets,
+)
+from codinit.documentation.apify_webscraper import (
+    AsyncWebScraper,
+    DocumentationScraper,
+    WebScraper,
+    compare_with_manifest,
+)
+from codinit.documentation.local_crawler import LocalCrawler
+from codinit.documentation.pydantic_models import (
+    CrawlManifest,
+    Library,
+    RescrapeResult,
+    WebScrapingData,
+    get_page_url,
+    web_scraping_data_adapter,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -18,8 +36,7 @@ logging.basicConfig(
 def save_scraped_data_as_json(data: List[WebScrapingData], filename: str):
     """
     saves data in json file, overwrites the file.
-    TODO check if URL has been already visited and only save new data, or check for changes..
-    Better to be done with some DB.
+    Changes between scrapes are tracked in the crawl manifest, see ScraperSaver.refresh_docs
     """
     serialized_data = [item.model_dump() for item in data]
     with open(filename, "w", encoding="utf-8") as file:
@@ -34,25 +51,175 @@ def load_scraped_data_from_json(filename: str) -> List[WebScrapingData]:
     with open(filename, "r", encoding="utf-8") as file:
         # load json file which contains list of WebScrapingData objects
         data = json.load(file)
-        typeadapter = TypeAdapter(WebScrapingData)
         # create list of WebScrapingData models from json data
-        return [typeadapter.validate_python(item) for item in data]
+        return [web_scraping_data_adapter.validate_python(item) for item in data]
+
+
+def save_scraped_data_as_jsonl(
+    data: Iterable[WebScrapingData], filename: str, append: bool = False
+) -> int:
+    """
+    streams data to a JSON Lines file, one WebScrapingData object per line,
+    so that the data never has to be held in memory at once.
+    Returns the number of written objects.
+    """
+    num_items = 0
+    with open(filename, "a" if append else "w", encoding="utf-8") as file:
+        for item in data:
+            file.write(item.model_dump_json() + "\n")
+            num_items += 1
+    return num_items
+
+
+def iter_scraped_data_from_jsonl(filename: str) -> Iterator[WebScrapingData]:
+    """
+    lazily loads and validates WebScrapingData models from a JSON Lines file
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield web_scraping_data_adapter.validate_json(line)
+
+
+def iter_scraped_data(filename: str) -> Iterator[WebScrapingData]:
+    """
+    iterates over scraped data saved as JSON Lines, or as a JSON list by older versions
+    """
+    if filename.endswith(".jsonl"):
+        return iter_scraped_data_from_jsonl(filename=filename)
+    return iter(load_scraped_data_from_json(filename=filename))
+
+
+def get_docs_filename(libname: str, secrets: Secrets = secrets) -> str:
+    return secrets.docs_dir + "/" + libname + ".jsonl"
+
+
+def get_saved_docs_filename(libname: str, secrets: Secrets = secrets) -> Optional[str]:
+    # docs scraped by older versions are saved as a JSON list
+    for filename in [
+        get_docs_filename(libname=libname, secrets=secrets),
+        secrets.docs_dir + "/" + libname + ".json",
+    ]:
+        if os.path.exists(filename):
+            return filename
+    return None
+
+
+def check_lib_docs_saved(libname: str, secrets: Secrets = secrets) -> bool:
+    return get_saved_docs_filename(libname=libname, secrets=secrets) is not None
+
+
+def get_manifest_filename(libname: str, secrets: Secrets = secrets) -> str:
+    return secrets.docs_dir + "/" + libname + ".manifest.json"
+
+
+def load_crawl_manifest(filename: str) -> CrawlManifest:
+    """loads the crawl manifest of a library, empty if it was never saved"""
+    if not os.path.exists(filename):
+        return CrawlManifest()
+    with open(filename, "r", encoding="utf-8") as file:
+        return CrawlManifest.model_validate_json(file.read())
+
+
+def save_crawl_manifest(manifest: CrawlManifest, filename: str):
+    # write to a temporary file first, an interrupted write keeps the old manifest
+    with open(filename + ".part", "w", encoding="utf-8") as file:
+        file.write(manifest.model_dump_json())
+    os.replace(filename + ".part", filename)
+
+
+def create_scraper(
+    apify_client: Optional[ApifyClient] = None,
+    documentation_settings: DocumentationSettings = documentation_settings,
+) -> DocumentationScraper:
+    """Scraper of the configured backend, the Apify actor or the local crawler."""
+    if documentation_settings.scraper_backend == "local":
+        return LocalCrawler.from_settings(documentation_settings)
+    if documentation_settings.scraper_backend == "apify":
+        if apify_client is None:
+            apify_client = ApifyClient(secrets.apify_key)
+        return WebScraper(apify_client)
+    raise ValueError(
+        f"Unknown scraper backend {documentation_settings.scraper_backend}"
+    )
+
+
+def create_async_scraper(
+    apify_client: Optional[ApifyClientAsync] = None,
+    documentation_settings: DocumentationSettings = documentation_settings,
+) -> Union[AsyncWebScraper, LocalCrawler]:
+    """Asyncio scraper of the configured backend, the Apify actor or the local crawler."""
+    if documentation_settings.scraper_backend == "local":
+        return LocalCrawler.from_settings(documentation_settings)
+    if documentation_settings.scraper_backend == "apify":
+        if apify_client is None:
+            apify_client = ApifyClientAsync(secrets.apify_key)
+        return AsyncWebScraper(
+            client=apify_client,
+            page_size=documentation_settings.dataset_page_size,
+            max_parallel_pages=documentation_settings.max_parallel_pages,
+        )
+    raise ValueError(
+        f"Unknown scraper backend {documentation_settings.scraper_backend}"
+    )
 
 
 class ScraperSaver:
     def __init__(
-        self, libname: str, apify_client: ApifyClient, secrets: Secrets = secrets
+        self,
+        libname: str,
+        apify_client: Optional[ApifyClient] = None,
+        secrets: Secrets = secrets,
+        scraper: Optional[DocumentationScraper] = None,
     ):
-        self.scraper = WebScraper(apify_client)
+        self.scraper = scraper or create_scraper(apify_client)
         self.secrets = secrets
         self.libname = libname
-        self.filename = self.secrets.docs_dir + "/" + libname + ".json"
+        self.filename = get_docs_filename(libname=libname, secrets=secrets)
+        self.manifest_filename = get_manifest_filename(libname=libname, secrets=secrets)
 
     def check_lib_docs_saved(self):
-        if os.path.exists(self.filename):
-            return True
-        else:
-            return False
+        return check_lib_docs_saved(libname=self.libname, secrets=self.secrets)
+
+    def get_manifest(self) -> CrawlManifest:
+        manifest = load_crawl_manifest(filename=self.manifest_filename)
+        saved_filename = get_saved_docs_filename(self.libname, secrets=self.secrets)
+        if not manifest.pages and saved_filename is not None:
+            # docs saved before manifests existed, hash the saved pages instead
+            manifest = compare_with_manifest(
+                list(iter_scraped_data(filename=saved_filename)), CrawlManifest()
+            ).manifest
+        return manifest
+
+    def refresh_docs(self, urls: List[str]) -> RescrapeResult:
+        """
+        Scrapes the docs again and saves them, keeping unchanged pages from the saved
+        docs. The returned changed and removed pages are the only ones that need to be
+        chunked and embedded again.
+        """
+        manifest = self.get_manifest()
+        result = self.scraper.rescrape_urls(urls=urls, manifest=manifest)
+        unchanged = {get_page_url(url) for url in result.unchanged}
+        saved_filename = get_saved_docs_filename(self.libname, secrets=self.secrets)
+        partial_filename = self.filename + ".part"
+        save_scraped_data_as_jsonl(data=result.changed, filename=partial_filename)
+        if saved_filename is not None:
+            save_scraped_data_as_jsonl(
+                data=(
+                    doc
+                    for doc in iter_scraped_data(filename=saved_filename)
+                    if get_page_url(doc.url) in unchanged
+                ),
+                filename=partial_filename,
+                append=True,
+            )
+        os.replace(partial_filename, self.filename)
+        save_crawl_manifest(result.manifest, filename=self.manifest_filename)
+        logging.info(
+            f"Refreshed docs of {self.libname}: {len(result.changed)} changed, "
+            f"{len(result.unchanged)} unchanged and {len(result.removed)} removed pages"
+        )
+        return result
 
     def scrape_and_save_apify_docs(self, urls: List[str]):
         if not self.check_lib_docs_saved():
@@ -63,8 +230,10 @@ class ScraperSaver:
                 + self.filename
                 + " , scraping..."
             )
-            scraped_data_models = self.scraper.scrape_urls(urls=urls)
-            save_scraped_data_as_json(data=scraped_data_models, filename=self.filename)
+            # with an empty manifest all pages are new, the manifest is saved for refreshes
+            result = self.scraper.rescrape_urls(urls=urls, manifest=CrawlManifest())
+            save_scraped_data_as_jsonl(data=result.changed, filename=self.filename)
+            save_crawl_manifest(result.manifest, filename=self.manifest_filename)
             logging.info(
                 "Library docs saved " + self.libname + " under " + self.filename
             )
@@ -72,6 +241,81 @@ class ScraperSaver:
             logging.info("Library docs already exist " + self.libname)
 
 
+async def scrape_and_save_library_async(
+    library: Library,
+    scraper: Union[AsyncWebScraper, LocalCrawler],
+    secrets: Secrets = secrets,
+) -> int:
+    """
+    Scrapes the documentation of a library and appends each page of the dataset to
+    disk as it arrives. The file only gets its final name once the crawl is complete.
+    Returns the number of saved items.
+    """
+    filename = get_docs_filename(libname=library.libname, secrets=secrets)
+    partial_filename = filename + ".part"
+    if isinstance(scraper, LocalCrawler):
+        # the manifest of the crawler keeps the validators for conditional requests
+        result = await scraper.recrawl(urls=library.links, manifest=CrawlManifest())
+        num_items = save_scraped_data_as_jsonl(
+            data=result.changed, filename=partial_filename
+        )
+        manifest = result.manifest
+    else:
+        manifest = CrawlManifest()
+        num_items = save_scraped_data_as_jsonl(data=[], filename=partial_filename)
+        async for page in scraper.scrape_urls(urls=library.links):
+            num_items += save_scraped_data_as_jsonl(
+                data=page, filename=partial_filename, append=True
+            )
+            manifest.pages.update(
+                compare_with_manifest(page, CrawlManifest()).manifest.pages
+            )
+    os.replace(partial_filename, filename)
+    save_crawl_manifest(
+        manifest, filename=get_manifest_filename(library.libname, secrets=secrets)
+    )
+    logging.info(f"Saved {num_items} docs of {library.libname} under {filename}")
+    return num_items
+
+
+async def scrape_and_save_libraries_async(
+    libraries: List[Library],
+    apify_client: Optional[ApifyClientAsync] = None,
+    secrets: Secrets = secrets,
+    documentation_settings: DocumentationSettings = documentation_settings,
+) -> Dict[str, int]:
+    """
+    Scrapes the documentation of libraries that have not been saved yet with the
+    configured scraper backend, running up to max_concurrent_crawls crawls at the
+    same time.
+    Returns the number of saved items per library, failed libraries are logged and skipped.
+    """
+    scraper = create_async_scraper(
+        apify_client=apify_client, documentation_settings=documentation_settings
+    )
+    semaphore = asyncio.Semaphore(documentation_settings.max_concurrent_crawls)
+
+    async def scrape_library(library: Library) -> int:
+        if check_lib_docs_saved(libname=library.libname, secrets=secrets):
+            logging.info("Library docs already exist " + library.libname)
+            return 0
+        async with semaphore:
+            return await scrape_and_save_library_async(
+                library=library, scraper=scraper, secrets=secrets
+            )
+
+    results = await asyncio.gather(
+        *(scrape_library(library) for library in libraries), return_exceptions=True
+    )
+    num_items = {}
+    for library, result in zip(libraries, results):
+        if isinstance(result, BaseException):
+            logging.error(f"Scraping docs of {library.libname} failed: {result}")
+        else:
+            num_items[library.libname] = result
+    return num_items
+
+
 if __name__ == "__main__":
     client = ApifyClient(secrets.apify_key)
     scraper_saver = ScraperSaver(libname="test", apify_client=client)
@@ -0,0 +1,270 @@
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import weaviate.classes.config as wvcc
+from openai import OpenAI
+
+from codinit.config import EmbeddingSettings, embedding_settings, secrets
+from codinit.weaviate_utils import compute_content_hash
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# properties that are vectorized by the weaviate vectorizer of each collection,
+# used to build the text of an object when its vector is computed client-side.
+# Functions are added with an empty description, their name and signature tell
+# them apart (the code itself can exceed the input length of the models)
+VECTORIZED_PROPERTIES = {
+    "Repository": ["name"],
+    "File": ["name", "description"],
+    "Import": ["name"],
+    "Class": ["name", "description"],
+    "Function": ["name", "description", "parameters", "variables", "return_value"],
+    "Library": ["name", "links", "description"],
+    "DocumentationFile": ["title", "description", "source", "language", "content"],
+}
+
+
+def get_object_text(collection: str, properties: Dict[str, Any]) -> str:
+    """Text of an object to embed, made of the vectorized properties of its collection."""
+    texts = []
+    for name in VECTORIZED_PROPERTIES.get(collection, list(properties)):
+        value = properties.get(name)
+        if isinstance(value, str):
+            texts.append(value)
+        elif isinstance(value, list):
+            texts.extend(str(item) for item in value)
+    # like weaviate, fall back to the collection name for objects without text
+    return " ".join(text for text in texts if text) or collection
+
+
+class Embedder(ABC):
+    """Computes embedding vectors of texts on the client side."""
+
+    model_name: str
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeds texts with the OpenAI embeddings API, batch_size texts per request."""
+
+    def __init__(
+        self, model_name: str = "text-embedding-ada-002", batch_size: int = 256
+    ) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.client = OpenAI(api_key=secrets.openai_api_key)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            # the API rejects empty strings
+            batch = [text or " " for text in texts[start : start + self.batch_size]]
+            response = self.client.embeddings.create(model=self.model_name, input=batch)
+            vectors.extend(item.embedding for item in response.data)
+        return vectors
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Embeds texts locally on the CPU with a sentence-transformers model, without API
+    costs or network access once the model is in the local huggingface cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        batch_size: int = 64,
+        num_threads: int = 0,
+        device: str = "cpu",
+    ) -> None:
+        # imported here, loading torch is slow and only needed for local embeddings
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embedding vectors in a SQLite file, keyed by model name
+    and the SHA-256 hash of the embedded text. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the cache is shared by the threads of the ingestion pipeline
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+
+    def get_many(
+        self, model: str, text_hashes: Sequence[str]
+    ) -> Dict[str, List[float]]:
+        vectors: Dict[str, List[float]] = {}
+        unique_hashes = list(set(text_hashes))
+        # stay below the maximum number of SQL variables
+        for start in range(0, len(unique_hashes), 500):
+            batch = unique_hashes[start : start + 500]
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+            for text_hash, blob in rows:
+                vectors[text_hash] = array("f", blob).tolist()
+        return vectors
+
+    def put_many(self, model: str, vectors: Mapping[str, Sequence[float]]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) "
+                "VALUES (?, ?, ?)",
+                [
+                    (model, text_hash, array("f", vector).tobytes())
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class CachedEmbedder(Embedder):
+    """Looks texts up in the cache and only embeds the missing ones."""
+
+    def __init__(self, embedder: Embedder, cache: EmbeddingCache) -> None:
+        self.embedder = embedder
+        self.cache = cache
+        self.model_name = embedder.model_name
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        text_hashes = [compute_content_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, text_hashes)
+        missing = {
+            text_hash: text
+            for text_hash, text in zip(text_hashes, texts)
+            if text_hash not in vectors
+        }
+        if missing:
+            new_vectors = dict(
+                zip(missing, self.embedder.embed(list(missing.values())))
+            )
+            self.cache.put_many(self.model_name, new_vectors)
+            vectors.update(new_vectors)
+        logging.debug(
+            f"Embedded {len(texts)} texts, {len(texts) - len(missing)} from cache"
+        )
+        return [vectors[text_hash] for text_hash in text_hashes]
+
+
+def uses_client_side_vectors(
+    embedding_settings: EmbeddingSettings = embedding_settings,
+) -> bool:
+    # weaviate has no module for local sentence-transformers models
+    return (
+        embedding_settings.client_side_vectors
+        or embedding_settings.provider == "sentence_transformers"
+    )
+
+
+def get_vectorizer_config(
+    embedding_settings: EmbeddingSettings = embedding_settings,
+):
+    """Weaviate vectorizer of the KG and documentation collections."""
+    if uses_client_side_vectors(embedding_settings):
+        return wvcc.Configure.Vectorizer.none()
+    if embedding_settings.provider == "huggingface":
+        return wvcc.Configure.Vectorizer.text2vec_huggingface(
+            model=embedding_settings.model
+        )
+    if embedding_settings.provider == "openai":
+        # the vectors of the module have to match the ones of create_embedder
+        if embedding_settings.model == "text-embedding-ada-002":
+            return wvcc.Configure.Vectorizer.text2vec_openai(
+                model="ada", model_version="002"
+            )
+        if embedding_settings.model.startswith("text-embedding-3-"):
+            return wvcc.Configure.Vectorizer.text2vec_openai(
+                model=embedding_settings.model
+            )
+        raise ValueError(
+            f"Embedding model {embedding_settings.model} is not supported by the "
+            "text2vec-openai vectorizer, enable client_side_vectors to use it"
+        )
+    raise ValueError(f"Unknown embedding provider {embedding_settings.provider}")
+
+
+def create_embedder(
+    embedding_settings: EmbeddingSettings = embedding_settings,
+) -> Embedder:
+    if embedding_settings.provider == "openai":
+        embedder: Embedder = OpenAIEmbedder(
+            model_name=embedding_settings.model,
+            batch_size=embedding_settings.batch_size,
+        )
+    elif embedding_settings.provider in ["huggingface", "sentence_transformers"]:
+        # same models as the weaviate huggingface module, computed locally
+        embedder = SentenceTransformerEmbedder(
+            model_name=embedding_settings.model,
+            batch_size=embedding_settings.batch_size,
+            num_threads=embedding_settings.num_threads,
+        )
+    else:
+        raise ValueError(f"Unknown embedding provider {embedding_settings.provider}")
+    if embedding_settings.cache_path:
+        embedder = CachedEmbedder(
+            embedder=embedder, cache=EmbeddingCache(embedding_settings.cache_path)
+        )
+    return embedder
+
+
+_embedder: Optional[Embedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Optional[Embedder]:
+    """
+    Returns the shared client-side embedder, or None when vectors are computed by
+    the weaviate vectorizer (see uses_client_side_vectors).
+    """
+    global _embedder
+    if not uses_client_side_vectors(embedding_settings):
+        return None
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = create_embedder(embedding_settings)
+        return _embedder
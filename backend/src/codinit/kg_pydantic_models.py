@@ -0,0 +1,36 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+# Entity records extracted from a parsed code file.
+# They only hold plain data, so they can be sent between processes.
+class ImportRecord(BaseModel):
+    uuid: str
+    name: str
+
+
+class FunctionRecord(BaseModel):
+    uuid: str
+    name: str
+    code: str
+    parameters: List[str] = Field(default_factory=list)
+    variables: List[str] = Field(default_factory=list)
+    return_value: List[str] = Field(default_factory=list)
+
+
+class ClassRecord(BaseModel):
+    uuid: str
+    name: str
+    attributes: List[str] = Field(default_factory=list)
+    methods: List[FunctionRecord] = Field(default_factory=list)
+
+
+class FileRecord(BaseModel):
+    uuid: str
+    name: str
+    link: str
+    content_hash: str
+    imports: List[ImportRecord] = Field(default_factory=list)
+    functions: List[FunctionRecord] = Field(default_factory=list)
+    classes: List[ClassRecord] = Field(default_factory=list)
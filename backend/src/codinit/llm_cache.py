@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from openai.types.chat import ChatCompletion
+
+from codinit.config import LLMCacheSettings, llm_cache_settings
+from codinit.conversation_memory import to_message_dict
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# request parameters of the client that do not change the completion,
+# all other parameters make up the cache key
+CLIENT_PARAMS = {"extra_headers", "extra_query", "extra_body", "timeout"}
+
+# scope of the occurrence numbers of the requests, e.g. a task of a parallel run
+current_scope: ContextVar[str] = ContextVar("llm_cache_scope", default="")
+
+
+@contextmanager
+def llm_cache_scope(scope: str) -> Iterator[None]:
+    """
+    Numbers the requests made in the block, including worker threads started with
+    asyncio.to_thread, separately from the requests of other scopes. Identical
+    requests of concurrent tasks then replay in the order of their own task.
+    """
+    token = current_scope.set(scope)
+    try:
+        yield
+    finally:
+        current_scope.reset(token)
+
+
+class LLMCacheMiss(KeyError):
+    """Raised in replay mode for a request that was not recorded."""
+
+
+class LLMCache:
+    """
+    Cache of chat completions in a SQLite file, keyed by the hash of the messages
+    and all other parameters of a request except the client only ones.
+    - off: requests are sent, nothing is stored
+    - record: requests are sent and their completions stored
+    - replay: completions are read from the file, requests are never sent
+    Identical requests of a run are numbered, so a replay returns the recorded
+    completions in the recorded order, even when sampling made them differ.
+    The numbers are kept per llm_cache_scope, requests of concurrent tasks must
+    run in their own scope to be replayed in parallel.
+    """
+
+    def __init__(self, mode: str = "off", path: str = "") -> None:
+        if mode not in ["off", "record", "replay"]:
+            raise ValueError(f"Unknown LLM cache mode {mode}")
+        self.mode = mode
+        self.occurrences: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        if mode == "off":
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, completion TEXT NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def make_key(self, params: Dict[str, Any]) -> str:
+        """Key of the next occurrence of a request in the current scope of this run."""
+        # parameters set to None are left out, as if they had not been passed
+        request = {
+            name: value
+            for name, value in params.items()
+            if name not in CLIENT_PARAMS and value is not None
+        }
+        request["messages"] = [
+            to_message_dict(message) for message in params["messages"]
+        ]
+        request_hash = hashlib.sha256(
+            json.dumps(request, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        scope = current_scope.get()
+        if scope:
+            request_hash = f"{scope}:{request_hash}"
+        with self.lock:
+            occurrence = self.occurrences[request_hash]
+            self.occurrences[request_hash] += 1
+        return f"{request_hash}:{occurrence}"
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        """Recorded completion of a request, raises LLMCacheMiss in replay mode."""
+        if self.connection is None or self.mode != "replay":
+            return None
+        request_hash = key.rsplit(":", 1)[0]
+        with self.lock:
+            # requests repeated more often than recorded get the first completion
+            row = self.connection.execute(
+                "SELECT completion FROM completions WHERE key IN (?, ?) "
+                "ORDER BY key = ? DESC LIMIT 1",
+                (key, f"{request_hash}:0", key),
+            ).fetchone()
+        if row is None:
+            raise LLMCacheMiss(f"No recorded completion for request {key}")
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key: str, completion: ChatCompletion) -> None:
+        if self.connection is None or self.mode != "record":
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO completions (key, model, completion) "
+                "VALUES (?, ?, ?)",
+                (key, completion.model, completion.model_dump_json()),
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def create_llm_cache(
+    llm_cache_settings: LLMCacheSettings = llm_cache_settings,
+) -> LLMCache:
+    return LLMCache(mode=llm_cache_settings.mode, path=llm_cache_settings.path)
+
+
+def get_llm_cache() -> LLMCache:
+    """Returns the response cache shared by all LLM calls of the process."""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = create_llm_cache(llm_cache_settings)
+            if _llm_cache.enabled:
+                logging.info(f"LLM responses are cached in {_llm_cache.mode} mode")
+        return _llm_cache
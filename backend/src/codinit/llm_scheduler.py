@@ -0,0 +1,374 @@
+import asyncio
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Mapping, Optional
+
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from openai.types.chat import ChatCompletion
+
+from codinit.config import RateLimitSettings, rate_limit_settings, secrets
+from codinit.llm_cache import get_llm_cache
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+RESET_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+RESET_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+# interval at which queued requests check whether it is their turn
+POLL_INTERVAL = 0.05
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds of a rate limit reset header, e.g. "20ms", "1s" or "6m0s".
+    Plain numbers are seconds, as in retry-after.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = RESET_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * RESET_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Bucket refilled continuously up to its capacity, e.g. requests per minute."""
+
+    def __init__(self, capacity: float, per_second: float, now: float) -> None:
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.per_second
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available, requests larger than the bucket wait for a full one."""
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) / self.per_second
+
+    def consume(self, amount: float) -> None:
+        self.level -= amount
+
+    def sync(
+        self, remaining: float, now: float, capacity: Optional[float] = None
+    ) -> None:
+        """
+        Adopts the limit and remaining amount reported by the provider. The provider
+        does not know about requests in flight, so the lower level is kept.
+        """
+        self.refill(now)
+        if capacity:
+            self.capacity = capacity
+            self.per_second = capacity / 60
+        self.level = min(self.level, remaining)
+
+
+class ModelLimits:
+    """Request and token buckets of a model, and requests waiting for them."""
+
+    def __init__(
+        self, requests_per_minute: int, tokens_per_minute: int, now: float
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60, now)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60, now)
+        self.blocked_until = 0.0
+        self.waiting: Deque[int] = deque()
+
+
+class LLMScheduler:
+    """
+    Shares the rate limits of the LLM provider between all callers of a process.
+    Requests of a model are admitted in arrival order once its request and token
+    buckets allow them. The buckets follow the x-ratelimit headers of the responses,
+    and rate limited requests pause the model for the retry-after time before they
+    are retried, instead of sleeping a fixed time each.
+    """
+
+    def __init__(
+        self,
+        rate_limit_settings: RateLimitSettings = rate_limit_settings,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.settings = rate_limit_settings
+        self.clock = clock
+        self.models: Dict[str, ModelLimits] = {}
+        self.tickets = itertools.count()
+        self.condition = threading.Condition()
+
+    def get_limits(self, model: str) -> ModelLimits:
+        if model not in self.models:
+            limits = self.settings.limits_per_model.get(model, {})
+            self.models[model] = ModelLimits(
+                requests_per_minute=limits.get(
+                    "requests_per_minute", self.settings.requests_per_minute
+                ),
+                tokens_per_minute=limits.get(
+                    "tokens_per_minute", self.settings.tokens_per_minute
+                ),
+                now=self.clock(),
+            )
+        return self.models[model]
+
+    def estimate_tokens(
+        self, messages: List[Any], max_tokens: Optional[int] = None
+    ) -> int:
+        """Rough token count of a request, about 4 characters per token."""
+        num_chars = sum(
+            len(json.dumps(message, default=str)) for message in messages or []
+        )
+        return num_chars // 4 + (max_tokens or self.settings.expected_completion_tokens)
+
+    def enqueue(self, model: str) -> int:
+        with self.condition:
+            ticket = next(self.tickets)
+            self.get_limits(model).waiting.append(ticket)
+            return ticket
+
+    def cancel(self, model: str, ticket: int) -> None:
+        with self.condition:
+            waiting = self.get_limits(model).waiting
+            if ticket in waiting:
+                waiting.remove(ticket)
+                self.condition.notify_all()
+
+    def try_acquire(self, model: str, ticket: int, tokens: int) -> float:
+        """Admits the request and returns 0, or returns the seconds to wait."""
+        with self.condition:
+            limits = self.get_limits(model)
+            now = self.clock()
+            if limits.blocked_until > now:
+                return limits.blocked_until - now
+            if limits.waiting[0] != ticket:
+                # requests are admitted in arrival order
+                return POLL_INTERVAL
+            wait = max(
+                limits.requests.wait_time(1, now), limits.tokens.wait_time(tokens, now)
+            )
+            if wait > 0:
+                return wait
+            limits.requests.consume(1)
+            limits.tokens.consume(tokens)
+            limits.waiting.popleft()
+            self.condition.notify_all()
+            return 0.0
+
+    def acquire(self, model: str, tokens: int) -> None:
+        ticket = self.enqueue(model)
+        try:
+            while True:
+                wait = self.try_acquire(model, ticket, tokens)
+                if wait == 0:
+                    return
+                with self.condition:
+                    self.condition.wait(timeout=wait)
+        except BaseException:
+            self.cancel(model, ticket)
+            raise
+
+    async def acquire_async(self, model: str, tokens: int) -> None:
+        ticket = self.enqueue(model)
+        try:
+            while True:
+                wait = self.try_acquire(model, ticket, tokens)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.cancel(model, ticket)
+            raise
+
+    def update_from_headers(self, model: str, headers: Mapping[str, str]) -> None:
+        with self.condition:
+            limits = self.get_limits(model)
+            now = self.clock()
+            for bucket, name in [
+                (limits.requests, "requests"),
+                (limits.tokens, "tokens"),
+            ]:
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                if remaining is None:
+                    continue
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                bucket.sync(
+                    remaining=float(remaining),
+                    now=now,
+                    capacity=float(limit) if limit is not None else None,
+                )
+                reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{name}"))
+                if float(remaining) < 1 and reset:
+                    # nothing left until the provider resets the limit
+                    limits.blocked_until = max(limits.blocked_until, now + reset)
+
+    def on_rate_limited(self, model: str, headers: Mapping[str, str]) -> float:
+        """Pauses all requests of the model for the wait time the provider asked for."""
+        retry_after_ms = headers.get("retry-after-ms")
+        wait = (
+            float(retry_after_ms) / 1000
+            if retry_after_ms
+            else parse_reset_duration(headers.get("retry-after"))
+        )
+        if wait is None:
+            resets = [
+                parse_reset_duration(headers.get(f"x-ratelimit-reset-{name}"))
+                for name in ["requests", "tokens"]
+            ]
+            wait = max(
+                [reset for reset in resets if reset is not None],
+                default=self.settings.default_retry_after,
+            )
+        with self.condition:
+            limits = self.get_limits(model)
+            limits.blocked_until = max(limits.blocked_until, self.clock() + wait)
+        self.update_from_headers(model, headers)
+        return wait
+
+    def record_usage(self, model: str, estimated_tokens: int, used_tokens: int):
+        """Corrects the token bucket by the difference of estimated and used tokens."""
+        with self.condition:
+            self.get_limits(model).tokens.consume(used_tokens - estimated_tokens)
+
+    def complete(
+        self, model: str, request: Callable[[], Any], estimated_tokens: int
+    ) -> ChatCompletion:
+        """
+        Sends a raw response request, e.g. chat.completions.with_raw_response.create,
+        when the limits allow it, retrying it when it is rate limited.
+        """
+        for attempt in range(self.settings.max_retries + 1):
+            self.acquire(model, estimated_tokens)
+            try:
+                raw_response = request()
+            except RateLimitError as e:
+                wait = self.on_rate_limited(model, e.response.headers)
+                if attempt == self.settings.max_retries:
+                    raise
+                logging.warning(f"Rate limit reached for {model=}, retry in {wait}s")
+                continue
+            return self.handle_response(model, raw_response, estimated_tokens)
+        raise RuntimeError("unreachable")
+
+    async def complete_async(
+        self,
+        model: str,
+        request: Callable[[], Awaitable[Any]],
+        estimated_tokens: int,
+    ) -> ChatCompletion:
+        """Async variant of complete."""
+        for attempt in range(self.settings.max_retries + 1):
+            await self.acquire_async(model, estimated_tokens)
+            try:
+                raw_response = await request()
+            except RateLimitError as e:
+                wait = self.on_rate_limited(model, e.response.headers)
+                if attempt == self.settings.max_retries:
+                    raise
+                logging.warning(f"Rate limit reached for {model=}, retry in {wait}s")
+                continue
+            return self.handle_response(model, raw_response, estimated_tokens)
+        raise RuntimeError("unreachable")
+
+    def handle_response(
+        self, model: str, raw_response: Any, estimated_tokens: int
+    ) -> ChatCompletion:
+        completion = raw_response.parse()
+        if completion.usage is not None:
+            self.record_usage(model, estimated_tokens, completion.usage.total_tokens)
+        # the remaining amounts of the provider have the last word
+        self.update_from_headers(model, raw_response.headers)
+        return completion
+
+
+_llm_scheduler: Optional[LLMScheduler] = None
+_openai_client: Optional[OpenAI] = None
+_async_openai_client: Optional[AsyncOpenAI] = None
+_clients_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Returns the scheduler shared by all LLM calls of the process."""
+    global _llm_scheduler
+    with _clients_lock:
+        if _llm_scheduler is None:
+            _llm_scheduler = LLMScheduler(rate_limit_settings)
+        return _llm_scheduler
+
+
+def get_openai_client() -> OpenAI:
+    """OpenAI client of the scheduled calls, the scheduler handles the retries."""
+    global _openai_client
+    with _clients_lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(api_key=secrets.openai_api_key, max_retries=0)
+        return _openai_client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Returns the AsyncOpenAI client shared by the async agent calls."""
+    global _async_openai_client
+    with _clients_lock:
+        if _async_openai_client is None:
+            _async_openai_client = AsyncOpenAI(
+                api_key=secrets.openai_api_key, max_retries=0
+            )
+        return _async_openai_client
+
+
+def create_chat_completion(**params: Any) -> ChatCompletion:
+    """
+    chat.completions.create through the shared scheduler, answered from the
+    LLM response cache in replay mode.
+    """
+    llm_cache = get_llm_cache()
+    key = llm_cache.make_key(params) if llm_cache.enabled else ""
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    scheduler = get_llm_scheduler()
+    completion = scheduler.complete(
+        model=params["model"],
+        request=lambda: get_openai_client().chat.completions.with_raw_response.create(
+            **params
+        ),
+        estimated_tokens=scheduler.estimate_tokens(
+            params["messages"], params.get("max_tokens")
+        ),
+    )
+    llm_cache.put(key, completion)
+    return completion
+
+
+async def create_chat_completion_async(**params: Any) -> ChatCompletion:
+    """Async variant of create_chat_completion."""
+    llm_cache = get_llm_cache()
+    key = llm_cache.make_key(params) if llm_cache.enabled else ""
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    scheduler = get_llm_scheduler()
+    completion = await scheduler.complete_async(
+        model=params["model"],
+        request=lambda: get_async_openai_client().chat.completions.with_raw_response.create(
+            **params
+        ),
+        estimated_tokens=scheduler.estimate_tokens(
+            params["messages"], params.get("max_tokens")
+        ),
+    )
+    llm_cache.put(key, completion)
+    return completion
@@ -1,12 +1,22 @@
 import csv
+import logging
+import os
 import subprocess
-from typing import Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import IO, TYPE_CHECKING, Any, List, Mapping, Tuple
 
 from codinit.code_editor import PythonCodeEditor
-from codinit.config import eval_settings
+from codinit.config import EvalSettings, eval_settings
 from codinit.documentation.pydantic_models import Library
 from codinit.experiment_tracking.experiment_pydantic_models import TaskExecutionConfig
+from codinit.llm_cache import llm_cache_scope
 from codinit.task_executor import TaskExecutor
+from codinit.weaviate_client import get_weaviate_client
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
 
 TASKS = [
     "using langchain library, write code that answers a question over a given text.",
@@ -42,6 +52,72 @@ def get_git_info() -> Tuple[str, str]:
     return sha, message
 
 
+if TYPE_CHECKING:
+    DictWriter = csv.DictWriter[str]
+else:
+    DictWriter = csv.DictWriter
+
+
+class SerializedDictWriter(DictWriter):
+    """
+    DictWriter shared by the tasks of a parallel run, rows are written one at a time
+    and flushed, so rows of concurrent tasks never interleave.
+    """
+
+    def __init__(self, f: IO[str], fieldnames: List[str]) -> None:
+        super().__init__(f, fieldnames=fieldnames)
+        self.file = f
+        self.lock = threading.Lock()
+
+    def writerow(self, rowdict: Mapping[str, Any]) -> Any:
+        with self.lock:
+            result = super().writerow(rowdict)
+            self.file.flush()
+            return result
+
+
+def get_task_dir(
+    run_id: int, task_id: int, eval_settings: EvalSettings = eval_settings
+) -> str:
+    """Working directory of a task, its code editor writes and runs its code there."""
+    task_dir = os.path.join(eval_settings.workdir, f"run_{run_id}", f"task_{task_id}")
+    os.makedirs(task_dir, exist_ok=True)
+    return task_dir
+
+
+def run_task(task_executor: TaskExecutor, library: Library) -> str:
+    print("---------new_task-----------")
+    # requests are numbered per task, so parallel runs replay like serial ones
+    with llm_cache_scope(f"task_{task_executor.task_id}"):
+        return task_executor.execute_and_log(library=library, source_code="")
+
+
+def run_tasks(
+    task_executors: List[TaskExecutor], library: Library, num_workers: int
+) -> None:
+    """
+    Runs the tasks one after another, or with num_workers threads. Tasks mostly wait
+    for LLM responses and subprocesses, so threads let them overlap.
+    """
+    if num_workers <= 1:
+        for task_executor in task_executors:
+            run_task(task_executor, library)
+        return
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        futures = {
+            pool.submit(run_task, task_executor, library): task_executor
+            for task_executor in task_executors
+        }
+        for future in as_completed(futures):
+            task_id = futures[future].task_id
+            try:
+                future.result()
+                logging.info(f"Finished task {task_id}")
+            except Exception as e:
+                # a failed task does not stop the other tasks of the run
+                logging.error(f"Task {task_id} failed: {e}")
+
+
 def main():
     # Get git info
     sha, message = get_git_info()
@@ -49,7 +125,7 @@ def main():
     # Open or create CSV file for appending
     with open(eval_settings.eval_dataset_location, "a+", newline="") as csvfile:
         fieldnames = [fieldname for fieldname in eval_settings.eval_columns]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = SerializedDictWriter(csvfile, fieldnames=fieldnames)
 
         # Check if the CSV is empty, if so, write the header
         csvfile.seek(0)
@@ -66,8 +142,11 @@ def main():
                 pass
 
         run_id = last_run_id + 1
+        task_executors = []
         for task_id, task in enumerate(TASKS):
-            code_editor = PythonCodeEditor()
+            code_editor = PythonCodeEditor(
+                filename="magic_code.py", workdir=get_task_dir(run_id, task_id)
+            )
             config = TaskExecutionConfig()
             task_executor = TaskExecutor(
                 code_editor=code_editor,
@@ -78,9 +157,14 @@ def main():
                 sha=sha,
                 message=message,
                 csv_writer=writer,
+                library_prepared=True,
             )
-            print("---------new_task-----------")
-            task_executor.execute_and_log(library=library, source_code="")
+            task_executors.append(task_executor)
+        # all tasks use the same library, scrape and index it once
+        task_executors[0].prepare_library(library=library, client=get_weaviate_client())
+        run_tasks(
+            task_executors, library=library, num_workers=eval_settings.num_workers
+        )
 
 
 if __name__ == "__main__":
@@ -314,3 +314,8 @@ linter_user_prompt_template = """
 Source Code: {source_code}
 Linting Errors: {linter_output}
 """
+
+history_summarizer_system_prompt = """
+You will receive the earlier part of a conversation between a user and a coding agent.
+Summarize it in a few sentences. Keep the task, the decisions taken, the code that was written and the errors that were found.
+"""
@@ -1,35 +1,150 @@
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional
 
+import weaviate
 import weaviate.classes as wvc
+from pydantic import BaseModel, Field
+from weaviate.exceptions import WeaviateBaseError
 
-from codinit.weaviate_client import get_weaviate_client
+from codinit.config import weaviate_settings
+from codinit.embeddings import get_embedder
+from codinit.weaviate_client import weaviate_connection
 
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
 
+def near_text(collection, query: str, **kwargs):
+    """near_text query, which embeds the query client-side if an embedder is configured."""
+    embedder = get_embedder()
+    if embedder is None:
+        return collection.query.near_text(query=query, **kwargs)
+    return collection.query.near_vector(
+        near_vector=embedder.embed_query(query), **kwargs
+    )
+
+
+# properties and references (by name) returned by the queries of each collection
+RETURN_PROPERTIES = {
+    "File": ["name"],
+    "Class": ["name"],
+    "Import": ["name"],
+    "Function": ["name", "code", "parameters", "variables", "return_value"],
+}
+RETURN_REFERENCES = {
+    "File": ["hasImport", "hasClass", "hasFunction"],
+    "Class": ["hasFunction"],
+    "Import": ["belongsToFile"],
+    "Function": ["belongsToFile", "belongsToClass"],
+}
+
+
+class KGQuery(BaseModel):
+    """A semantic (near_text) or keyword (bm25) search in a collection of the KG."""
+
+    collection: str
+    query: str
+    search: Literal["near_text", "bm25"] = "near_text"
+    k: int = 1
+
+
+class KGObject(BaseModel):
+    uuid: str
+    properties: Dict[str, Any]
+    # names of the referenced objects
+    references: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+class KGQueryResult(BaseModel):
+    query: KGQuery
+    objects: List[KGObject] = Field(default_factory=list)
+    error: Optional[str] = None
+
+
+def search_collection(
+    client: weaviate.WeaviateClient,
+    query: KGQuery,
+    vector: Optional[List[float]] = None,
+):
+    """Runs one query, near_text queries use the vector when it is computed already."""
+    collection = client.collections.get(query.collection)
+    kwargs: Dict[str, Any] = dict(
+        return_properties=RETURN_PROPERTIES.get(query.collection, ["name"]),
+        return_references=[
+            wvc.query.QueryReference(link_on=reference, return_properties=["name"])
+            for reference in RETURN_REFERENCES.get(query.collection, [])
+        ],
+        limit=query.k,
+    )
+    if query.search == "bm25":
+        return collection.query.bm25(
+            query=query.query, query_properties=["name"], **kwargs
+        )
+    if vector is not None:
+        return collection.query.near_vector(near_vector=vector, **kwargs)
+    return near_text(collection, query=query.query, **kwargs)
+
+
+def to_kg_object(obj) -> KGObject:
+    return KGObject(
+        uuid=str(obj.uuid),
+        properties=dict(obj.properties),
+        references={
+            name: [referenced.properties["name"] for referenced in reference.objects]
+            for name, reference in (obj.references or {}).items()
+        },
+    )
+
+
+def run_queries(
+    queries: List[KGQuery], max_workers: int = weaviate_settings.query_workers
+) -> List[KGQueryResult]:
+    """
+    Runs many queries concurrently over the shared weaviate client and returns
+    their results in the order of the queries. With a client-side embedder, all
+    near_text queries are embedded in a single call. A failed query has its error
+    set instead of failing the batch.
+    """
+    if not queries:
+        return []
+    vectors: List[Optional[List[float]]] = [None] * len(queries)
+    embedder = get_embedder()
+    if embedder is not None:
+        semantic = [i for i, query in enumerate(queries) if query.search == "near_text"]
+        if semantic:
+            embedded = embedder.embed([queries[i].query for i in semantic])
+            for i, vector in zip(semantic, embedded):
+                vectors[i] = vector
+
+    with weaviate_connection() as client:
+
+        def run_query(i: int) -> KGQueryResult:
+            try:
+                result = search_collection(client, queries[i], vector=vectors[i])
+            except WeaviateBaseError as e:
+                logging.error(f"Query {queries[i]} failed: {e}")
+                return KGQueryResult(query=queries[i], error=str(e))
+            return KGQueryResult(
+                query=queries[i],
+                objects=[to_kg_object(obj) for obj in result.objects],
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(run_query, range(len(queries))))
+
+
 def get_files(prompt: str, k: int = 1) -> str:
     """Returns code file relevant for a given prompt
     Args:
         prompt: str, description of the file to search for.
         k: int, the number of most similar files to the prompt to be returned by the query.
     """
-    client = get_weaviate_client()
-    client.connect()
-    file_collection = client.collections.get("File")
-    result = file_collection.query.near_text(
-        query=prompt,
-        return_properties=["name"],
-        return_references=[
-            wvc.query.QueryReference(link_on="hasImport", return_properties=["name"]),
-            wvc.query.QueryReference(link_on="hasClass", return_properties=["name"]),
-            wvc.query.QueryReference(link_on="hasFunction", return_properties=["name"]),
-        ],
-        limit=k,
-    )
-    client.close()
+    with weaviate_connection() as client:
+        result = search_collection(
+            client, KGQuery(collection="File", query=prompt, k=k)
+        )
     files = result.objects
     logging.info(f"file objects query {files=}")
     query_result = "found the following files: "
@@ -57,18 +172,10 @@ def get_classes(prompt: str, k: int = 1) -> str:
         prompt: str, description of the class to search for.
         k: int, the number of most similar classes to the prompt to be returned by the query.
     """
-    client = get_weaviate_client()
-    client.connect()
-    class_collection = client.collections.get("Class")
-    result = class_collection.query.near_text(
-        query=prompt,
-        return_properties=["name"],
-        return_references=[
-            wvc.query.QueryReference(link_on="hasFunction", return_properties=["name"])
-        ],
-        limit=k,
-    )
-    client.close()
+    with weaviate_connection() as client:
+        result = search_collection(
+            client, KGQuery(collection="Class", query=prompt, k=k)
+        )
     classes = result.objects
     logging.info(f"class objects query{classes=}")
     query_result = "found the following classes: "
@@ -88,20 +195,10 @@ def get_imports(prompt: str, k: int = 1) -> str:
         prompt: str, description of the import to search for.
         k: int, the number of most similar imports to the prompt to be returned by the query.
     """
-    client = get_weaviate_client()
-    client.connect()
-    import_collection = client.collections.get("Import")
-    result = import_collection.query.near_text(
-        query=prompt,
-        return_properties=["name"],
-        return_references=[
-            wvc.query.QueryReference(
-                link_on="belongsToFile", return_properties=["name"]
-            )
-        ],
-        limit=k,
-    )
-    client.close()
+    with weaviate_connection() as client:
+        result = search_collection(
+            client, KGQuery(collection="Import", query=prompt, k=k)
+        )
     imports = result.objects
     logging.info(f"import bjects query{imports=}")
     query_result = "found the following imports:"
@@ -121,23 +218,10 @@ def get_functions(prompt: str, k: int = 1) -> str:
         prompt: str, description of the function to search for.
         k: int, the number of most similar functions to the prompt to be returned by the query.
     """
-    client = get_weaviate_client()
-    client.connect()
-    function_collection = client.collections.get("Function")
-    result = function_collection.query.near_text(
-        query=prompt,
-        return_properties=["name", "code", "parameters", "variables", "return_value"],
-        return_references=[
-            wvc.query.QueryReference(
-                link_on="belongsToFile", return_properties=["name"]
-            ),
-            wvc.query.QueryReference(
-                link_on="belongsToClass", return_properties=["name"]
-            ),
-        ],
-        limit=k,
-    )
-    client.close()
+    with weaviate_connection() as client:
+        result = search_collection(
+            client, KGQuery(collection="Function", query=prompt, k=k)
+        )
     functions = result.objects
     logging.info(f"function objects query{functions=}")
     query_result = "found the following functions: "
@@ -155,24 +239,27 @@ def get_functions(prompt: str, k: int = 1) -> str:
     return query_result
 
 
-def get_exact_imports(query: str, k: int = 1) -> str:
+def get_exact_imports(query: str, k: int = 1) -> List[KGObject]:
     """Returns exact imports relevant for a given prompt"""
-    client = get_weaviate_client()
-    client.connect()
-    import_collection = client.collections.get("Import")
-    result = import_collection.query.bm25(query=query, properties=["name"], limit=k)
-    client.close()
-    return result.objects
+    return get_imports_from_kg(import_list=[query], k=k)[query]
 
 
-def get_imports_from_kg(import_list: List[str], library_name: str, k=10):
-    """Returns exact imports relevant for a given prompt"""
-
-    result = {}
-    for import_name in import_list:
-        exists_in_weaviate_kg = get_exact_imports(query=import_name, k=k)
-        result[import_name] = exists_in_weaviate_kg
-    return result
+def get_imports_from_kg(
+    import_list: List[str], library_name: Optional[str] = None, k=10
+) -> Dict[str, List[KGObject]]:
+    """
+    Returns the imports of the KG matching each import name, looked up with
+    concurrent keyword searches in a single batch.
+    """
+    results = run_queries(
+        [
+            KGQuery(collection="Import", query=import_name, search="bm25", k=k)
+            for import_name in import_list
+        ]
+    )
+    return {
+        import_name: result.objects for import_name, result in zip(import_list, results)
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,316 @@
+import atexit
+import difflib
+import logging
+import mmap
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import weaviate
+from weaviate.classes.query import QueryReference
+
+from codinit.config import IngestionSettings, ingestion_settings
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+def get_symbol_index_path(
+    libname: str, ingestion_settings: IngestionSettings = ingestion_settings
+) -> str:
+    return os.path.join(ingestion_settings.symbol_index_dir, f"{libname}.symbols")
+
+
+def get_module_name(link: str, repo_dir: str) -> str:
+    """
+    Dotted module name of a file of a repository. Leading directories that are not
+    packages, e.g. "src" or "libs/core", are no part of the name.
+    """
+    relative_path = os.path.relpath(link, repo_dir)
+    directory, file_name = os.path.split(relative_path)
+    module_name = os.path.splitext(file_name)[0]
+    parts = [] if module_name == "__init__" else [module_name]
+    while directory and os.path.isfile(
+        os.path.join(repo_dir, directory, "__init__.py")
+    ):
+        directory, package = os.path.split(directory)
+        parts.insert(0, package)
+    return ".".join(parts)
+
+
+def get_file_symbols(
+    module_name: str,
+    imports: Iterable[str] = (),
+    classes: Optional[Dict[str, List[str]]] = None,
+    functions: Iterable[str] = (),
+) -> Set[str]:
+    """
+    Fully qualified names defined by a module: the module and its parent packages,
+    its classes with their methods, its functions, and the names it imports,
+    which are attributes of the module as well (re-exports), under their alias if
+    they have one, e.g. "pkg.core.Agent as PublicAgent".
+    """
+    if not module_name:
+        return set()
+    parts = module_name.split(".")
+    symbols = {".".join(parts[: i + 1]) for i in range(len(parts))}
+    for import_name in imports:
+        # star imports are not resolved, their names are checked in the venv
+        import_name, _, alias = import_name.partition(" as ")
+        bound_name = alias or import_name.rsplit(".", 1)[-1]
+        if bound_name and bound_name != "*":
+            symbols.add(f"{module_name}.{bound_name}")
+    for class_name, methods in (classes or {}).items():
+        symbols.add(f"{module_name}.{class_name}")
+        symbols.update(f"{module_name}.{class_name}.{method}" for method in methods)
+    symbols.update(f"{module_name}.{function}" for function in functions)
+    return symbols
+
+
+def iter_kg_symbols(repo_dir: str, client: weaviate.WeaviateClient) -> Iterator[str]:
+    """Yields the symbols of all files of a repository in the KG."""
+    client.connect()
+    file_collection = client.collections.get("File")
+    # the separator keeps e.g. <repo_dir>/langchain_experimental out of <repo_dir>/langchain
+    directory_prefix = os.path.join(repo_dir, "")
+    for file_obj in file_collection.iterator(
+        return_properties=["link"],
+        return_references=[
+            QueryReference(link_on="hasImport", return_properties=["name"]),
+            QueryReference(link_on="hasFunction", return_properties=["name"]),
+            QueryReference(
+                link_on="hasClass",
+                return_properties=["name"],
+                return_references=QueryReference(
+                    link_on="hasFunction", return_properties=["name"]
+                ),
+            ),
+        ],
+    ):
+        link = file_obj.properties.get("link")
+        if not link or not link.startswith(directory_prefix):
+            continue
+        references = file_obj.references or {}
+
+        def names(reference: str) -> List[Tuple[str, str]]:
+            if reference not in references:
+                return []
+            return [
+                (str(obj.uuid), obj.properties["name"])
+                for obj in references[reference].objects
+            ]
+
+        classes: Dict[str, List[str]] = {}
+        method_ids: Set[str] = set()
+        for class_obj in (
+            references["hasClass"].objects if "hasClass" in references else []
+        ):
+            methods = (class_obj.references or {}).get("hasFunction")
+            method_objs = methods.objects if methods else []
+            classes.setdefault(class_obj.properties["name"], []).extend(
+                method.properties["name"] for method in method_objs
+            )
+            method_ids.update(str(method.uuid) for method in method_objs)
+        # the hasFunction references of a file include the methods of its classes
+        functions = [
+            name for uuid, name in names("hasFunction") if uuid not in method_ids
+        ]
+        yield from get_file_symbols(
+            module_name=get_module_name(link, repo_dir),
+            imports=[name for _, name in names("hasImport")],
+            classes=classes,
+            functions=functions,
+        )
+
+
+def write_symbol_index(symbols: Iterable[str], path: str) -> int:
+    """
+    Writes the symbols as sorted, newline terminated UTF-8 lines, the format
+    SymbolIndex binary searches in place. Returns the number of symbols.
+    """
+    lines = sorted({symbol.encode() for symbol in symbols if symbol})
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # replace the index atomically, readers may have the previous file mapped
+    part_path = path + ".part"
+    with open(part_path, "wb") as f:
+        for line in lines:
+            f.write(line + b"\n")
+    os.replace(part_path, path)
+    return len(lines)
+
+
+def build_symbol_index(
+    repo_dir: str,
+    libname: str,
+    client: weaviate.WeaviateClient,
+    ingestion_settings: IngestionSettings = ingestion_settings,
+) -> str:
+    """Derives the symbol index of a library from its KG, returns the index path."""
+    path = get_symbol_index_path(libname, ingestion_settings)
+    num_symbols = write_symbol_index(iter_kg_symbols(repo_dir, client), path)
+    logging.info(f"Wrote {num_symbols} symbols of {libname=} to {path}")
+    return path
+
+
+class SymbolIndex:
+    """
+    Read-only index of the fully qualified names of a library. The sorted symbol file
+    is memory mapped and binary searched, so opening it is constant time and lookups
+    need O(log n) comparisons, without weaviate or the virtualenv of the library.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.file = open(path, "rb")
+        # an empty file cannot be mapped
+        self.data: Union[mmap.mmap, bytes] = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.getsize(path)
+            else b""
+        )
+
+    def __enter__(self) -> "SymbolIndex":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _line_end(self, position: int) -> int:
+        """End of the line containing position, the last line may miss its newline."""
+        end = self.data.find(b"\n", position)
+        return len(self.data) if end == -1 else end
+
+    def _line(self, position: int) -> Tuple[int, int]:
+        """Start and end of the line containing position."""
+        start = self.data.rfind(b"\n", 0, position) + 1
+        return start, self._line_end(position)
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Offset of the first line not smaller than key."""
+        low, high = 0, len(self.data)
+        # low and high are always line starts, or the end of the data
+        while low < high:
+            start, end = self._line((low + high) // 2)
+            if self.data[start:end] < key:
+                low = end + 1
+            else:
+                high = start
+        return low
+
+    def __contains__(self, name: str) -> bool:
+        key = name.encode()
+        start = self._lower_bound(key)
+        return (
+            start < len(self.data) and self.data[start : self._line_end(start)] == key
+        )
+
+    def iter_prefix(self, prefix: str) -> Iterator[str]:
+        """Yields the symbols starting with prefix in sorted order."""
+        key = prefix.encode()
+        position = self._lower_bound(key)
+        while position < len(self.data):
+            end = self._line_end(position)
+            line = self.data[position:end]
+            if not line.startswith(key):
+                return
+            yield line.decode()
+            position = end + 1
+
+    def complete(self, prefix: str, limit: int = 20) -> List[str]:
+        completions: List[str] = []
+        for symbol in self.iter_prefix(prefix):
+            if len(completions) == limit:
+                break
+            completions.append(symbol)
+        return completions
+
+    def children(self, parent: str) -> List[str]:
+        """Names of the direct members of a module or class."""
+        members = []
+        for symbol in self.iter_prefix(parent + "."):
+            member = symbol[len(parent) + 1 :]
+            if "." not in member:
+                members.append(member)
+        return members
+
+    def suggest(self, name: str, n: int = 3, cutoff: float = 0.6) -> List[str]:
+        """
+        Close matches of a missing name among the members of its deepest existing
+        parent, e.g. langchain.agents.AgentExecuter -> langchain.agents.AgentExecutor.
+        """
+        parts = name.split(".")
+        for depth in range(len(parts) - 1, 0, -1):
+            parent = ".".join(parts[:depth])
+            if parent in self:
+                matches = difflib.get_close_matches(
+                    ".".join(parts[depth:]),
+                    [
+                        symbol[len(parent) + 1 :]
+                        for symbol in self.iter_prefix(parent + ".")
+                    ],
+                    n=n,
+                    cutoff=cutoff,
+                )
+                return [f"{parent}.{match}" for match in matches]
+        return []
+
+    def validate(self, import_list: List[str]) -> Dict[str, bool]:
+        """Same result as checks.check_import_existence.validate_imports."""
+        result = {import_name: import_name in self for import_name in import_list}
+        for import_name, exists in result.items():
+            if not exists:
+                logging.info(
+                    f"{import_name=} not found, did you mean {self.suggest(import_name)}"
+                )
+        return result
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __del__(self) -> None:
+        # the attributes are missing if opening the file failed
+        if hasattr(self, "data"):
+            self.close()
+
+
+_symbol_indexes: Dict[str, SymbolIndex] = {}
+_symbol_indexes_lock = threading.Lock()
+
+
+def get_symbol_index(
+    libname: str, ingestion_settings: IngestionSettings = ingestion_settings
+) -> Optional[SymbolIndex]:
+    """
+    Returns the shared symbol index of a library, reopened after the index was
+    rebuilt, or None if the library has not been indexed.
+    """
+    path = get_symbol_index_path(libname, ingestion_settings)
+    with _symbol_indexes_lock:
+        if not os.path.isfile(path):
+            return None
+        symbol_index = _symbol_indexes.get(path)
+        if symbol_index is None or symbol_index.mtime != os.path.getmtime(path):
+            # other threads may still use the previous index, it is closed
+            # when it is garbage collected
+            symbol_index = SymbolIndex(path)
+            _symbol_indexes[path] = symbol_index
+        return symbol_index
+
+
+def close_symbol_indexes() -> None:
+    """
+    Closes the shared symbol indexes, they are reopened on their next use.
+    Only call it when no thread uses them anymore, e.g. at exit.
+    """
+    with _symbol_indexes_lock:
+        for symbol_index in _symbol_indexes.values():
+            symbol_index.close()
+        _symbol_indexes.clear()
+
+
+atexit.register(close_symbol_indexes)
@@ -1,13 +1,12 @@
 import ast
+import asyncio
 import logging
 from csv import DictWriter
 from datetime import datetime
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-import openai
 import requests
 import weaviate
-from apify_client import ApifyClient
 from pydantic import BaseModel
 
 from codinit.agents import (
@@ -19,12 +18,16 @@ from codinit.agents import (
 )
 from codinit.code_editor import PythonCodeEditor
 from codinit.codebaseKG import run_codebase_analysis
-from codinit.config import eval_settings, secrets
+from codinit.config import documentation_settings, eval_settings, secrets
 
 # from codinit.get_context import get_embedding_store, get_read_the_docs_context
+from codinit.documentation.context_assembly import count_tokens
 from codinit.documentation.get_context import WeaviateDocLoader, WeaviateDocQuerier
-from codinit.documentation.pydantic_models import Library
-from codinit.documentation.save_document import ScraperSaver
+from codinit.documentation.pydantic_models import Library, RescrapeResult
+from codinit.documentation.save_document import (
+    ScraperSaver,
+    scrape_and_save_libraries_async,
+)
 from codinit.experiment_tracking.experiment_logger import ExperimentLogger
 from codinit.experiment_tracking.experiment_pydantic_models import (
     CodeGeneration,
@@ -36,6 +39,7 @@ from codinit.experiment_tracking.experiment_pydantic_models import (
     LintingAttempt,
     TaskExecutionConfig,
 )
+from codinit.llm_scheduler import create_chat_completion, create_chat_completion_async
 from codinit.weaviate_client import get_weaviate_client
 
 logger = logging.getLogger(__name__)
@@ -60,25 +64,27 @@ class TaskExecutor:
         task_id: int,
         sha: str,
         message: str,
-        csv_writer: DictWriter,
+        csv_writer: "DictWriter[str]",
+        library_prepared: bool = False,
     ) -> None:
         self.code_editor = code_editor
         self.config = config
 
+        # every task gets its own agent sessions, so histories do not grow across tasks
         # Planner
-        self.planner = planner_agent
+        self.planner = planner_agent.new_session()
 
         # Coder
-        self.coder = coding_agent
+        self.coder = coding_agent.new_session()
 
         # Dependency tracker
-        self.dependency_tracker = dependency_agent
+        self.dependency_tracker = dependency_agent.new_session()
 
         # Code corrector
-        self.code_corrector = code_correcting_agent
+        self.code_corrector = code_correcting_agent.new_session()
 
         # linter
-        self.linter = linting_agent
+        self.linter = linting_agent.new_session()
 
         self.task = task
         self.run_id = run_id
@@ -86,6 +92,8 @@ class TaskExecutor:
         self.sha = (sha,)
         self.message = (message,)
         self.csv_writer = csv_writer
+        # libraries shared by several tasks are scraped and indexed once up front
+        self.library_prepared = library_prepared
         self.experiment_logger: ExperimentLogger = ExperimentLogger()
 
     def install_dependencies(self, deps: List[str]) -> str:
@@ -164,14 +172,40 @@ class TaskExecutor:
         return relevant_docs
     """
 
-    def scrape_docs(self, library: Library):
-        client = ApifyClient(secrets.apify_key)
-        scraper_saver = ScraperSaver(libname=library.libname, apify_client=client)
-        scraper_saver.scrape_and_save_apify_docs(urls=library.links)
+    def scrape_docs(self, libraries: List[Library]) -> Dict[str, RescrapeResult]:
+        """
+        Scrapes the documentation of the libraries that have not been saved yet
+        concurrently, and refreshes saved documentation if enabled.
+        Returns the rescrapes of the refreshed libraries.
+        """
+        # the scraper backend is set in the documentation settings
+        rescrape_results = {}
+        for library in libraries:
+            scraper_saver = ScraperSaver(libname=library.libname)
+            if (
+                documentation_settings.refresh_docs
+                and scraper_saver.check_lib_docs_saved()
+            ):
+                rescrape_results[library.libname] = scraper_saver.refresh_docs(
+                    urls=library.links
+                )
+        new_libraries = [
+            library for library in libraries if library.libname not in rescrape_results
+        ]
+        asyncio.run(scrape_and_save_libraries_async(libraries=new_libraries))
+        return rescrape_results
 
-    def init_library(self, library: Library, client: weaviate.Client):
+    def init_library(
+        self,
+        library: Library,
+        client: weaviate.Client,
+        rescrape_result: Optional[RescrapeResult] = None,
+    ):
         weaviate_doc_loader = WeaviateDocLoader(library=library, client=client)
-        weaviate_doc_loader.run()
+        if rescrape_result is not None:
+            weaviate_doc_loader.refresh(rescrape_result)
+        else:
+            weaviate_doc_loader.run()
         run_codebase_analysis(
             repo_dir=secrets.repo_dir,
             libname=library.libname,
@@ -179,57 +213,143 @@ class TaskExecutor:
             client=client,
         )
 
+    def prepare_libraries(self, libraries: List[Library], client: weaviate.Client):
+        """Scrapes the documentation of libraries and loads it and their code into the KG."""
+        rescrape_results = self.scrape_docs(libraries=libraries)
+        for library in libraries:
+            self.init_library(
+                library=library,
+                client=client,
+                rescrape_result=rescrape_results.get(library.libname),
+            )
+
+    def prepare_library(self, library: Library, client: weaviate.Client):
+        self.prepare_libraries(libraries=[library], client=client)
+
     def get_docs(self, library: Library, task: str, client: weaviate.Client):
-        self.scrape_docs(library=library)
-        self.init_library(library=library, client=client)
+        if not self.library_prepared:
+            self.prepare_library(library=library, client=client)
         weaviate_doc_querier = WeaviateDocQuerier(library=library, client=client)
         docs = weaviate_doc_querier.get_relevant_documents(query=task)
         logger.info(f"relevant_docs: {docs}")
         return docs
 
-    def initial_code_generation(
-        self, library: Library, client: weaviate.WeaviateClient
-    ) -> InitialCode:
-        # chat_history = []
-        # Generating a coding plan
-        time_stamp = datetime.now()
-        relevant_docs = self.get_docs(library=library, task=self.task, client=client)
+    async def get_docs_async(
+        self, library: Library, task: str, client: weaviate.Client
+    ) -> str:
+        # scraping, loading and querying use blocking clients, run them in a thread
+        return await asyncio.to_thread(self.get_docs, library, task, client)
 
-        # generate coding plan given context
-        plan = self.planner.execute(
+    def planner_request(self, relevant_docs: str) -> Dict[str, Any]:
+        return dict(
             tool_choice="execute_plan",
             chat_history=[],
             task=self.task,
             context=relevant_docs,
-        )[0]
-        # install dependencies from plan
-        if self.config.execute_code and self.config.install_dependencies:
-            deps = self.dependency_tracker.execute(
-                tool_choice="install_dependencies", chat_history=[], plan=plan
-            )[0]
-            self.install_dependencies(deps)
-        # chat_history.append(
-        #     {"role": "assistant", "content": f"installed dependencies {deps}"}
-        # )
-        # generate code
+        )
+
+    def dependency_request(self, plan: List[str]) -> Dict[str, Any]:
+        return dict(tool_choice="install_dependencies", chat_history=[], plan=plan)
+
+    def coder_request(self, plan: List[str], relevant_docs: str) -> Dict[str, Any]:
         # TODO grab thought from code execution function
-        new_code = self.coder.execute(
+        return dict(
             task=self.task,
             tool_choice="execute_code",
             chat_history=[],
             plan=plan,
             context=relevant_docs,
-        )[0]
-        initial_code = InitialCode(
+        )
+
+    def corrector_request(
+        self,
+        source_code: str,
+        relevant_docs: str,
+        error: Union[str, List[str], None],
+    ) -> Dict[str, Any]:
+        # TODO extract thought from code execution function
+        return dict(
+            tool_choice="execute_code",
+            chat_history=[],
+            task=self.task,
+            context=relevant_docs,
+            source_code=source_code,
+            error=error,
+        )
+
+    def lint_response_request(self) -> Dict[str, Any]:
+        """Completion explaining the linter findings gathered by the linting agent."""
+        return dict(model="gpt-3.5-turbo-1106", messages=self.linter.messages)
+
+    @property
+    def should_install_dependencies(self) -> bool:
+        return self.config.execute_code and self.config.install_dependencies
+
+    def build_initial_code(
+        self,
+        time_stamp: datetime,
+        relevant_docs: str,
+        plan: List[str],
+        deps: List[str],
+        new_code: str,
+    ) -> InitialCode:
+        return InitialCode(
             Timestamp=time_stamp,
             Documentation_Scraping=DocumentationScraping(
-                Relevant_Docs=relevant_docs, num_tokens=len(relevant_docs)
+                Relevant_Docs=relevant_docs,
+                num_tokens=count_tokens(
+                    relevant_docs, encoding=documentation_settings.tokenizer
+                ),
             ),
             Generated_Plan=GeneratedPlan(Plan=plan),
             Dependencies=Dependencies(Dependencies=deps),
             Coding_Agent=CodeGeneration(Generated_Code=new_code, Thought=""),
         )
-        return initial_code
+
+    def initial_code_generation(
+        self, library: Library, client: weaviate.WeaviateClient
+    ) -> InitialCode:
+        # Generating a coding plan
+        time_stamp = datetime.now()
+        relevant_docs = self.get_docs(library=library, task=self.task, client=client)
+
+        # generate coding plan given context
+        plan = self.planner.execute(**self.planner_request(relevant_docs))[0]
+        # install dependencies from plan
+        deps: List[str] = []
+        if self.should_install_dependencies:
+            deps = self.dependency_tracker.execute(**self.dependency_request(plan))[0]
+            self.install_dependencies(deps)
+        # generate code
+        new_code = self.coder.execute(**self.coder_request(plan, relevant_docs))[0]
+        return self.build_initial_code(time_stamp, relevant_docs, plan, deps, new_code)
+
+    async def initial_code_generation_async(
+        self, library: Library, client: weaviate.WeaviateClient
+    ) -> InitialCode:
+        """
+        Async variant of initial_code_generation, for callers running in an event loop.
+        LLM calls are awaited, blocking work runs in worker threads.
+        """
+        time_stamp = datetime.now()
+        relevant_docs = await self.get_docs_async(
+            library=library, task=self.task, client=client
+        )
+        plan = (
+            await self.planner.execute_async(**self.planner_request(relevant_docs))
+        )[0]
+        deps: List[str] = []
+        if self.should_install_dependencies:
+            deps = (
+                await self.dependency_tracker.execute_async(
+                    **self.dependency_request(plan)
+                )
+            )[0]
+            await asyncio.to_thread(self.install_dependencies, deps)
+        new_code = (
+            await self.coder.execute_async(**self.coder_request(plan, relevant_docs))
+        )[0]
+        return self.build_initial_code(time_stamp, relevant_docs, plan, deps, new_code)
 
     def format_lint_code(
         self, code: str, dependencies: List[str]
@@ -270,6 +390,57 @@ class TaskExecutor:
         }
         self.csv_writer.writerow(row_dict)
 
+    def log_lint_attempt(
+        self,
+        time_stamp: datetime,
+        lint_attempt: int,
+        formatted_code: str,
+        lint_result: List[str],
+        metric: int,
+        old_code: Optional[str] = None,
+        lint_query_results: Optional[List[Any]] = None,
+        lint_response: Optional[str] = None,
+    ) -> None:
+        """Logs a linting attempt, the first one has no correction of an old code."""
+        if old_code is None:
+            self.experiment_logger.init_lint_attempt_logs()
+            linting_attempt = LintingAttempt(
+                Timestamp=time_stamp,
+                lint_attempt=lint_attempt,
+                Code=formatted_code,
+                Lint_Result=lint_result,
+                Metric=metric,
+            )
+        else:
+            linting_attempt = LintingAttempt(
+                Timestamp=time_stamp,
+                lint_attempt=lint_attempt,
+                Code=old_code,
+                Lint_Query_Result=lint_query_results,
+                Lint_Response=lint_response,
+                Generated_Code=CodeGeneration(
+                    Thought="", Generated_Code=formatted_code
+                ),
+                Lint_Result=lint_result,
+                Metric=metric,
+            )
+        self.experiment_logger.log_linting_attempt(linting_attempt=linting_attempt)
+        logging.info(f"{lint_result=}")
+        self.write_row(
+            attempt=lint_attempt,
+            formatted_code=formatted_code,
+            lint_result=lint_result,
+            metric=metric,
+            error="no runtime",
+            time_stamp=time_stamp,
+        )
+
+    def should_correct_lint(self, lint_result: List[str], lint_attempt: int) -> bool:
+        return (
+            len(lint_result) > 0
+            and lint_attempt < self.config.lint_correction_threshold
+        )
+
     def lint_and_correct_with_llm(
         self,
         new_code: str,
@@ -281,28 +452,10 @@ class TaskExecutor:
         formatted_code, lint_result, metric = self.format_lint_code(
             code=new_code, dependencies=deps
         )
-        self.write_row(
-            attempt=lint_attempt,
-            formatted_code=formatted_code,
-            lint_result=lint_result,
-            metric=metric,
-            error="no runtime",
-            time_stamp=time_stamp,
+        self.log_lint_attempt(
+            time_stamp, lint_attempt, formatted_code, lint_result, metric
         )
-        self.experiment_logger.init_lint_attempt_logs()
-        linting_attempt = LintingAttempt(
-            Timestamp=time_stamp,
-            lint_attempt=lint_attempt,
-            Code=formatted_code,
-            Lint_Result=lint_result,
-            Metric=metric,
-        )
-        self.experiment_logger.log_linting_attempt(linting_attempt=linting_attempt)
-        logging.info(f"{lint_result=}")
-        while (
-            len(lint_result) > 0
-            and lint_attempt < self.config.lint_correction_threshold
-        ):
+        while self.should_correct_lint(lint_result, lint_attempt):
             time_stamp = datetime.now()
             lint_query_results = self.linter.execute(
                 source_code=formatted_code, linter_output=lint_result
@@ -310,74 +463,90 @@ class TaskExecutor:
             old_code = formatted_code
             logging.info(f"{lint_query_results=}")
             lint_response = (
-                openai.chat.completions.create(
-                    model="gpt-3.5-turbo-1106",
-                    messages=self.linter.messages,
-                )
+                create_chat_completion(**self.lint_response_request())
                 .choices[0]
                 .message.content
             )
             logging.info(f"{lint_response=}")
-            # TODO extract thought from code execution function
             new_code = self.code_corrector.execute(
-                tool_choice="execute_code",
-                chat_history=[],
-                task=self.task,
-                context=relevant_docs,
-                source_code=formatted_code,
-                error=lint_response,
+                **self.corrector_request(formatted_code, relevant_docs, lint_response)
             )[0]
             lint_attempt += 1
             formatted_code, lint_result, metric = self.format_lint_code(
                 code=new_code, dependencies=deps
             )
-            linting_attempt = LintingAttempt(
-                Timestamp=time_stamp,
-                lint_attempt=lint_attempt,
-                Code=old_code,
-                Lint_Query_Result=lint_query_results,
-                Lint_Response=lint_response,
-                Generated_Code=CodeGeneration(
-                    Thought="", Generated_Code=formatted_code
-                ),
-                Lint_Result=lint_result,
-                Metric=metric,
-            )
-            self.experiment_logger.log_linting_attempt(linting_attempt=linting_attempt)
-            logging.info(f"{lint_result=}")
-            self.write_row(
-                attempt=lint_attempt,
-                formatted_code=formatted_code,
-                lint_result=lint_result,
-                metric=metric,
-                error="no runtime",
-                time_stamp=time_stamp,
+            self.log_lint_attempt(
+                time_stamp,
+                lint_attempt,
+                formatted_code,
+                lint_result,
+                metric,
+                old_code=old_code,
+                lint_query_results=lint_query_results,
+                lint_response=lint_response,
             )
         return formatted_code
 
-    def runtime_and_correct_with_llm(
+    async def lint_and_correct_with_llm_async(
         self,
         new_code: str,
         relevant_docs: str,
-        attempt: int,
         deps: List[str],
     ):
-        self.experiment_logger.init_correction_loop_logs()
+        """Async variant of lint_and_correct_with_llm."""
         time_stamp = datetime.now()
-        # run generated code and correct resulting error
-        error1 = self.run_code(new_code)
-        new_code = self.code_corrector.execute(
-            tool_choice="execute_code",
-            chat_history=[],
-            task=self.task,
-            context=relevant_docs,
-            source_code=new_code,
-            error=error1,
-        )[0]
-        formatted_code, lint_result, metric = self.format_lint_code(
-            code=new_code, dependencies=deps
+        lint_attempt = 0
+        formatted_code, lint_result, metric = await asyncio.to_thread(
+            self.format_lint_code, new_code, deps
         )
-        error2 = self.run_code(new_code)
+        self.log_lint_attempt(
+            time_stamp, lint_attempt, formatted_code, lint_result, metric
+        )
+        while self.should_correct_lint(lint_result, lint_attempt):
+            time_stamp = datetime.now()
+            lint_query_results = await self.linter.execute_async(
+                source_code=formatted_code, linter_output=lint_result
+            )
+            old_code = formatted_code
+            logging.info(f"{lint_query_results=}")
+            lint_completion = await create_chat_completion_async(
+                **self.lint_response_request()
+            )
+            lint_response = lint_completion.choices[0].message.content
+            logging.info(f"{lint_response=}")
+            new_code = (
+                await self.code_corrector.execute_async(
+                    **self.corrector_request(
+                        formatted_code, relevant_docs, lint_response
+                    )
+                )
+            )[0]
+            lint_attempt += 1
+            formatted_code, lint_result, metric = await asyncio.to_thread(
+                self.format_lint_code, new_code, deps
+            )
+            self.log_lint_attempt(
+                time_stamp,
+                lint_attempt,
+                formatted_code,
+                lint_result,
+                metric,
+                old_code=old_code,
+                lint_query_results=lint_query_results,
+                lint_response=lint_response,
+            )
+        return formatted_code
+
+    def log_correction_loop(
+        self,
+        time_stamp: datetime,
+        attempt: int,
+        error1: str,
+        error2: str,
+        formatted_code: str,
+        lint_result: List[str],
+        metric: int,
+    ) -> None:
         correction_loop = CorrectionLoop(
             Timestamp=time_stamp,
             Error1=error1,
@@ -395,8 +564,59 @@ class TaskExecutor:
             error=error2,
             time_stamp=time_stamp,
         )
+
+    def runtime_and_correct_with_llm(
+        self,
+        new_code: str,
+        relevant_docs: str,
+        attempt: int,
+        deps: List[str],
+    ):
+        self.experiment_logger.init_correction_loop_logs()
+        time_stamp = datetime.now()
+        # run generated code and correct resulting error
+        error1 = self.run_code(new_code)
+        new_code = self.code_corrector.execute(
+            **self.corrector_request(new_code, relevant_docs, error1)
+        )[0]
+        formatted_code, lint_result, metric = self.format_lint_code(
+            code=new_code, dependencies=deps
+        )
+        error2 = self.run_code(new_code)
+        self.log_correction_loop(
+            time_stamp, attempt, error1, error2, formatted_code, lint_result, metric
+        )
+        return error2, new_code
+
+    async def runtime_and_correct_with_llm_async(
+        self,
+        new_code: str,
+        relevant_docs: str,
+        attempt: int,
+        deps: List[str],
+    ):
+        """Async variant of runtime_and_correct_with_llm."""
+        self.experiment_logger.init_correction_loop_logs()
+        time_stamp = datetime.now()
+        error1 = await asyncio.to_thread(self.run_code, new_code)
+        new_code = (
+            await self.code_corrector.execute_async(
+                **self.corrector_request(new_code, relevant_docs, error1)
+            )
+        )[0]
+        formatted_code, lint_result, metric = await asyncio.to_thread(
+            self.format_lint_code, new_code, deps
+        )
+        error2 = await asyncio.to_thread(self.run_code, new_code)
+        self.log_correction_loop(
+            time_stamp, attempt, error1, error2, formatted_code, lint_result, metric
+        )
         return error2, new_code
 
+    def log_self_healing_block(self, time_stamp: datetime, attempt: int) -> None:
+        time = (datetime.now() - time_stamp).total_seconds()
+        self.experiment_logger.log_self_healing_block(time=time, generation_id=attempt)
+
     def code_correction_with_linting(
         self,
         new_code: str,
@@ -418,9 +638,30 @@ class TaskExecutor:
             attempt=attempt,
             deps=deps,
         )
-        end_time_stamp = datetime.now()
-        time = (end_time_stamp - time_stamp).total_seconds()
-        self.experiment_logger.log_self_healing_block(time=time, generation_id=attempt)
+        self.log_self_healing_block(time_stamp, attempt)
+        return error, new_code
+
+    async def code_correction_with_linting_async(
+        self,
+        new_code: str,
+        deps: List[str],
+        relevant_docs: str,
+        attempt: int,
+    ):
+        """Async variant of code_correction_with_linting."""
+        time_stamp = datetime.now()
+        linted_code = await self.lint_and_correct_with_llm_async(
+            new_code=new_code,
+            relevant_docs=relevant_docs,
+            deps=deps,
+        )
+        error, new_code = await self.runtime_and_correct_with_llm_async(
+            new_code=linted_code,
+            relevant_docs=relevant_docs,
+            attempt=attempt,
+            deps=deps,
+        )
+        self.log_self_healing_block(time_stamp, attempt)
         return error, new_code
 
     # TODO: add plan to benchmark
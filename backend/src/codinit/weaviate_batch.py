@@ -0,0 +1,147 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import weaviate
+from pydantic import BaseModel
+
+from codinit.embeddings import Embedder, get_object_text
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class BatchReport(BaseModel):
+    """Summary of the objects and references written by a WeaviateBatchWriter."""
+
+    num_objects: int = 0
+    num_references: int = 0
+    failed_objects: int = 0
+    failed_references: int = 0
+    duration: float = 0.0
+
+    @property
+    def objects_per_second(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.num_objects / self.duration
+
+
+class WeaviateBatchWriter:
+    """
+    Collects objects and cross-references in memory and flushes them to weaviate
+    through the v4 batch API in fixed size chunks.
+    Objects are always flushed before the references of the same buffer, so that
+    every reference source exists once its reference is sent.
+    With an embedder, the vectors of objects added without one are computed
+    client-side in one call per flush.
+    """
+
+    def __init__(
+        self,
+        client: weaviate.WeaviateClient,
+        batch_size: int = 100,
+        concurrent_requests: int = 2,
+        buffer_size: int = 5000,
+        embedder: Optional[Embedder] = None,
+    ) -> None:
+        self.client = client
+        self.batch_size = batch_size
+        self.concurrent_requests = concurrent_requests
+        self.buffer_size = buffer_size
+        self.embedder = embedder
+        self.objects: List[Dict[str, Any]] = []
+        self.references: List[Dict[str, Any]] = []
+        self.report = BatchReport()
+
+    def add_object(
+        self,
+        collection: str,
+        properties: Dict[str, Any],
+        uuid: str,
+        vector: Optional[Sequence[float]] = None,
+    ) -> str:
+        self.objects.append(
+            dict(collection=collection, properties=properties, uuid=uuid, vector=vector)
+        )
+        self._flush_if_full()
+        return uuid
+
+    def add_reference(
+        self, from_collection: str, from_uuid: str, from_property: str, to: str
+    ) -> None:
+        self.references.append(
+            dict(
+                from_collection=from_collection,
+                from_uuid=from_uuid,
+                from_property=from_property,
+                to=to,
+            )
+        )
+        self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self.objects) + len(self.references) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> BatchReport:
+        """Send all buffered objects, then all buffered references, to weaviate."""
+        if not self.objects and not self.references:
+            return self.report
+        self.client.connect()
+        start = time.perf_counter()
+        objects, self.objects = self.objects, []
+        references, self.references = self.references, []
+        if objects and self.embedder is not None:
+            self._embed_objects(objects)
+        if objects:
+            with self.client.batch.fixed_size(
+                batch_size=self.batch_size,
+                concurrent_requests=self.concurrent_requests,
+            ) as batch:
+                for obj in objects:
+                    batch.add_object(**obj)
+            failed_objects = self.client.batch.failed_objects
+            for failed_object in failed_objects[:10]:
+                logging.error(f"Failed to batch object: {failed_object.message}")
+            self.report.num_objects += len(objects)
+            self.report.failed_objects += len(failed_objects)
+        if references:
+            with self.client.batch.fixed_size(
+                batch_size=self.batch_size,
+                concurrent_requests=self.concurrent_requests,
+            ) as batch:
+                for reference in references:
+                    batch.add_reference(**reference)
+            failed_references = self.client.batch.failed_references
+            for failed_reference in failed_references[:10]:
+                logging.error(f"Failed to batch reference: {failed_reference.message}")
+            self.report.num_references += len(references)
+            self.report.failed_references += len(failed_references)
+        self.report.duration += time.perf_counter() - start
+        logging.info(
+            f"Flushed {len(objects)} objects and {len(references)} references, "
+            f"{self.report.objects_per_second:.1f} objects/sec so far, "
+            f"{self.report.failed_objects} failed objects, "
+            f"{self.report.failed_references} failed references"
+        )
+        return self.report
+
+    def _embed_objects(self, objects: List[Dict[str, Any]]) -> None:
+        assert self.embedder is not None
+        objects = [obj for obj in objects if obj["vector"] is None]
+        texts = [
+            get_object_text(obj["collection"], obj["properties"]) for obj in objects
+        ]
+        for obj, vector in zip(objects, self.embedder.embed(texts)):
+            obj["vector"] = vector
+
+    def close(self) -> BatchReport:
+        return self.flush()
+
+    def __enter__(self) -> "WeaviateBatchWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.close()
@@ -1,9 +1,14 @@
+import atexit
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
 
 import weaviate
-from weaviate.exceptions import WeaviateStartUpError
+from weaviate.exceptions import WeaviateConnectionError, WeaviateStartUpError
 
-from codinit.config import secrets
+from codinit.config import WeaviateSettings, secrets, weaviate_settings
 
 # Configure logging at the start of your program
 logging.basicConfig(
@@ -11,13 +16,13 @@ logging.basicConfig(
 )
 
 
-# Create Weaviate client
-def get_weaviate_client() -> weaviate.WeaviateClient:
+def create_weaviate_client(
+    weaviate_settings: WeaviateSettings = weaviate_settings,
+) -> weaviate.WeaviateClient:
+    """Creates a new connected weaviate client, embedded if possible, local otherwise."""
     try:
-        # Create Weaviate client
-        # use context manager to avoid resource leaks and warnings
-        with weaviate.connect_to_embedded(
-            port=5001,
+        return weaviate.connect_to_embedded(
+            port=weaviate_settings.port,
             persistence_data_path=secrets.persist_dir,
             environment_variables={
                 "ENABLE_MODULES": "text2vec-openai,text2vec-cohere,text2vec-huggingface,ref2vec-centroid,generative-openai,qna-openai"
@@ -26,16 +31,116 @@ def get_weaviate_client() -> weaviate.WeaviateClient:
                 "X-HuggingFace-Api-Key": secrets.huggingface_key,
                 "X-OpenAI-Api-Key": secrets.openai_api_key,
             },
-        ) as client:
-            return client
+        )
     except WeaviateStartUpError as e:
         logging.error(f"Error starting Weaviate: {e}, connecting to local")
-        return weaviate.connect_to_local(port=5001, grpc_port=50050)
+        return weaviate.connect_to_local(
+            port=weaviate_settings.port, grpc_port=weaviate_settings.grpc_port
+        )
+
+
+class WeaviateConnectionManager:
+    """
+    Owns one long-lived weaviate client for the whole process.
+    The client is created lazily on first use, health-checked at most every
+    health_check_interval seconds and recreated when the check or an operation fails
+    with a connection error. The v4 client is thread-safe, so concurrent callers
+    share the same HTTP connection pool and gRPC channel.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], weaviate.WeaviateClient] = create_weaviate_client,
+        health_check_interval: float = weaviate_settings.health_check_interval,
+    ) -> None:
+        self.client_factory = client_factory
+        self.health_check_interval = health_check_interval
+        self._client: Optional[weaviate.WeaviateClient] = None
+        self._last_health_check = 0.0
+        self._needs_health_check = False
+        self._lock = threading.RLock()
+
+    def get_client(self) -> weaviate.WeaviateClient:
+        with self._lock:
+            if self._client is None:
+                self._connect()
+            elif not self._client.is_connected():
+                # closed by a caller, reopen the connection
+                self._client.connect()
+            elif (
+                self._needs_health_check
+                or time.monotonic() - self._last_health_check
+                >= self.health_check_interval
+            ):
+                if not self._is_healthy():
+                    logging.warning("Weaviate connection is unhealthy, reconnecting")
+                    self.reconnect()
+                self._last_health_check = time.monotonic()
+                self._needs_health_check = False
+            assert self._client is not None
+            return self._client
+
+    @contextmanager
+    def connection(self) -> Iterator[weaviate.WeaviateClient]:
+        """Hands out the shared client, which stays open after the block."""
+        client = self.get_client()
+        try:
+            yield client
+        except WeaviateConnectionError:
+            # force a reconnect on next use instead of reusing a broken channel
+            self.invalidate()
+            raise
+
+    def reconnect(self) -> weaviate.WeaviateClient:
+        with self._lock:
+            self.close()
+            self._connect()
+            assert self._client is not None
+            return self._client
+
+    def invalidate(self) -> None:
+        """Health-checks the client on next use, reconnecting if needed."""
+        with self._lock:
+            self._needs_health_check = True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception as e:
+                    logging.error(f"Error closing Weaviate client: {e}")
+                self._client = None
+
+    def _connect(self) -> None:
+        self._client = self.client_factory()
+        self._client.connect()
+        self._last_health_check = time.monotonic()
+        logging.info("Created shared Weaviate client")
+
+    def _is_healthy(self) -> bool:
+        assert self._client is not None
+        try:
+            return self._client.is_connected() and self._client.is_ready()
+        except Exception:
+            return False
+
+
+connection_manager = WeaviateConnectionManager()
+atexit.register(connection_manager.close)
+
+
+def get_weaviate_client() -> weaviate.WeaviateClient:
+    """Returns the shared weaviate client, do not close it after single operations."""
+    return connection_manager.get_client()
+
 
-    return client
+def weaviate_connection():
+    """Context manager handing out the shared weaviate client."""
+    return connection_manager.connection()
 
 
 if __name__ == "__main__":
     client = get_weaviate_client()
     print(client.collections.list_all())
-    client.close()
+    connection_manager.close()
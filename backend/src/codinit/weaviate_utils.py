@@ -1,6 +1,34 @@
+import hashlib
+
+from weaviate.util import generate_uuid5
+
+
 def get_collection_references(collection):
     collection_configs = collection.config.get()
     collection_references = [
         reference.name for reference in collection_configs.references
     ]
     return collection_references
+
+
+def get_collection_properties(collection):
+    collection_configs = collection.config.get()
+    collection_properties = [
+        property.name for property in collection_configs.properties
+    ]
+    return collection_properties
+
+
+def get_object_uuid(collection: str, *identifiers) -> str:
+    """
+    Deterministic UUID of an object, derived from the collection name and the
+    identifiers that make the object unique (e.g. file link and function name).
+    Re-ingesting the same object overwrites it instead of creating a duplicate.
+    """
+    identifier = "::".join(str(identifier) for identifier in identifiers)
+    return generate_uuid5(identifier=identifier, namespace=collection)
+
+
+def compute_content_hash(content: str) -> str:
+    """SHA-256 hash of a file or chunk content, used to detect changed content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -1,8 +1,15 @@
 from apify_client import ApifyClient
+from codinit.documentation import doc_schema
 from codinit.documentation.pydantic_models import Library
 from codinit.documentation.pydantic_models import WebScrapingData, Metadata, Crawl
 import pytest
 
+@pytest.fixture(autouse=True)
+def schema_migrated(monkeypatch):
+    # documentation clients of the tests are mocks, the schema migration has nothing to do
+    monkeypatch.setattr(doc_schema, "_schema_migrated", True)
+
+
 @pytest.fixture
 def mock_library():
     libname = "langchain"
@@ -10,7 +17,7 @@ def mock_library():
         "https://langchain-langchain.vercel.app/docs/get_started/",
         "https://python.langchain.com/docs/modules/",
     ]
-    library = Library(libname=libname, links=links)
+    library = Library(libname=libname, links=links, lib_repo_url="https://github.com/langchain-ai/langchain.git")
     return library
 
 # fixture creates a sample WebScrapingData object for use in the test.
@@ -46,3 +53,18 @@ def sample_data():
 def mock_apify_client(mocker):
     mock_client = mocker.MagicMock(spec=ApifyClient)
     return mock_client
+
+
+class WordEncoding:
+    """Tokenizer stand-in with one token per word, tiktoken needs network access."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_encoding():
+    return WordEncoding()
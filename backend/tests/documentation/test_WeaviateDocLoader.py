@@ -0,0 +1,139 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from codinit.config import DocumentationSettings
+from codinit.documentation.get_context import WeaviateDocLoader
+from codinit.documentation.pydantic_models import RescrapeResult
+from codinit.documentation.query_cache import QueryCache
+from codinit.weaviate_utils import compute_content_hash
+
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.batch.failed_objects = []
+    client.batch.failed_references = []
+    return client
+
+@pytest.fixture
+def doc_loader(mock_library, mock_client):
+    settings = DocumentationSettings(chunk_size=5, overlap=0, top_k=1, alpha=0.5, batch_size=10)
+    with patch("codinit.documentation.get_context.ApifyClient"):
+        return WeaviateDocLoader(library=mock_library, client=mock_client, documentation_settings=settings)
+
+def test_embed_documentation_uploads_chunks_and_references_in_batches(doc_loader, mock_client, sample_data):
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+
+    report = doc_loader.embed_documentation(data=sample_data, lib_id="lib-id")
+
+    chunks = [c.kwargs for c in batch.add_object.call_args_list]
+    references = [c.kwargs for c in batch.add_reference.call_args_list]
+    assert len(chunks) == 3  # "Example text" in chunks of 5 characters
+    assert [chunk["properties"]["chunknumber"] for chunk in chunks] == [0, 1, 2]
+    assert len({chunk["uuid"] for chunk in chunks}) == 3
+    assert len(references) == 6
+    assert {(r["from_collection"], r["from_property"]) for r in references} == {
+        ("DocumentationFile", "fromLibrary"),
+        ("Library", "hasDocumentationFile"),
+    }
+    assert report.num_objects == 3
+    mock_client.collections.get.return_value.data.insert.assert_not_called()
+
+def test_chunk_uuid_is_deterministic_and_depends_on_content(doc_loader):
+    doc_obj = {"source": "https://example.com", "chunknumber": 0, "content": "text"}
+
+    assert doc_loader.get_chunk_uuid(doc_obj) == doc_loader.get_chunk_uuid(dict(doc_obj))
+    assert doc_loader.get_chunk_uuid(doc_obj) != doc_loader.get_chunk_uuid({**doc_obj, "content": "other"})
+
+def test_embed_documentation_skips_loaded_and_duplicate_chunks(doc_loader, mock_client, sample_data):
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+    footer = sample_data[0].model_copy(update={"url": "https://example.com/other", "text": "Footer"})
+    page = sample_data[0].model_copy(update={"url": "https://example.com/page", "text": "Footer"})
+    existing_hashes = {compute_content_hash("Examp")}
+
+    doc_loader.embed_documentation(data=[sample_data[0], footer, page], lib_id="lib-id", existing_hashes=existing_hashes)
+
+    contents = [c.kwargs["properties"]["content"] for c in batch.add_object.call_args_list]
+    assert contents == ["le te", "xt", "Foote", "r"]
+    assert all(c.kwargs["properties"]["content_hash"] for c in batch.add_object.call_args_list)
+
+def test_get_existing_chunk_hashes_pages_through_the_chunks_of_library(doc_loader, mock_client, mock_library):
+    pages = [
+        MagicMock(objects=[MagicMock(properties={"content_hash": "a"}), MagicMock(properties={"content_hash": "b"})]),
+        MagicMock(objects=[MagicMock(properties={"content_hash": "c"})]),
+    ]
+    fetch_objects = mock_client.collections.get.return_value.query.fetch_objects
+    fetch_objects.side_effect = pages
+
+    with patch("codinit.documentation.get_context.CHUNK_PAGE_SIZE", 2):
+        assert doc_loader.get_existing_chunk_hashes() == {"a", "b", "c"}
+
+    first, second = [c.kwargs for c in fetch_objects.call_args_list]
+    assert first["return_properties"] == ["content_hash"]
+    assert first["filters"].target == "library" and first["filters"].value == mock_library.libname
+    assert [f.value for f in second["filters"].filters] == [mock_library.libname, "b"]
+
+def test_refresh_deletes_chunks_of_changed_and_removed_pages_and_embeds_changed(doc_loader, mock_client, mock_library, sample_data):
+    ids = {name: str(uuid.uuid4()) for name in ["changed", "removed", "similar"]}
+    def chunk(name, source):
+        return MagicMock(uuid=ids[name], properties={"source": source, "content_hash": name})
+    collection = mock_client.collections.get.return_value
+    # the source filter of the deletion also matches urls with the same words
+    collection.query.fetch_objects.return_value = MagicMock(
+        objects=[chunk("changed", "https://example.com/"), chunk("removed", "https://example.com/old"), chunk("similar", "https://example.com/old/")]
+    )
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+    result = RescrapeResult(changed=sample_data, unchanged=["https://example.com/kept"], removed=["https://example.com/old"])
+
+    doc_loader.refresh(result)
+
+    where = collection.data.delete_many.call_args.kwargs["where"]
+    assert sorted(where.value) == sorted([ids["changed"], ids["removed"]])
+    contents = [c.kwargs["properties"]["content"] for c in batch.add_object.call_args_list]
+    assert contents == ["Examp", "le te", "xt"]
+
+def test_refresh_reloads_chunks_shared_by_removed_and_kept_pages(doc_loader, mock_client, sample_data):
+    removed = sample_data[0].model_copy(update={"url": "https://example.com/removed", "text": "Footer"})
+    kept = sample_data[0].model_copy(update={"url": "https://example.com/kept", "text": "Footer"})
+    collection = mock_client.collections.get.return_value
+    # the shared chunks were stored under the removed page, which was loaded first
+    stored = [
+        MagicMock(uuid=str(uuid.uuid4()), properties={"source": "https://example.com/removed", "content_hash": compute_content_hash(content)})
+        for content in ["Foote", "r"]
+    ]
+    pages = iter([MagicMock(objects=stored)])
+    collection.query.fetch_objects.side_effect = lambda **kwargs: next(pages, MagicMock(objects=[]))
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+    result = RescrapeResult(unchanged=["https://example.com/kept"], removed=["https://example.com/removed"])
+
+    with patch.object(doc_loader, "get_or_create_library", return_value="lib-id"), patch.object(
+        doc_loader, "get_raw_documentation", return_value=iter([kept])
+    ):
+        doc_loader.refresh(result)
+
+    assert sorted(collection.data.delete_many.call_args.kwargs["where"].value) == sorted(doc.uuid for doc in stored)
+    loaded = [(c.kwargs["properties"]["source"], c.kwargs["properties"]["content"]) for c in batch.add_object.call_args_list]
+    assert loaded == [("https://example.com/kept", "Foote"), ("https://example.com/kept", "r")]
+
+def test_refresh_without_changes_loads_nothing(doc_loader, mock_client):
+    with patch.object(doc_loader, "get_raw_documentation") as get_raw_documentation, patch.object(doc_loader, "embed_documentation") as embed_documentation:
+        doc_loader.refresh(RescrapeResult(unchanged=["https://example.com/kept"]))
+
+    get_raw_documentation.assert_not_called()
+    embed_documentation.assert_not_called()
+
+def test_embed_documentation_invalidates_cached_queries(doc_loader, mock_library, sample_data):
+    doc_loader.query_cache = QueryCache()
+
+    doc_loader.embed_documentation(data=sample_data, lib_id="lib-id")
+
+    assert doc_loader.query_cache.get_version(mock_library.libname) == 1
+
+def test_chunks_store_their_library(doc_loader, mock_client, mock_library, sample_data):
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+
+    doc_loader.embed_documentation(data=sample_data, lib_id="lib-id")
+
+    assert {c.kwargs["properties"]["library"] for c in batch.add_object.call_args_list} == {mock_library.libname}
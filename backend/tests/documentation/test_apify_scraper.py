@@ -1,5 +1,19 @@
 
+import asyncio
+import copy
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from apify_client import ApifyClientAsync
+from codinit.config import DocumentationSettings, Secrets
 from codinit.documentation.apify_webscraper import WebScraper
+from codinit.documentation.pydantic_models import Library
+from codinit.documentation.save_document import iter_scraped_data_from_jsonl, scrape_and_save_libraries_async
 from pydantic_core import Url  # Adjust the import path as needed
 
 # a mock dataset used to simulate the data returned by the Apify client.
@@ -200,3 +214,91 @@ def test_run_scraping_with_valid_url(mock_apify_client):
     # If you also want to check the results
     results = scraper.run_scraping([test_url])
     assert len(results) == 1  # Assuming one result for the valid URL
+
+
+class FakeApifyHandler(BaseHTTPRequestHandler):
+    """Minimal Apify API: every actor run succeeds after a delay with a dataset of num_items items."""
+    num_items = 5
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, headers={}):
+        body = json.dumps(data).encode()
+        self.send_response(200 if self.command == "GET" else 201)
+        self.send_header("Content-Type", "application/json")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        run_id = uuid.uuid4().hex
+        self.send_json({"data": {"id": run_id, "status": "RUNNING", "defaultDatasetId": "dataset-" + run_id}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/v2/actor-runs/"):
+            run_id = url.path.rsplit("/", 1)[-1]
+            cls = type(self)
+            with cls.lock:
+                cls.in_flight += 1
+                cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            time.sleep(0.2)
+            with cls.lock:
+                cls.in_flight -= 1
+            self.send_json({"data": {"id": run_id, "status": "SUCCEEDED", "defaultDatasetId": "dataset-" + run_id}})
+        elif url.path.endswith("/items"):
+            query = parse_qs(url.query)
+            offset, limit = int(query["offset"][0]), int(query["limit"][0])
+            items = []
+            for index in range(offset, min(offset + limit, self.num_items)):
+                item = copy.deepcopy(mock_return_data[0])
+                item["url"] = f"https://docs.example.com/page-{index}"
+                items.append(item)
+            self.send_json(items, headers={
+                "x-apify-pagination-total": str(self.num_items),
+                "x-apify-pagination-offset": str(offset),
+                "x-apify-pagination-limit": str(limit),
+                "x-apify-pagination-desc": "false",
+            })
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def fake_apify_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApifyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_scrape_and_save_libraries_concurrently(tmp_path, fake_apify_url):
+    """
+    Both libraries are crawled at the same time and every page of their datasets is saved.
+    """
+    client = ApifyClientAsync(token="test-token", api_url=fake_apify_url)
+    secrets = Secrets().model_copy(update={"docs_dir": str(tmp_path)})
+    settings = DocumentationSettings(
+        chunk_size=1000, overlap=200, top_k=5, alpha=0.5,
+        max_concurrent_crawls=2, dataset_page_size=2, max_parallel_pages=2,
+    )
+    libraries = [
+        Library(libname=libname, links=["https://docs.example.com"], lib_repo_url="https://github.com/example/repo.git")
+        for libname in ["first", "second"]
+    ]
+
+    num_items = asyncio.run(scrape_and_save_libraries_async(libraries, client, secrets=secrets, documentation_settings=settings))
+
+    assert num_items == {"first": 5, "second": 5}
+    for libname in ["first", "second"]:
+        urls = {str(item.url) for item in iter_scraped_data_from_jsonl(str(tmp_path / f"{libname}.jsonl"))}
+        assert len(urls) == 5
+    assert not list(tmp_path.glob("*.part"))
+    assert FakeApifyHandler.max_in_flight >= 2
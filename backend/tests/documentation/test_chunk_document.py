@@ -1,6 +1,6 @@
 import pytest
 
-from codinit.documentation.chunk_documents import chunk_document
+from codinit.documentation.chunk_documents import chunk_document, iter_token_chunks
 
 
 @pytest.mark.parametrize(
@@ -96,3 +96,90 @@ def test_chunk_document_with_invalid_overlap():
 def test_chunk_document_with_nan_value():
     with pytest.raises(TypeError):
         chunk_document(None, 10, 2)
+
+
+MARKDOWN_DOCUMENT = """# Install
+
+Install the package with pip. Then import it.
+
+```python
+import package
+
+package.run()
+```
+
+## Usage
+
+Call run to start the package.
+"""
+
+
+def test_iter_token_chunks_keeps_code_blocks_and_sections_together(word_encoding):
+    chunks = list(iter_token_chunks(MARKDOWN_DOCUMENT, chunk_size=12, overlap=0, encoding=word_encoding))
+
+    assert chunks == [
+        "# Install\n\nInstall the package with pip. Then import it.",
+        "```python\nimport package\n\npackage.run()\n```",
+        "## Usage\n\nCall run to start the package.",
+    ]
+
+
+def test_iter_token_chunks_respects_chunk_size_and_overlap(word_encoding):
+    document = "\n\n".join(f"Paragraph {i} has five words." for i in range(6))
+
+    chunks = list(iter_token_chunks(iter(document.splitlines(True)), chunk_size=11, overlap=5, encoding=word_encoding))
+
+    assert all(len(chunk.split()) <= 11 for chunk in chunks)
+    assert chunks[0] == "Paragraph 0 has five words.\n\nParagraph 1 has five words."
+    # the last paragraph of a chunk is repeated at the start of the next one
+    assert chunks[1].startswith("Paragraph 1 has five words.")
+    assert chunks[-1].endswith("Paragraph 5 has five words.")
+
+
+def test_iter_token_chunks_splits_oversized_paragraphs_at_token_boundaries(word_encoding):
+    document = "one two three four five six seven eight nine ten"
+
+    chunks = list(iter_token_chunks(document, chunk_size=4, encoding=word_encoding))
+
+    assert chunks == ["one two three four", "five six seven eight", "nine ten"]
+
+
+def test_iter_token_chunks_invalid_overlap(word_encoding):
+    with pytest.raises(ValueError):
+        list(iter_token_chunks("text", chunk_size=4, overlap=4, encoding=word_encoding))
+
+
+def test_iter_token_chunks_does_not_repeat_the_overlap_as_a_chunk(word_encoding):
+    document = "a b c\n\nd e f\n\ng h i\n\n# Head j k l m n\n"
+
+    chunks = list(iter_token_chunks(document, chunk_size=7, overlap=3, encoding=word_encoding))
+
+    assert chunks == ["a b c\n\nd e f", "d e f\n\ng h i", "# Head j k l m n"]
+
+
+def test_iter_token_chunks_does_not_emit_empty_chunks(word_encoding):
+    document = "```\nx\n\ny\n```\n"
+
+    chunks = list(iter_token_chunks(document, chunk_size=1, overlap=0, encoding=word_encoding))
+
+    assert chunks == ["```", "x", "y", "```"]
+
+
+def test_iter_token_chunks_splits_oversized_code_blocks_into_fenced_parts(word_encoding):
+    code_lines = [f"x{i} = {i}" for i in range(40)]
+    code_lines.insert(20, "")
+    document = "# Example\n\n```python\n" + "\n".join(code_lines) + "\n```\n"
+
+    chunks = list(iter_token_chunks(document, chunk_size=30, overlap=0, encoding=word_encoding))
+
+    assert len(chunks) > 1
+    assert chunks[0].startswith("# Example\n\n```python\nx0 = 0\nx1 = 1\n")
+    for chunk in chunks:
+        assert len(chunk.split()) <= 30
+        # every part is a complete code block whose lines keep single newlines
+        code = chunk.split("```python\n", 1)[1]
+        assert code.endswith("\n```")
+        assert "\n\n" not in code.replace("x19 = 19\n\nx20 = 20", "x19 = 19\nx20 = 20")
+    # the lines of the block are all kept in order, including its blank line
+    parts = [chunk.split("```python\n", 1)[1][: -len("\n```")] for chunk in chunks]
+    assert "\n".join(parts).split("\n") == code_lines
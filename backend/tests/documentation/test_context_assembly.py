@@ -0,0 +1,116 @@
+from codinit.documentation.context_assembly import (
+    RetrievedChunk,
+    assemble_context,
+    get_overlap_length,
+    merge_adjacent_chunks,
+    mmr_rerank,
+    pack_chunks,
+)
+
+
+def test_get_overlap_length():
+    assert get_overlap_length("the quick brown fox", "brown fox jumps") == 9
+    assert get_overlap_length("abc", "def") == 0
+    assert get_overlap_length("", "abc") == 0
+    assert get_overlap_length("aaa", "aaaa") == 3
+
+
+def test_merge_adjacent_chunks_removes_overlap_and_keeps_best_score():
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=1, content="the second part.\n\nthird", score=0.9),
+        RetrievedChunk(source="a", chunknumber=0, content="first part.\n\nthe second part.", score=0.2),
+        RetrievedChunk(source="a", chunknumber=3, content="far away", score=0.1),
+        RetrievedChunk(source="b", chunknumber=2, content="other page", score=0.5),
+    ]
+
+    merged = merge_adjacent_chunks(chunks, separator="\n\n", overlap=4)
+
+    assert [(chunk.source, chunk.content, chunk.score) for chunk in merged] == [
+        ("a", "first part.\n\nthe second part.\n\nthird", 0.9),
+        ("b", "other page", 0.5),
+        ("a", "far away", 0.1),
+    ]
+
+
+def test_merge_adjacent_chunks_without_overlap_uses_separator():
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="# Install", score=0.5),
+        RetrievedChunk(source="a", chunknumber=1, content="## Usage", score=0.4),
+    ]
+
+    assert merge_adjacent_chunks(chunks)[0].content == "# Install\n\n## Usage"
+
+
+def test_merge_adjacent_chunks_keeps_text_that_only_looks_like_overlap():
+    def merge(first, second, overlap):
+        chunks = [
+            RetrievedChunk(source="a", chunknumber=0, content=first),
+            RetrievedChunk(source="a", chunknumber=1, content=second),
+        ]
+        return merge_adjacent_chunks(chunks, separator="\n\n", overlap=overlap)[0].content
+
+    # chunks loaded without overlap are always joined with the separator
+    assert merge("the first paragraph", "the first paragraph", 0) == "the first paragraph\n\nthe first paragraph"
+    # matches that are too short or do not start at a block boundary are no overlap
+    assert merge("Use the client", "to connect.", 32) == "Use the client\n\nto connect."
+    assert merge("```python\nclient.connect()\n```", "```python\nclient.close()\n```", 32) == (
+        "```python\nclient.connect()\n```\n\n```python\nclient.close()\n```"
+    )
+    assert merge("see the install guide", "install guide\n\nnext", 32) == "see the install guide\n\ninstall guide\n\nnext"
+
+
+def test_merge_adjacent_character_chunks_removes_exactly_the_overlap():
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="Use the client"),
+        RetrievedChunk(source="a", chunknumber=1, content="to connect."),
+    ]
+
+    assert merge_adjacent_chunks(chunks, separator="", overlap=0)[0].content == "Use the clientto connect."
+    assert merge_adjacent_chunks(chunks, separator="", overlap=3)[0].content == "Use the clientto connect."
+    chunks[1].content = "ent to connect."
+    assert merge_adjacent_chunks(chunks, separator="", overlap=3)[0].content == "Use the client to connect."
+
+
+def test_mmr_rerank_demotes_near_duplicates():
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="install the package with pip", score=1.0),
+        RetrievedChunk(source="b", chunknumber=0, content="install the package with pip now", score=0.9),
+        RetrievedChunk(source="c", chunknumber=0, content="call run to start", score=0.8),
+    ]
+
+    assert [chunk.source for chunk in mmr_rerank(chunks, lambda_mult=0.5)] == ["a", "c", "b"]
+    # without diversity the order of the search is kept
+    assert [chunk.source for chunk in mmr_rerank(chunks, lambda_mult=1.0)] == ["a", "b", "c"]
+
+
+def test_mmr_rerank_uses_vectors_when_available():
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="x", score=1.0, vector=[1.0, 0.0]),
+        RetrievedChunk(source="b", chunknumber=0, content="y", score=0.9, vector=[1.0, 0.01]),
+        RetrievedChunk(source="c", chunknumber=0, content="z", score=0.8, vector=[0.0, 1.0]),
+    ]
+
+    assert [chunk.source for chunk in mmr_rerank(chunks, lambda_mult=0.5)] == ["a", "c", "b"]
+
+
+def test_pack_chunks_respects_token_budget(word_encoding):
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="one two three four five six"),
+        RetrievedChunk(source="b", chunknumber=0, content="seven"),
+        RetrievedChunk(source="c", chunknumber=0, content="eight nine"),
+    ]
+
+    context = pack_chunks(chunks, max_tokens=7, encoding=word_encoding)
+
+    # "Source: b\nseven" and "Source: c\neight nine" fit, the first chunk is too long
+    assert context == "Source: b\nseven\n\nSource: c\neight nine"
+    assert len(word_encoding.encode(context)) <= 7
+
+
+def test_assemble_context(word_encoding):
+    chunks = [
+        RetrievedChunk(source="a", chunknumber=0, content="alpha beta", score=0.6),
+        RetrievedChunk(source="a", chunknumber=1, content="beta gamma", score=0.7),
+    ]
+
+    assert assemble_context(chunks, max_tokens=100, encoding=word_encoding, chunk_separator="", chunk_overlap=4) == "Source: a\nalpha beta gamma"
@@ -0,0 +1,128 @@
+from unittest.mock import MagicMock
+
+from codinit.config import DocumentationSettings
+from codinit.documentation import doc_schema
+from codinit.documentation.doc_schema import add_documentation_schema_properties, backfill_documentation_content_hash, backfill_documentation_library, count_chunks_without_library, migrate_documentation_schema
+from codinit.documentation.get_context import WeaviateDocQuerier
+from codinit.weaviate_utils import compute_content_hash
+
+
+def chunk(uuid, library=None, libname=None):
+    references = {"fromLibrary": MagicMock(objects=[MagicMock(properties={"name": libname})])} if libname else None
+    return MagicMock(uuid=uuid, properties={"library": library}, references=references)
+
+
+def test_backfill_sets_library_of_chunks_from_reference():
+    client = MagicMock()
+    collection = client.collections.get.return_value
+    collection.iterator.return_value = [
+        chunk("legacy", libname="langchain"),
+        chunk("loaded", library="langchain", libname="langchain"),
+        chunk("orphan"),
+    ]
+
+    assert backfill_documentation_library(client) == 1
+    collection.data.update.assert_called_once_with(uuid="legacy", properties={"library": "langchain"})
+
+
+def test_content_hash_is_backfilled_while_chunks_miss_it():
+    client = MagicMock()
+    collection = client.collections.get.return_value
+    collection.config.get.return_value.properties = []
+    collection.aggregate.over_all.return_value = MagicMock(
+        total_count=2,
+        properties={"content": MagicMock(count=2), "content_hash": MagicMock(count=1), "library": MagicMock(count=2)},
+    )
+    collection.iterator.return_value = [
+        MagicMock(uuid="legacy", properties={"content_hash": None, "content": "legacy chunk", "library": "lib"}),
+        MagicMock(uuid="hashed", properties={"content_hash": "hash", "content": "chunk", "library": "lib"}),
+        MagicMock(uuid="empty", properties={"content_hash": None, "content": "", "library": "lib"}),
+        MagicMock(uuid="no-content", properties={"content_hash": None, "content": None, "library": "lib"}),
+    ]
+
+    add_documentation_schema_properties(client)
+
+    collection.data.update.assert_any_call(uuid="legacy", properties={"content_hash": compute_content_hash("legacy chunk")})
+    # empty chunks are hashed as well, so they are not counted as missing a hash again
+    collection.data.update.assert_any_call(uuid="empty", properties={"content_hash": compute_content_hash("")})
+    assert backfill_documentation_content_hash(client) == 2
+
+
+def test_library_property_is_added_to_existing_collections():
+    client = MagicMock()
+    collection = client.collections.get.return_value
+    collection.config.get.return_value.properties = [MagicMock()]
+    collection.config.get.return_value.properties[0].name = "content_hash"
+    collection.iterator.return_value = []
+    collection.aggregate.over_all.return_value = MagicMock(
+        total_count=0,
+        properties={"content": MagicMock(count=0), "content_hash": MagicMock(count=0), "library": MagicMock(count=0)},
+    )
+
+    add_documentation_schema_properties(client)
+
+    added = [c.args[0].name for c in collection.config.add_property.call_args_list]
+    assert added == ["library"]
+
+
+def test_library_is_backfilled_while_chunks_miss_it():
+    client = MagicMock()
+    collection = client.collections.get.return_value
+    collection.config.get.return_value.properties = [MagicMock(), MagicMock()]
+    collection.config.get.return_value.properties[0].name = "content_hash"
+    collection.config.get.return_value.properties[1].name = "library"
+    collection.aggregate.over_all.return_value = MagicMock(
+        total_count=2,
+        properties={"content": MagicMock(count=2), "content_hash": MagicMock(count=2), "library": MagicMock(count=1)},
+    )
+    collection.iterator.return_value = [chunk("legacy", libname="langchain"), chunk("loaded", library="langchain", libname="langchain")]
+
+    add_documentation_schema_properties(client)
+
+    collection.config.add_property.assert_not_called()
+    collection.data.update.assert_called_once_with(uuid="legacy", properties={"library": "langchain"})
+
+
+def test_chunks_without_library_reference_are_not_counted_as_fixable():
+    client = MagicMock()
+    aggregate = client.collections.get.return_value.aggregate.over_all
+    aggregate.return_value = MagicMock(total_count=3, properties={"library": MagicMock(count=3)})
+
+    assert count_chunks_without_library(client) == 0
+    filters = aggregate.call_args.kwargs["filters"]
+    assert filters.target.link_on == "fromLibrary"
+
+
+def test_schema_is_migrated_once_per_process(monkeypatch):
+    monkeypatch.setattr(doc_schema, "_schema_migrated", False)
+    add_properties = MagicMock()
+    monkeypatch.setattr(doc_schema, "add_documentation_schema_properties", add_properties)
+
+    migrate_documentation_schema(MagicMock())
+    migrate_documentation_schema(MagicMock())
+
+    add_properties.assert_called_once()
+
+
+def test_references_are_added_before_schema_migration(monkeypatch):
+    manager = MagicMock()
+    monkeypatch.setattr(doc_schema, "create_doc_library_schema", manager.create)
+    monkeypatch.setattr(doc_schema, "add_documentation_schema_references", manager.add_references)
+    monkeypatch.setattr(doc_schema, "migrate_documentation_schema", manager.migrate)
+
+    doc_schema.init_library_schema_weaviate(MagicMock())
+
+    assert [name for name, _, _ in manager.mock_calls] == ["create", "add_references", "migrate"]
+
+
+def test_hybrid_search_is_scoped_to_library(mock_library):
+    client = MagicMock()
+    settings = DocumentationSettings(chunk_size=5, overlap=0, top_k=3, alpha=0.5)
+    querier = WeaviateDocQuerier(library=mock_library, client=client, documentation_settings=settings)
+
+    querier.query_weaviate_docs("query")
+
+    hybrid = client.collections.get.return_value.query.hybrid
+    filters = hybrid.call_args.kwargs["filters"]
+    assert filters.target == "library"
+    assert filters.value == mock_library.libname
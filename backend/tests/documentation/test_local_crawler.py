@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import asyncio
+
+import pytest
+from codinit.config import DocumentationSettings, Secrets
+from codinit.documentation.local_crawler import LocalCrawler, extract_page
+from codinit.documentation.pydantic_models import CrawlManifest, Library
+from codinit.documentation.save_document import iter_scraped_data_from_jsonl, load_crawl_manifest, scrape_and_save_libraries_async
+
+# a small documentation site, pages link to each other, to a private page and outside the docs
+PAGES = {
+    "/docs/": """<html lang="en"><head><title>Docs</title>
+        <meta name="description" content="Example docs"><link rel="canonical" href="/docs/"></head>
+        <body><nav><a href="/docs/nav-only">Nav</a></nav><main><h1>Getting started</h1><p>Install the library.</p>
+        <ul><li><a href="/docs/page1#usage">Page 1</a></li><li><a href="page2">Page 2</a></li></ul>
+        <a href="/docs/private/secret">Secret</a><a href="/blog/">Blog</a><a href="https://example.com/">External</a></main>
+        </body></html>""",
+    "/docs/page1": """<html><head><title>Page 1</title></head><body><main><h2>Usage</h2>
+        <pre>import library\nlibrary.run()</pre><a href="/docs/">Home</a></main></body></html>""",
+    "/docs/page2": """<html><head><title>Page 2</title></head><body><p>Second page</p></body></html>""",
+    "/docs/private/secret": "<html><head><title>Secret</title></head><body>Secret</body></html>",
+    "/blog/": "<html><head><title>Blog</title></head><body>Blog</body></html>",
+}
+ROBOTS = "User-agent: *\nDisallow: /docs/private/\n"
+
+
+class DocsHandler(BaseHTTPRequestHandler):
+    requested = []
+    not_modified = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        if self.path == "/robots.txt":
+            body, content_type = ROBOTS, "text/plain"
+        elif self.path in PAGES:
+            body, content_type = PAGES[self.path], "text/html; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.sha256(body.encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            cls.not_modified.append(self.path)
+            self.send_response(304)
+            self.end_headers()
+            return
+        with cls.lock:
+            cls.requested.append(self.path)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+
+@pytest.fixture
+def docs_server():
+    DocsHandler.requested = []
+    DocsHandler.not_modified = []
+    DocsHandler.in_flight = DocsHandler.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DocsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_crawl_follows_links_below_start_urls(docs_server):
+    crawler = LocalCrawler(max_concurrency=4, host_delay=0)
+
+    results = crawler.scrape_urls([docs_server + "/docs/"])
+
+    urls = sorted(str(result.url) for result in results)
+    assert urls == [docs_server + "/docs/", docs_server + "/docs/page1", docs_server + "/docs/page2"]
+    # pages disallowed by robots.txt or outside of the start url are not requested
+    assert "/docs/private/secret" not in DocsHandler.requested
+    assert "/blog/" not in DocsHandler.requested
+
+    index = next(result for result in results if result.crawl.depth == 0)
+    assert index.metadata.title == "Docs"
+    assert index.metadata.description == "Example docs"
+    assert "Install the library." in index.text
+    assert index.markdown.startswith("# Getting started")
+    # navigation is removed from the text, but its links are still followed
+    assert "Nav" not in index.text
+    page1 = next(result for result in results if str(result.url).endswith("page1"))
+    assert page1.crawl.depth == 1
+    assert str(page1.crawl.referrerUrl) == docs_server + "/docs/"
+    assert "```\nimport library\nlibrary.run()\n```" in page1.markdown
+
+
+def test_crawl_respects_concurrency_and_host_delay(docs_server):
+    crawler = LocalCrawler(max_concurrency=2, host_delay=0.1, respect_robots_txt=False)
+
+    start = time.monotonic()
+    results = crawler.scrape_urls([docs_server + "/docs/"])
+    duration = time.monotonic() - start
+
+    # without robots.txt the private page is crawled too
+    assert len(results) == 4
+    assert DocsHandler.max_in_flight <= 2
+    # four requests to the same host are spaced by at least 0.1 seconds
+    assert duration >= 0.3
+
+
+def test_crawl_from_a_bare_host_stays_on_the_host(docs_server, monkeypatch):
+    # the same server under another host name
+    other_host = docs_server.replace("127.0.0.1", "localhost")
+    monkeypatch.setitem(PAGES, "/", f'<html><body><a href="/docs/page2">Page 2</a><a href="{other_host}/docs/">Other</a></body></html>')
+    crawler = LocalCrawler(host_delay=0, respect_robots_txt=False)
+
+    results = crawler.scrape_urls([docs_server])
+
+    assert sorted(str(result.url) for result in results) == [docs_server + "/", docs_server + "/docs/page2"]
+    assert "/docs/" not in DocsHandler.requested
+
+
+def test_crawl_skips_invalid_urls(docs_server):
+    crawler = LocalCrawler(host_delay=0)
+
+    assert crawler.scrape_urls(["invalid-url"]) == []
+
+
+def test_extract_page_drops_fragments_and_resolves_links():
+    data, links = extract_page(
+        html=PAGES["/docs/"], url="https://docs.example.com/docs/", loaded_url="https://docs.example.com/docs/", depth=0
+    )
+
+    assert "https://docs.example.com/docs/page1" in links
+    assert "https://docs.example.com/docs/page2" in links
+    assert str(data.metadata.canonicalUrl) == "https://docs.example.com/docs/"
+    assert data.metadata.languageCode == "en"
+
+
+def test_rescrape_sends_conditional_requests(docs_server, monkeypatch):
+    crawler = LocalCrawler(host_delay=0)
+    first = crawler.rescrape_urls([docs_server + "/docs/"], CrawlManifest())
+    assert len(first.changed) == 3
+    assert all(state.etag for state in first.manifest.pages.values())
+
+    monkeypatch.setitem(PAGES, "/docs/page2", PAGES["/docs/page2"].replace("Second page", "Updated page"))
+    DocsHandler.requested = []
+    manifest = first.manifest.model_copy(deep=True)
+    manifest.pages[docs_server + "/docs/old"] = manifest.pages[docs_server + "/docs/page2"]
+    second = crawler.rescrape_urls([docs_server + "/docs/"], manifest)
+
+    assert [str(page.url) for page in second.changed] == [docs_server + "/docs/page2"]
+    assert "Updated page" in second.changed[0].text
+    assert sorted(second.unchanged) == [docs_server + "/docs/", docs_server + "/docs/page1"]
+    assert second.removed == [docs_server + "/docs/old"]
+    # links of pages that were not modified are still followed
+    assert sorted(DocsHandler.not_modified) == ["/docs/", "/docs/page1"]
+    assert [path for path in DocsHandler.requested if path != "/robots.txt"] == ["/docs/page2"]
+
+
+def test_scrape_and_save_libraries_uses_the_configured_backend(tmp_path, docs_server):
+    secrets = Secrets().model_copy(update={"docs_dir": str(tmp_path)})
+    settings = DocumentationSettings(
+        chunk_size=1000, overlap=200, top_k=5, alpha=0.5, scraper_backend="local", crawl_host_delay=0,
+    )
+    library = Library(libname="docs", links=[docs_server + "/docs/"], lib_repo_url="https://github.com/example/repo.git")
+
+    num_items = asyncio.run(scrape_and_save_libraries_async([library], secrets=secrets, documentation_settings=settings))
+
+    assert num_items == {"docs": 3}
+    assert len(list(iter_scraped_data_from_jsonl(str(tmp_path / "docs.jsonl")))) == 3
+    # the manifest keeps the validators for the conditional requests of a refresh
+    manifest = load_crawl_manifest(str(tmp_path / "docs.manifest.json"))
+    assert all(state.etag for state in manifest.pages.values())
+
+
+def test_rescrape_from_a_bare_host_keys_pages_like_the_saved_docs(docs_server, monkeypatch):
+    monkeypatch.setitem(PAGES, "/", "<html><body><p>Root page</p></body></html>")
+    crawler = LocalCrawler(host_delay=0, respect_robots_txt=False)
+    first = crawler.rescrape_urls([docs_server], CrawlManifest())
+    assert [str(page.url) for page in first.changed] == list(first.manifest.pages) == [docs_server + "/"]
+
+    second = crawler.rescrape_urls([docs_server], first.manifest)
+
+    assert second.unchanged == [docs_server + "/"]
+    assert second.changed == [] and second.removed == []
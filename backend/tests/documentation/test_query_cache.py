@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from codinit.config import DocumentationSettings
+from codinit.documentation import query_cache as query_cache_module
+from codinit.documentation.get_context import WeaviateDocQuerier
+from codinit.documentation.query_cache import QueryCache
+
+
+def test_similar_queries_share_entries():
+    cache = QueryCache(max_size=10)
+    key = cache.make_key(library="lib", query="How to  use Lib?", alpha=0.5, top_k=3)
+    cache.put(key, "docs")
+
+    assert cache.get(cache.make_key(library="lib", query="how to use lib? ", alpha=0.5, top_k=3)) == "docs"
+    assert cache.get(cache.make_key(library="lib", query="how to use lib?", alpha=0.5, top_k=5)) is None
+    assert cache.get(cache.make_key(library="other", query="how to use lib?", alpha=0.5, top_k=3)) is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = QueryCache(max_size=2)
+    cache.put("lib:a", "a")
+    cache.put("lib:b", "b")
+    assert cache.get("lib:a") == "a"
+    cache.put("lib:c", "c")
+
+    assert cache.get("lib:b") is None
+    assert cache.get("lib:a") == "a"
+    assert cache.get("lib:c") == "c"
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module.time, "time", lambda: now[0])
+    cache = QueryCache(ttl=10)
+    cache.put("lib:a", "a")
+
+    now[0] += 5
+    assert cache.get("lib:a") == "a"
+    now[0] += 10
+    assert cache.get("lib:a") is None
+
+
+def test_persisted_entries_are_shared_and_invalidated_by_version(tmp_path):
+    path = str(tmp_path / "queries.sqlite")
+    writer = QueryCache(path=path)
+    key = writer.make_key(library="lib", query="query", alpha=0.5, top_k=3)
+    writer.put(key, "docs")
+
+    reader = QueryCache(path=path)
+    assert reader.get(key) == "docs"
+
+    # a loader in another process writes new chunks of the library
+    QueryCache(path=path).bump_version("lib")
+    assert reader.make_key(library="lib", query="query", alpha=0.5, top_k=3) != key
+    assert reader.get(reader.make_key(library="lib", query="query", alpha=0.5, top_k=3)) is None
+
+
+@pytest.fixture
+def querier(mock_library, word_encoding, monkeypatch):
+    monkeypatch.setattr("codinit.documentation.context_assembly.get_encoding", lambda name: word_encoding)
+    client = MagicMock()
+    settings = DocumentationSettings(chunk_size=5, overlap=0, top_k=1, alpha=0.5)
+    querier = WeaviateDocQuerier(library=mock_library, client=client, documentation_settings=settings)
+    querier.query_cache = QueryCache()
+    doc = MagicMock(properties={"source": "https://example.com", "chunknumber": 0, "content": "relevant docs"}, vector={})
+    doc.metadata.score = 0.5
+    querier.query_weaviate_docs = MagicMock(return_value=[doc])
+    return querier
+
+
+def test_querier_caches_relevant_documents_until_library_changes(querier, mock_library):
+    assert querier.get_relevant_documents("How to use the library") == "Source: https://example.com\nrelevant docs"
+    assert querier.get_relevant_documents("how to use the library").endswith("relevant docs")
+    assert querier.query_weaviate_docs.call_count == 1
+
+    querier.query_cache.bump_version(mock_library.libname)
+    querier.get_relevant_documents("how to use the library")
+    assert querier.query_weaviate_docs.call_count == 2
+
+
+def test_context_settings_are_part_of_the_key(querier):
+    querier.get_relevant_documents("query")
+    querier.documentation_settings = querier.documentation_settings.model_copy(update={"rerank": False})
+    querier.get_relevant_documents("query")
+    querier.documentation_settings = querier.documentation_settings.model_copy(update={"mmr_lambda": 0.2})
+    querier.get_relevant_documents("query")
+
+    assert querier.query_weaviate_docs.call_count == 3
+
+
+def test_disabled_cache_always_queries(querier):
+    querier.query_cache = QueryCache(max_size=0)
+
+    querier.get_relevant_documents("query")
+    querier.get_relevant_documents("query")
+
+    assert querier.query_weaviate_docs.call_count == 2
@@ -1,5 +1,8 @@
 import json
-from codinit.documentation.save_document import save_scraped_data_as_json
+from codinit.config import Secrets
+from codinit.documentation.apify_webscraper import DocumentationScraper
+from codinit.documentation.pydantic_models import CrawlManifest, PageState, RescrapeResult
+from codinit.documentation.save_document import ScraperSaver, iter_scraped_data_from_jsonl, load_crawl_manifest, save_scraped_data_as_json, save_scraped_data_as_jsonl
 
 
 def test_save_scraped_data_as_json(mocker, sample_data):
@@ -27,3 +30,70 @@ def test_save_scraped_data_as_json(mocker, sample_data):
 
     # assert that the concatenated string matches the expected JSON content
     assert written_content == expected_json_str
+
+
+def test_jsonl_round_trip_streams_items(tmp_path, sample_data):
+    filename = str(tmp_path / "docs.jsonl")
+    second = sample_data[0].model_copy(update={"text": "Second page"})
+
+    assert save_scraped_data_as_jsonl(iter([sample_data[0]]), filename) == 1
+    assert save_scraped_data_as_jsonl([second], filename, append=True) == 1
+
+    with open(filename, encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+    loaded = iter_scraped_data_from_jsonl(filename)
+    assert not isinstance(loaded, list)
+    assert list(loaded) == [sample_data[0], second]
+
+
+class FakeScraper(DocumentationScraper):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def scrape_urls(self, urls):
+        return self.pages
+
+
+def test_refresh_docs_only_returns_changed_pages(tmp_path, sample_data):
+    secrets = Secrets().model_copy(update={"docs_dir": str(tmp_path)})
+    page1 = sample_data[0]
+    page2 = page1.model_copy(update={"url": "https://example.com/page2", "text": "Second page"})
+    page3 = page1.model_copy(update={"url": "https://example.com/page3", "text": "Third page"})
+    scraper = FakeScraper([page1, page2, page3])
+    saver = ScraperSaver(libname="lib", secrets=secrets, scraper=scraper)
+    saver.scrape_and_save_apify_docs(urls=["https://example.com"])
+    assert len(load_crawl_manifest(saver.manifest_filename).pages) == 3
+
+    scraper.pages = [page1, page2.model_copy(update={"text": "Updated page"})]
+    result = saver.refresh_docs(urls=["https://example.com"])
+
+    assert [doc.text for doc in result.changed] == ["Updated page"]
+    assert result.unchanged == ["https://example.com/"]
+    assert result.removed == ["https://example.com/page3"]
+    saved = {str(doc.url): doc.text for doc in iter_scraped_data_from_jsonl(saver.filename)}
+    assert saved == {"https://example.com/": "Example text", "https://example.com/page2": "Updated page"}
+    assert len(load_crawl_manifest(saver.manifest_filename).pages) == 2
+
+
+class UnchangedScraper(DocumentationScraper):
+    """Reports every page of the manifest as unchanged under the url as requested."""
+
+    def scrape_urls(self, urls):
+        return []
+
+    def rescrape_urls(self, urls, manifest):
+        return RescrapeResult(unchanged=list(urls), manifest=manifest)
+
+
+def test_refresh_docs_keeps_root_page_reported_without_trailing_slash(tmp_path, sample_data):
+    secrets = Secrets().model_copy(update={"docs_dir": str(tmp_path)})
+    saver = ScraperSaver(libname="lib", secrets=secrets, scraper=UnchangedScraper())
+    save_scraped_data_as_jsonl(sample_data, saver.filename)
+    with open(saver.manifest_filename, "w") as file:
+        json.dump({"pages": {"https://example.com": {"content_hash": "hash"}}}, file)
+
+    result = saver.refresh_docs(urls=["https://example.com"])
+
+    assert [str(doc.url) for doc in iter_scraped_data_from_jsonl(saver.filename)] == ["https://example.com/"]
+    assert list(load_crawl_manifest(saver.manifest_filename).pages) == ["https://example.com/"]
+    assert result.unchanged == ["https://example.com"]
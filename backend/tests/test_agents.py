@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+from unittest.mock import AsyncMock, MagicMock
+
+from codinit import agents
+from codinit.agents import OpenAIAgent, get_function_schema
+
+
+def lookup_symbol(name: str, k: int = 1):
+    """looks up a symbol"""
+    return [name] * k
+
+
+def tool_call(name, arguments):
+    call = MagicMock(id="call-1")
+    call.function.name = name
+    call.function.arguments = json.dumps(arguments)
+    return call
+
+
+def test_schemas_are_computed_once(monkeypatch):
+    create_model = MagicMock(wraps=agents.create_model)
+    monkeypatch.setattr(agents, "create_model", create_model)
+    get_function_schema.cache_clear()
+
+    first = OpenAIAgent(functions=[lookup_symbol])
+    second = OpenAIAgent(functions=[lookup_symbol])
+
+    assert create_model.call_count == 1
+    assert first.tool_schemas == second.tool_schemas
+    schema = first.tool_schemas[0]["function"]
+    assert schema["name"] == "lookup_symbol"
+    assert schema["description"] == "looks up a symbol"
+    assert schema["parameters"]["required"] == ["name"]
+
+
+def test_tool_calls_are_dispatched_through_the_registry():
+    agent = OpenAIAgent(functions=[lookup_symbol])
+
+    # lookup_symbol is not defined in the agents module
+    assert agent.call_func(tool_call("lookup_symbol", {"name": "Agent", "k": 2})) == ["Agent", "Agent"]
+    assert agent.call_func(tool_call("execute_code", {"thought": "", "code": ""})) is None
+
+
+def test_execute_passes_cached_schemas(monkeypatch):
+    agent = OpenAIAgent(user_prompt_template="{task}", functions=[lookup_symbol])
+    message = MagicMock(tool_calls=[tool_call("lookup_symbol", {"name": "Agent"})])
+    agent.call_gpt = MagicMock(return_value=MagicMock(choices=[MagicMock(message=message)]))
+
+    assert agent.execute(tool_choice="lookup_symbol", task="task") == [["Agent"]]
+    assert agent.call_gpt.call_args.kwargs["tools"] is agent.tool_schemas
+
+
+def test_execute_async_awaits_the_completion_and_runs_tools_in_a_thread(monkeypatch):
+    tool_threads = []
+
+    def current_thread_tool(name: str):
+        """records the thread running the tool"""
+        tool_threads.append(threading.current_thread())
+        return name
+
+    message = MagicMock(tool_calls=[tool_call("current_thread_tool", {"name": "Agent"})])
+    response = MagicMock(choices=[MagicMock(message=message)])
+    response.usage.prompt_tokens = 7
+    create = AsyncMock(return_value=response)
+    monkeypatch.setattr(agents, "create_chat_completion_async", create)
+    agent = OpenAIAgent(user_prompt_template="{task}", functions=[current_thread_tool])
+
+    assert asyncio.run(agent.execute_async(tool_choice="current_thread_tool", task="task")) == ["Agent"]
+    assert tool_threads[0] is not threading.main_thread()
+    assert create.call_args.kwargs["tools"] is agent.tool_schemas
+    assert agent.prompt_tokens == [7]
+
+
+def test_sync_and_async_execute_send_the_same_request(monkeypatch):
+    message = MagicMock(tool_calls=[tool_call("lookup_symbol", {"name": "Agent"})])
+    response = MagicMock(choices=[MagicMock(message=message)])
+    create = MagicMock(return_value=response)
+    create_async = AsyncMock(return_value=response)
+    monkeypatch.setattr(agents, "create_chat_completion", create)
+    monkeypatch.setattr(agents, "create_chat_completion_async", create_async)
+
+    sync_agent = OpenAIAgent(user_prompt_template="{task}", functions=[lookup_symbol])
+    async_agent = sync_agent.new_session()
+
+    assert sync_agent.execute(tool_choice="lookup_symbol", task="task") == [["Agent"]]
+    assert asyncio.run(async_agent.execute_async(tool_choice="lookup_symbol", task="task")) == [["Agent"]]
+    assert create.call_args.kwargs == create_async.call_args.kwargs
+    assert sync_agent.messages == async_agent.messages
@@ -1,8 +1,12 @@
 import shutil
 import pytest
 import os
-from codinit.codebaseKG import clone_repo, check_if_repo_has_been_cloned, check_if_repo_has_been_embedded, clone_repo_if_not_exists, embed_repository_if_not_exists
-from unittest.mock import Mock, patch
+from codinit import codebaseKG
+from codinit.codebaseKG import sync_repository, run_codebase_analysis, delete_file_entities, clone_repo, check_if_repo_has_been_cloned, check_if_repo_has_been_embedded, clone_repo_if_not_exists, embed_repository_if_not_exists, get_object_uuid, parse_file_batched, analyze_directory_batched, get_changed_files, get_head_commit_sha, get_file_index, compute_content_hash
+from git import Repo
+from codinit.config import IngestionSettings
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import MagicMock, Mock, patch
 @pytest.fixture
 def repo_url():
     return "https://github.com/gordonwilliamsburg/test-repo.git"
@@ -163,3 +167,232 @@ def test_embed_repository_if_not_exists_already_embedded_does_not_reembed(test_e
 
         # Check that the specific log message was emitted
         mock_logging_info.assert_any_call(f"Repository {str(test_repo_dir)}= has already been embedded to Weaviate")
+
+
+# Tests for the batched ingestion of a single file
+SAMPLE_FILE = '''
+import os
+from typing import List, Optional
+from . import utils
+
+def helper(x):
+    y = x
+    return y
+
+class Agent:
+    name: str
+
+    def run(self, task):
+        return task
+'''
+
+def test_parse_file_batched_collects_objects_and_references():
+    batch_writer = Mock()
+    batch_writer.add_object.side_effect = lambda collection, properties, uuid: uuid
+
+    file_id = parse_file_batched(SAMPLE_FILE, "agent.py", "/repo/agent.py", batch_writer)
+
+    added = [(c.kwargs["collection"], c.kwargs["properties"]["name"]) for c in batch_writer.add_object.call_args_list]
+    assert added == [
+        ("File", "agent.py"),
+        ("Import", "os"),
+        ("Import", "typing.List"),
+        ("Import", "typing.Optional"),
+        ("Import", ".utils"),
+        ("Function", "helper"),
+        ("Class", "Agent"),
+        ("Function", "run"),
+    ]
+    references = [c.args[:3] for c in batch_writer.add_reference.call_args_list]
+    assert ("File", file_id, "hasImport") in references
+    assert ("Class", get_object_uuid("Class", "/repo/agent.py", "Agent", 1), "hasFunction") in references
+    assert len(references) == 2 * 4 + 2 + 2 + 4
+
+def test_parse_file_batched_uuids_are_deterministic():
+    first, second = Mock(), Mock()
+    first.add_object.side_effect = lambda collection, properties, uuid: uuid
+    second.add_object.side_effect = lambda collection, properties, uuid: uuid
+
+    parse_file_batched(SAMPLE_FILE, "agent.py", "/repo/agent.py", first)
+    parse_file_batched(SAMPLE_FILE, "agent.py", "/repo/agent.py", second)
+
+    first_uuids = [c.kwargs["uuid"] for c in first.add_object.call_args_list]
+    second_uuids = [c.kwargs["uuid"] for c in second.add_object.call_args_list]
+    assert first_uuids == second_uuids
+    assert len(set(first_uuids)) == len(first_uuids)
+
+def test_analyze_directory_batched_parses_files_in_worker_processes(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "agent.py").write_text(SAMPLE_FILE)
+    (tmp_path / "pkg" / "broken.py").write_text("def broken(:\n")
+    (tmp_path / "README.md").write_text("not python")
+    mock_client = MagicMock()
+    mock_client.collections.get.return_value.data.exists.return_value = False
+    mock_client.batch.failed_objects = []
+    mock_client.batch.failed_references = []
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+    settings = IngestionSettings(num_workers=2, queue_size=1)
+
+    with patch("codinit.codebaseKG.get_file_index", return_value={}):
+        directory_id = analyze_directory_batched(str(tmp_path), "https://example.com/repo.git", mock_client, settings)
+
+    added = [c.kwargs["collection"] for c in batch.add_object.call_args_list]
+    assert added.count("Repository") == 1
+    assert added.count("File") == 1
+    assert added.count("Function") == 2
+    assert directory_id == get_object_uuid("Repository", str(tmp_path))
+    assert any(c.kwargs["from_property"] == "hasFile" for c in batch.add_reference.call_args_list)
+
+def test_parser_processes_are_not_forked_from_the_threaded_process(tmp_path):
+    (tmp_path / "agent.py").write_text(SAMPLE_FILE)
+    mock_client = MagicMock()
+    mock_client.batch.failed_objects = []
+    mock_client.batch.failed_references = []
+
+    with patch("codinit.codebaseKG.get_file_index", return_value={}), patch(
+        "codinit.codebaseKG.ProcessPoolExecutor", wraps=ProcessPoolExecutor
+    ) as process_pool:
+        analyze_directory_batched(str(tmp_path), "https://example.com/repo.git", mock_client, IngestionSettings(num_workers=1))
+
+    assert process_pool.call_args.kwargs["mp_context"].get_start_method() != "fork"
+
+def test_analyze_directory_batched_skips_files_whose_parser_fails(tmp_path):
+    (tmp_path / "agent.py").write_text(SAMPLE_FILE)
+    # os.walk lists the dangling symlink, opening it raises FileNotFoundError in the worker
+    (tmp_path / "dangling.py").symlink_to(tmp_path / "missing.py")
+    mock_client = MagicMock()
+    mock_client.batch.failed_objects = []
+    mock_client.batch.failed_references = []
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+
+    with patch("codinit.codebaseKG.get_file_index", return_value={}):
+        analyze_directory_batched(str(tmp_path), "https://example.com/repo.git", mock_client, IngestionSettings(num_workers=1, queue_size=1))
+
+    files = [c.kwargs["properties"]["name"] for c in batch.add_object.call_args_list if c.kwargs["collection"] == "File"]
+    assert files == ["agent.py"]
+
+def test_get_changed_files_returns_python_files_to_remove_and_index(tmp_path):
+    repo = Repo.init(tmp_path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+    (tmp_path / "kept.py").write_text("a = 1\n")
+    (tmp_path / "modified.py").write_text("b = 1\n")
+    (tmp_path / "removed.py").write_text("c = 1\n")
+    repo.index.add(["kept.py", "modified.py", "removed.py"])
+    old_sha = repo.index.commit("initial").hexsha
+    (tmp_path / "modified.py").write_text("b = 2\n")
+    (tmp_path / "added.py").write_text("d = 1\n")
+    (tmp_path / "notes.md").write_text("not python")
+    repo.index.add(["modified.py", "added.py", "notes.md"])
+    repo.index.remove(["removed.py"], working_tree=True)
+    new_sha = repo.index.commit("change files").hexsha
+
+    removed, added = get_changed_files(str(tmp_path), old_sha, new_sha)
+
+    assert get_head_commit_sha(str(tmp_path)) == new_sha
+    assert sorted(removed) == ["modified.py", "removed.py"]
+    assert sorted(added) == ["added.py", "modified.py"]
+
+def test_analyze_directory_batched_skips_unchanged_files_from_prefetched_index(tmp_path):
+    (tmp_path / "agent.py").write_text(SAMPLE_FILE)
+    (tmp_path / "changed.py").write_text("def changed():\n    return 2\n")
+    (tmp_path / "new.py").write_text("def new():\n    return 3\n")
+    file_index = {
+        str(tmp_path / "agent.py"): compute_content_hash(SAMPLE_FILE),
+        str(tmp_path / "changed.py"): "outdated-hash",
+        str(tmp_path / "removed.py"): "some-hash",
+    }
+    mock_client = MagicMock()
+    repository_collection = mock_client.collections.get.return_value
+    repository_collection.data.exists.return_value = True
+    mock_client.batch.failed_objects = []
+    mock_client.batch.failed_references = []
+    batch = mock_client.batch.fixed_size.return_value.__enter__.return_value
+
+    with patch("codinit.codebaseKG.get_file_index", return_value=file_index), patch(
+        "codinit.codebaseKG.delete_file_entities"
+    ) as delete_file_entities:
+        analyze_directory_batched(str(tmp_path), "https://example.com/repo.git", mock_client, IngestionSettings(num_workers=1))
+
+    files = [c.kwargs["properties"]["name"] for c in batch.add_object.call_args_list if c.kwargs["collection"] == "File"]
+    assert sorted(files) == ["changed.py", "new.py"]
+    delete_file_entities.assert_called_once()
+    assert delete_file_entities.call_args.kwargs["link"] == str(tmp_path / "changed.py")
+    mock_client.collections.get.return_value.query.fetch_objects.assert_not_called()
+    # re-adding the repository would drop its references to the skipped files
+    assert "Repository" not in [c.kwargs["collection"] for c in batch.add_object.call_args_list]
+    repository_collection.data.update.assert_called_once_with(
+        uuid=get_object_uuid("Repository", str(tmp_path)), properties={"commit_sha": None}
+    )
+
+def test_get_file_index_filters_links_of_directory():
+    files = [
+        Mock(properties={"link": "/repos/lib/a.py", "content_hash": "a"}),
+        Mock(properties={"link": "/repos/lib2/b.py", "content_hash": "b"}),
+    ]
+    repositories = [
+        Mock(properties={"name": "/repos/lib"}, references={"hasFile": Mock(objects=files)}),
+        Mock(properties={"name": "/repos/lib2"}, references={"hasFile": Mock(objects=files[1:])}),
+    ]
+    mock_client = MagicMock()
+    mock_client.collections.get.return_value.query.fetch_objects.return_value.objects = repositories
+
+    assert get_file_index("/repos/lib", mock_client) == {"/repos/lib/a.py": "a"}
+    mock_client.collections.get.assert_called_with("Repository")
+
+def init_git_repo(path):
+    repo = Repo.init(path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+    (path / "kept.py").write_text("a = 1\n")
+    repo.index.add(["kept.py"])
+    return repo.index.commit("initial").hexsha
+
+def test_sync_repository_reindexes_everything_when_the_indexed_commit_is_missing(tmp_path):
+    head_sha = init_git_repo(tmp_path)
+    repository = Mock(uuid="repository-uuid", properties={"commit_sha": "0" * 40})
+    mock_client = MagicMock()
+
+    with patch("codinit.codebaseKG.get_repository", return_value=repository), patch(
+        "codinit.codebaseKG.get_file_index", return_value={str(tmp_path / "gone.py"): "hash"}
+    ), patch("codinit.codebaseKG.delete_file_entities") as delete_file_entities, patch(
+        "codinit.codebaseKG.ingest_files"
+    ) as ingest_files:
+        sync_repository(str(tmp_path), "https://example.com/repo.git", mock_client, IngestionSettings(num_workers=1))
+
+    deleted = sorted(c.kwargs["link"] for c in delete_file_entities.call_args_list)
+    assert deleted == [str(tmp_path / "gone.py"), str(tmp_path / "kept.py")]
+    assert ingest_files.call_args.kwargs["files_to_parse"] == [("kept.py", str(tmp_path / "kept.py"))]
+    mock_client.collections.get.return_value.data.update.assert_called_once_with(
+        uuid="repository-uuid", properties={"commit_sha": head_sha}
+    )
+
+def test_delete_file_entities_keeps_references_of_missing_repository():
+    mock_client = MagicMock()
+    collection = mock_client.collections.get.return_value
+    collection.data.exists.return_value = False
+    collection.query.fetch_objects.return_value.objects = [Mock(uuid="file-uuid", properties={"link": "/repo/a.py"}, references={})]
+
+    delete_file_entities(link="/repo/a.py", repository_id="repository-uuid", client=mock_client)
+
+    collection.data.reference_delete.assert_not_called()
+    collection.data.delete_by_id.assert_called_once_with("file-uuid")
+
+
+@pytest.mark.parametrize("changed, index_exists, rebuilt", [(False, True, False), (False, False, True), (True, True, True)])
+def test_symbol_index_is_only_rebuilt_after_changes(tmp_path, monkeypatch, changed, index_exists, rebuilt):
+    index_path = tmp_path / "lib.symbols"
+    if index_exists:
+        index_path.touch()
+    monkeypatch.setattr(codebaseKG, "clone_repo_if_not_exists", MagicMock())
+    monkeypatch.setattr(codebaseKG, "pull_repo", MagicMock())
+    monkeypatch.setattr(codebaseKG, "sync_repository", MagicMock(return_value=changed))
+    monkeypatch.setattr(codebaseKG, "get_symbol_index_path", lambda libname: str(index_path))
+    build_symbol_index = MagicMock()
+    monkeypatch.setattr(codebaseKG, "build_symbol_index", build_symbol_index)
+
+    run_codebase_analysis(str(tmp_path), "lib", "https://example.com/repo.git", MagicMock())
+
+    assert build_symbol_index.called == rebuilt
@@ -0,0 +1,88 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from codinit import agents
+from codinit.agents import OpenAIAgent
+from codinit.config import agent_settings
+from codinit.conversation_memory import ConversationMemory
+
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+def add_turn(memory, i):
+    memory.add({"role": "user", "content": f"prompt {i}"})
+    memory.add(
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {"id": f"call-{i}", "type": "function", "function": {"name": "execute_code", "arguments": "{}"}}
+            ],
+        }
+    )
+    memory.add({"role": "tool", "tool_call_id": f"call-{i}", "name": "execute_code", "content": f"output {i}"})
+
+
+def user_prompts(memory):
+    return [message["content"] for message in memory.messages if message["role"] == "user"]
+
+
+def test_window_keeps_the_last_turns_with_their_tool_results():
+    memory = ConversationMemory(system_prompt="system", policy="window", window=2)
+    for i in range(5):
+        add_turn(memory, i)
+
+    assert memory.messages[0] == {"role": "system", "content": "system"}
+    assert user_prompts(memory) == ["prompt 3", "prompt 4"]
+    assert [message["role"] for message in memory.messages[1:]] == ["user", "assistant", "tool"] * 2
+
+
+def test_token_budget_drops_the_oldest_turns():
+    memory = ConversationMemory(system_prompt="system", policy="tokens", max_tokens=40, encoding=WordEncoding())
+    for i in range(10):
+        add_turn(memory, i)
+        assert memory.count_tokens() <= 40
+
+    assert user_prompts(memory)[-1] == "prompt 9"
+    assert len(user_prompts(memory)) < 10
+
+
+def test_older_turns_are_summarized():
+    summarize = MagicMock(side_effect=lambda messages: f"{len(messages)} messages")
+    memory = ConversationMemory(system_prompt="system", policy="summarize", window=1, summarize=summarize)
+    add_turn(memory, 0)
+    add_turn(memory, 1)
+    add_turn(memory, 2)
+
+    assert summarize.call_count == 2
+    # the second summary includes the first one
+    assert summarize.call_args.args[0][0]["content"].endswith("3 messages")
+    assert memory.messages[1]["content"].endswith("4 messages")
+    assert user_prompts(memory) == ["prompt 2"]
+
+
+def test_summarize_policy_needs_a_summarizer():
+    with pytest.raises(ValueError):
+        ConversationMemory(system_prompt="system", policy="summarize")
+
+
+def test_agent_sessions_have_bounded_independent_histories(monkeypatch):
+    response = MagicMock()
+    response.usage.prompt_tokens = 42
+    create = MagicMock(return_value=response)
+    monkeypatch.setattr(agents, "create_chat_completion", create)
+    settings = agent_settings.model_copy(update={"history_policy": "window", "history_window": 2})
+    agent = OpenAIAgent(system_prompt="system", agent_settings=settings)
+
+    session = agent.new_session()
+    for i in range(5):
+        session.call_gpt(user_prompt=f"prompt {i}")
+
+    assert session.prompt_tokens == [42] * 5
+    assert user_prompts(session.memory) == ["prompt 3", "prompt 4"]
+    assert create.call_args.kwargs["messages"][0] == {"role": "system", "content": "system"}
+    assert agent.messages == [{"role": "system", "content": "system"}]
@@ -0,0 +1,87 @@
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+from weaviate.classes.config import Vectorizers
+
+from codinit.config import EmbeddingSettings
+from codinit.embeddings import CachedEmbedder, Embedder, EmbeddingCache, get_object_text, get_vectorizer_config, uses_client_side_vectors
+from codinit.weaviate_batch import WeaviateBatchWriter
+
+
+class CountingEmbedder(Embedder):
+    model_name = "test-model"
+
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+def test_cached_embedder_only_embeds_missing_texts(tmp_path):
+    cache_path = str(tmp_path / "cache" / "embeddings.sqlite")
+    embedder = CountingEmbedder()
+    cached = CachedEmbedder(embedder=embedder, cache=EmbeddingCache(cache_path))
+
+    assert cached.embed(["a", "bb"]) == [[1.0, 0.5], [2.0, 0.5]]
+    assert cached.embed(["bb", "ccc", "bb"]) == [[2.0, 0.5], [3.0, 0.5], [2.0, 0.5]]
+    assert embedder.embedded == ["a", "bb", "ccc"]
+
+    # the cache persists across instances
+    reopened = CachedEmbedder(embedder=CountingEmbedder(), cache=EmbeddingCache(cache_path))
+    assert reopened.embed_query("ccc") == [3.0, 0.5]
+    assert reopened.embedder.embedded == []
+
+def test_get_object_text_uses_vectorized_properties():
+    properties = {"name": "agent.py", "link": "/repo/agent.py", "content_hash": "abc"}
+
+    assert get_object_text("File", properties) == "agent.py"
+    assert get_object_text("Function", {"name": "", "code": "def run(): pass"}) == "Function"
+
+def test_functions_without_description_get_different_texts():
+    run = {"name": "run", "description": "", "code": "def run(task): ...", "parameters": ["task"], "variables": [], "return_value": ["result"]}
+    stop = {"name": "stop", "description": "", "code": "def stop(): ...", "parameters": [], "variables": ["timeout"], "return_value": []}
+
+    assert get_object_text("Function", run) == "run task result"
+    assert get_object_text("Function", stop) == "stop timeout"
+
+def test_batch_writer_passes_client_side_vectors():
+    client = MagicMock()
+    client.batch.failed_objects = []
+    client.batch.failed_references = []
+    batch = client.batch.fixed_size.return_value.__enter__.return_value
+    embedder = CountingEmbedder()
+    writer = WeaviateBatchWriter(client=client, embedder=embedder)
+
+    writer.add_object(collection="Import", properties={"name": "os"}, uuid="1")
+    writer.add_object(collection="Import", properties={"name": "sys"}, uuid="2", vector=[9.0])
+    writer.close()
+
+    vectors = [c.kwargs["vector"] for c in batch.add_object.call_args_list]
+    assert vectors == [[2.0, 0.5], [9.0]]
+    assert embedder.embedded == ["os"]
+
+def test_get_vectorizer_config_follows_provider():
+    openai_settings = EmbeddingSettings(provider="openai")
+    huggingface_settings = EmbeddingSettings(provider="huggingface", model="sentence-transformers/all-mpnet-base-v2")
+    local_settings = EmbeddingSettings(provider="sentence_transformers")
+
+    assert get_vectorizer_config(openai_settings).vectorizer == Vectorizers.TEXT2VEC_OPENAI
+    assert get_vectorizer_config(huggingface_settings).vectorizer == Vectorizers.TEXT2VEC_HUGGINGFACE
+    assert get_vectorizer_config(local_settings).vectorizer == Vectorizers.NONE
+    assert uses_client_side_vectors(local_settings)
+    assert not uses_client_side_vectors(huggingface_settings)
+
+
+def test_openai_vectorizer_uses_the_configured_model():
+    ada_config = get_vectorizer_config(EmbeddingSettings(provider="openai", model="text-embedding-ada-002"))
+    small_config = get_vectorizer_config(EmbeddingSettings(provider="openai", model="text-embedding-3-small"))
+
+    assert ada_config._to_dict()["model"] == "ada" and ada_config._to_dict()["modelVersion"] == "002"
+    assert small_config._to_dict()["model"] == "text-embedding-3-small"
+    with pytest.raises(ValueError):
+        get_vectorizer_config(EmbeddingSettings(provider="openai", model="text-embedding-curie-001"))
+    # the client computes the vectors of any model itself
+    client_side_settings = EmbeddingSettings(provider="openai", model="text-embedding-curie-001", client_side_vectors=True)
+    assert get_vectorizer_config(client_side_settings).vectorizer == Vectorizers.NONE
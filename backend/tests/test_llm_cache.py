@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from codinit import llm_scheduler
+from codinit.llm_cache import LLMCache, LLMCacheMiss, llm_cache_scope
+
+
+def completion(content):
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo-1106",
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            ],
+        }
+    )
+
+
+def request(content="question", temperature=0.0):
+    return {
+        "model": "gpt-3.5-turbo-1106",
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature,
+        "tools": None,
+    }
+
+
+def test_keys_depend_on_the_request():
+    cache = LLMCache()
+
+    assert cache.make_key(request()).split(":")[0] == LLMCache().make_key(request()).split(":")[0]
+    assert cache.make_key(request()) != cache.make_key(request())
+    assert LLMCache().make_key(request()) != LLMCache().make_key(request(temperature=0.7))
+    assert LLMCache().make_key(request()) != LLMCache().make_key(request(content="other"))
+    assert LLMCache().make_key(request()) != LLMCache().make_key({**request(), "max_tokens": 10})
+    assert LLMCache().make_key(request()) != LLMCache().make_key({**request(), "seed": 1})
+    # client options and unset parameters do not change the completion
+    assert LLMCache().make_key(request()) == LLMCache().make_key({**request(), "timeout": 5, "extra_headers": {"a": "b"}})
+    assert LLMCache().make_key(request()) == LLMCache().make_key({**request(), "stop": None})
+
+
+def test_replay_returns_the_recorded_completions_in_order(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    recorder = LLMCache(mode="record", path=path)
+    key = recorder.make_key(request())
+    assert recorder.get(key) is None
+    recorder.put(key, completion("first"))
+    recorder.put(recorder.make_key(request()), completion("second"))
+
+    replayer = LLMCache(mode="replay", path=path)
+    answers = [replayer.get(replayer.make_key(request())).choices[0].message.content for _ in range(3)]
+
+    assert answers == ["first", "second", "first"]
+    with pytest.raises(LLMCacheMiss):
+        replayer.get(replayer.make_key(request(content="not recorded")))
+
+
+def test_off_mode_does_not_store(tmp_path):
+    cache = LLMCache(mode="off", path=str(tmp_path / "llm.sqlite"))
+    cache.put(cache.make_key(request()), completion("answer"))
+
+    assert cache.get(cache.make_key(request())) is None
+    assert not (tmp_path / "llm.sqlite").exists()
+
+
+def test_replayed_requests_are_not_sent(tmp_path, monkeypatch):
+    path = str(tmp_path / "llm.sqlite")
+    scheduler = MagicMock()
+    scheduler.complete.return_value = completion("answer")
+    monkeypatch.setattr(llm_scheduler, "get_llm_scheduler", lambda: scheduler)
+
+    monkeypatch.setattr(llm_scheduler, "get_llm_cache", lambda: LLMCache(mode="record", path=path))
+    assert llm_scheduler.create_chat_completion(**request()).choices[0].message.content == "answer"
+
+    monkeypatch.setattr(llm_scheduler, "get_llm_cache", lambda: LLMCache(mode="replay", path=path))
+    assert llm_scheduler.create_chat_completion(**request()).choices[0].message.content == "answer"
+    assert scheduler.complete.call_count == 1
+
+
+def test_requests_are_numbered_per_scope(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    recorder = LLMCache(mode="record", path=path)
+    for task in ["task_0", "task_1"]:
+        with llm_cache_scope(task):
+            for answer in ["first", "second"]:
+                recorder.put(recorder.make_key(request()), completion(f"{task} {answer}"))
+
+    replayer = LLMCache(mode="replay", path=path)
+    answers = {}
+
+    def replay(task):
+        with llm_cache_scope(task):
+            answers[task] = [replayer.get(replayer.make_key(request())).choices[0].message.content for _ in range(2)]
+
+    # the tasks run in another order and thread than when they were recorded
+    replay("task_1")
+    thread = threading.Thread(target=replay, args=("task_0",))
+    thread.start()
+    thread.join()
+
+    assert answers == {"task_0": ["task_0 first", "task_0 second"], "task_1": ["task_1 first", "task_1 second"]}
+
+
+def test_scope_reaches_worker_threads_of_async_calls():
+    cache = LLMCache()
+
+    async def make_keys():
+        with llm_cache_scope("task_0"):
+            return cache.make_key(request()), await asyncio.to_thread(cache.make_key, request())
+
+    first, second = asyncio.run(make_keys())
+    assert first.startswith("task_0:") and first.endswith(":0")
+    assert second == first[:-1] + "1"
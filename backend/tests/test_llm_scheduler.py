@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from codinit.config import RateLimitSettings
+from codinit.llm_scheduler import LLMScheduler, parse_reset_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def raw_response(headers=None, total_tokens=10):
+    completion = MagicMock()
+    completion.usage.total_tokens = total_tokens
+    return MagicMock(headers=headers or {}, parse=MagicMock(return_value=completion))
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset_duration("7") == 7
+    assert parse_reset_duration(None) is None
+    assert parse_reset_duration("soon") is None
+
+
+def test_token_bucket_delays_requests_over_the_limit():
+    clock = FakeClock()
+    scheduler = LLMScheduler(RateLimitSettings(requests_per_minute=60, tokens_per_minute=600), clock=clock)
+
+    assert scheduler.try_acquire("gpt", scheduler.enqueue("gpt"), tokens=500) == 0
+    ticket = scheduler.enqueue("gpt")
+    # 400 missing tokens refill at 10 tokens per second
+    assert scheduler.try_acquire("gpt", ticket, tokens=500) == pytest.approx(40)
+    clock.now = 40
+    assert scheduler.try_acquire("gpt", ticket, tokens=500) == 0
+
+
+def test_requests_are_admitted_in_arrival_order():
+    clock = FakeClock()
+    scheduler = LLMScheduler(RateLimitSettings(requests_per_minute=60, tokens_per_minute=600), clock=clock)
+    first = scheduler.enqueue("gpt")
+    second = scheduler.enqueue("gpt")
+
+    # a small request does not overtake a waiting large one
+    assert scheduler.try_acquire("gpt", second, tokens=1) > 0
+    assert scheduler.try_acquire("gpt", first, tokens=600) == 0
+    assert scheduler.try_acquire("gpt", second, tokens=1) > 0
+    scheduler.cancel("gpt", second)
+    assert list(scheduler.get_limits("gpt").waiting) == []
+
+
+def test_headers_update_the_buckets():
+    clock = FakeClock()
+    scheduler = LLMScheduler(RateLimitSettings(requests_per_minute=60, tokens_per_minute=600), clock=clock)
+
+    scheduler.update_from_headers(
+        "gpt",
+        {
+            "x-ratelimit-limit-requests": "120",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "500ms",
+            "x-ratelimit-limit-tokens": "6000",
+            "x-ratelimit-remaining-tokens": "5000",
+        },
+    )
+
+    limits = scheduler.get_limits("gpt")
+    assert limits.requests.capacity == 120 and limits.tokens.capacity == 6000
+    assert limits.tokens.level == 600
+    assert limits.blocked_until == pytest.approx(0.5)
+
+
+def test_rate_limited_requests_wait_for_retry_after():
+    waits = []
+    scheduler = LLMScheduler(RateLimitSettings(max_retries=2))
+    responses = [rate_limit_error({"retry-after-ms": "30"}), raw_response({"x-ratelimit-remaining-tokens": "100"})]
+
+    def request():
+        waits.append(scheduler.get_limits("gpt").blocked_until)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    completion = scheduler.complete("gpt", request, estimated_tokens=50)
+
+    assert completion.usage.total_tokens == 10
+    assert waits[1] > 0
+    assert scheduler.get_limits("gpt").tokens.level <= 100
+
+
+def test_rate_limit_error_is_raised_after_the_retries():
+    scheduler = LLMScheduler(RateLimitSettings(max_retries=1, default_retry_after=0.01))
+    request = MagicMock(side_effect=rate_limit_error({}))
+
+    with pytest.raises(RateLimitError):
+        scheduler.complete("gpt", request, estimated_tokens=1)
+    assert request.call_count == 2
+    assert list(scheduler.get_limits("gpt").waiting) == []
+
+
+def test_async_and_threaded_callers_share_the_limits():
+    scheduler = LLMScheduler(RateLimitSettings(requests_per_minute=6000, tokens_per_minute=60000))
+    in_flight = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            in_flight.append(1)
+        return raw_response()
+
+    async def request_async():
+        return request()
+
+    async def run():
+        await asyncio.gather(*[scheduler.complete_async("gpt", request_async, estimated_tokens=10) for _ in range(5)])
+
+    threads = [threading.Thread(target=scheduler.complete, args=("gpt", request, 10)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(run())
+    for thread in threads:
+        thread.join()
+
+    assert len(in_flight) == 10
+    assert list(scheduler.get_limits("gpt").waiting) == []
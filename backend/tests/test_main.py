@@ -0,0 +1,100 @@
+import csv
+import io
+import threading
+from unittest.mock import MagicMock
+
+from openai.types.chat import ChatCompletion
+
+from codinit import main
+from codinit.code_editor import PythonCodeEditor
+from codinit.config import eval_settings
+from codinit.llm_cache import LLMCache, llm_cache_scope
+
+
+def test_concurrent_rows_are_written_whole():
+    csvfile = io.StringIO()
+    writer = main.SerializedDictWriter(csvfile, fieldnames=["Run_ID", "Task"])
+
+    def write_rows(task_id):
+        for i in range(100):
+            writer.writerow({"Run_ID": task_id, "Task": "x" * 100 + str(i)})
+
+    threads = [threading.Thread(target=write_rows, args=(task_id,)) for task_id in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = list(csv.reader(io.StringIO(csvfile.getvalue())))
+    assert len(rows) == 400
+    assert all(len(row) == 2 and row[1].startswith("x" * 100) for row in rows)
+
+
+def test_tasks_get_their_own_directories(tmp_path):
+    settings = eval_settings.model_copy(update={"workdir": str(tmp_path)})
+
+    first = main.get_task_dir(run_id=1, task_id=0, eval_settings=settings)
+    second = main.get_task_dir(run_id=1, task_id=1, eval_settings=settings)
+
+    assert first != second
+    assert (tmp_path / "run_1" / "task_0").is_dir()
+
+
+def test_a_failed_task_does_not_stop_the_run():
+    executors = [MagicMock(task_id=task_id) for task_id in range(3)]
+    executors[1].execute_and_log.side_effect = RuntimeError("failed")
+
+    library = MagicMock()
+
+    main.run_tasks(executors, library=library, num_workers=3)
+
+    assert all(executor.execute_and_log.call_count == 1 for executor in executors)
+    assert all(executor.execute_and_log.call_args.kwargs["library"] is library for executor in executors)
+
+
+def test_task_code_runs_in_its_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    task_dir = main.get_task_dir(run_id=1, task_id=0, eval_settings=eval_settings.model_copy(update={"workdir": "runs"}))
+    code_editor = PythonCodeEditor(filename="magic_code.py", workdir=task_dir)
+
+    code_editor.overwrite_code("open('output.txt', 'w').write('done')")
+
+    assert "Program Succeeded" in code_editor.run_code()
+    assert (tmp_path / "runs" / "run_1" / "task_0" / "magic_code.py").is_file()
+    assert (tmp_path / "runs" / "run_1" / "task_0" / "output.txt").read_text() == "done"
+    assert not (tmp_path / "output.txt").exists()
+
+
+def test_recorded_corrections_are_replayed_in_a_new_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = eval_settings.model_copy(update={"workdir": str(tmp_path / "runs")})
+    path = str(tmp_path / "llm.sqlite")
+    answer = ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-3.5-turbo-1106",
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "fixed"}}
+            ],
+        }
+    )
+
+    def correction_key(cache, run_id):
+        code_editor = PythonCodeEditor(workdir=main.get_task_dir(run_id=run_id, task_id=0, eval_settings=settings))
+        code_editor.overwrite_code("import not_installed_module")
+        # the outputs of the code and the linter are part of the correction prompts
+        error = code_editor.run_code()
+        lint_result = code_editor.run_linter()
+        assert "not_installed_module" in error and lint_result
+        with llm_cache_scope("task_0"):
+            return cache.make_key(
+                {"model": "gpt-3.5-turbo-1106", "messages": [{"role": "user", "content": f"{error}\n{lint_result}"}]}
+            )
+
+    recorder = LLMCache(mode="record", path=path)
+    recorder.put(correction_key(recorder, run_id=1), answer)
+
+    replayer = LLMCache(mode="replay", path=path)
+    assert replayer.get(correction_key(replayer, run_id=2)).choices[0].message.content == "fixed"
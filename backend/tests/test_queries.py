@@ -0,0 +1,106 @@
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import pytest
+from weaviate.exceptions import WeaviateQueryError
+
+from codinit import queries
+from codinit.queries import KGQuery, get_imports_from_kg, run_queries
+
+
+def kg_object(name, references=None):
+    return MagicMock(
+        uuid=f"uuid-{name}",
+        properties={"name": name},
+        references={
+            link: MagicMock(objects=[MagicMock(properties={"name": target}) for target in targets])
+            for link, targets in (references or {}).items()
+        },
+    )
+
+
+class SlowCollection:
+    """Collection stand-in answering every search after a delay, counting concurrent searches."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.query = MagicMock()
+        self.query.bm25.side_effect = self.search
+        self.query.near_text.side_effect = self.search
+        self.query.near_vector.side_effect = self.search
+
+    def search(self, query=None, near_vector=None, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if query == "broken":
+            raise WeaviateQueryError("bad query", "GRPC")
+        name = query if query is not None else f"vector-{near_vector[0]}"
+        return MagicMock(objects=[kg_object(name, {"belongsToFile": ["file.py"]})])
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    collection = SlowCollection()
+    client = MagicMock()
+    client.collections.get.return_value = collection
+
+    @contextmanager
+    def connection():
+        yield client
+
+    monkeypatch.setattr(queries, "weaviate_connection", connection)
+    monkeypatch.setattr(queries, "get_embedder", lambda: None)
+    return collection
+
+
+def test_run_queries_runs_concurrently_and_keeps_order(collection):
+    batch = [KGQuery(collection="Import", query=f"import_{i}", search="bm25") for i in range(8)]
+
+    results = run_queries(batch, max_workers=4)
+
+    assert [result.objects[0].properties["name"] for result in results] == [f"import_{i}" for i in range(8)]
+    assert results[0].objects[0].references == {"belongsToFile": ["file.py"]}
+    assert collection.max_in_flight == 4
+    assert collection.query.bm25.call_args.kwargs["query_properties"] == ["name"]
+
+
+def test_run_queries_reports_failed_queries(collection):
+    results = run_queries([KGQuery(collection="Import", query="broken"), KGQuery(collection="Import", query="ok")])
+
+    assert results[0].error is not None and results[0].objects == []
+    assert results[1].error is None and len(results[1].objects) == 1
+
+
+def test_run_queries_embeds_near_text_queries_in_one_call(collection, monkeypatch):
+    embedder = MagicMock()
+    embedder.embed.side_effect = lambda texts: [[float(i)] for i in range(len(texts))]
+    monkeypatch.setattr(queries, "get_embedder", lambda: embedder)
+    batch = [
+        KGQuery(collection="Function", query="execute"),
+        KGQuery(collection="Import", query="os", search="bm25"),
+        KGQuery(collection="Class", query="Agent"),
+    ]
+
+    results = run_queries(batch)
+
+    embedder.embed.assert_called_once_with(["execute", "Agent"])
+    assert [result.objects[0].properties["name"] for result in results] == ["vector-0.0", "os", "vector-1.0"]
+
+
+def test_get_imports_from_kg_looks_up_all_imports_in_one_batch(collection):
+    result = get_imports_from_kg(["os", "json"], library_name="lib")
+
+    assert {name: [obj.properties["name"] for obj in objects] for name, objects in result.items()} == {
+        "os": ["os"],
+        "json": ["json"],
+    }
+    assert collection.max_in_flight == 2
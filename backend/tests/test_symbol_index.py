@@ -0,0 +1,226 @@
+import json
+import os
+from unittest.mock import MagicMock
+
+import libcst
+import pytest
+
+from codinit import code_editor
+from codinit.codebaseKG import get_import_names
+from codinit.code_editor import PythonCodeEditor
+from codinit.config import IngestionSettings
+from codinit.symbol_index import (
+    SymbolIndex,
+    build_symbol_index,
+    get_file_symbols,
+    get_module_name,
+    close_symbol_indexes,
+    get_symbol_index,
+    write_symbol_index,
+)
+
+SYMBOLS = [
+    "langchain",
+    "langchain.agents",
+    "langchain.agents.AgentExecutor",
+    "langchain.agents.AgentExecutor.run",
+    "langchain.agents.agent",
+    "langchain.agents.agent.AgentExecutor",
+    "langchain.agents.initialize_agent",
+    "langchain.llms",
+    "langchain.llms.OpenAI",
+    "langchain.prompts.PromptTemplate",
+]
+
+
+@pytest.fixture
+def symbol_index(tmp_path):
+    path = str(tmp_path / "langchain.symbols")
+    write_symbol_index(reversed(SYMBOLS), path)
+    symbol_index = SymbolIndex(path)
+    yield symbol_index
+    symbol_index.close()
+
+
+def test_exact_lookup(symbol_index):
+    for symbol in SYMBOLS:
+        assert symbol in symbol_index
+    assert "langchain.agents.Agent" not in symbol_index
+    assert "langchain.agent" not in symbol_index
+    assert "a" not in symbol_index
+    assert "z" not in symbol_index
+
+
+def test_prefix_lookup(symbol_index):
+    assert symbol_index.complete("langchain.agents.Agent") == [
+        "langchain.agents.AgentExecutor",
+        "langchain.agents.AgentExecutor.run",
+    ]
+    assert symbol_index.complete("langchain.l", limit=1) == ["langchain.llms"]
+    assert symbol_index.children("langchain.agents") == ["AgentExecutor", "agent", "initialize_agent"]
+
+
+def test_suggestions_for_missing_names(symbol_index):
+    assert symbol_index.suggest("langchain.agents.AgentExecuter")[0] == "langchain.agents.AgentExecutor"
+    assert symbol_index.suggest("langchain.agnts.AgentExecutor", n=1) == ["langchain.agents.AgentExecutor"]
+    assert symbol_index.suggest("langchain.agents.initialise_agent", n=1) == ["langchain.agents.initialize_agent"]
+    assert symbol_index.suggest("numpy.array") == []
+    assert symbol_index.validate(["langchain.llms.OpenAI", "langchain.LLMChain"]) == {
+        "langchain.llms.OpenAI": True,
+        "langchain.LLMChain": False,
+    }
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "empty.symbols")
+    write_symbol_index([], path)
+
+    with SymbolIndex(path) as symbol_index:
+        assert "langchain" not in symbol_index
+        assert symbol_index.complete("") == []
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / "handwritten.symbols"
+    path.write_bytes(b"langchain\nlangchain.agents\nlangchain.llms")
+
+    with SymbolIndex(str(path)) as symbol_index:
+        assert "langchain.llms" in symbol_index
+        assert "langchain.llm" not in symbol_index
+        assert "langchain.zzz" not in symbol_index
+        assert symbol_index.complete("langchain.") == ["langchain.agents", "langchain.llms"]
+    assert symbol_index.file.closed
+
+
+def test_module_names_skip_directories_that_are_no_packages(tmp_path):
+    package = tmp_path / "libs" / "core" / "langchain" / "agents"
+    package.mkdir(parents=True)
+    (package / "__init__.py").touch()
+    (package.parent / "__init__.py").touch()
+
+    assert get_module_name(str(package / "agent.py"), str(tmp_path)) == "langchain.agents.agent"
+    assert get_module_name(str(package / "__init__.py"), str(tmp_path)) == "langchain.agents"
+    assert get_module_name(str(tmp_path / "setup.py"), str(tmp_path)) == "setup"
+
+
+def test_file_symbols_include_re_exports():
+    symbols = get_file_symbols(
+        module_name="langchain.agents",
+        imports=["langchain.agents.agent.AgentExecutor", ".loading.load_agent", "os", "typing.*"],
+        classes={"Tool": ["run"]},
+        functions=["initialize_agent"],
+    )
+
+    assert symbols == {
+        "langchain",
+        "langchain.agents",
+        "langchain.agents.AgentExecutor",
+        "langchain.agents.load_agent",
+        "langchain.agents.os",
+        "langchain.agents.Tool",
+        "langchain.agents.Tool.run",
+        "langchain.agents.initialize_agent",
+    }
+
+
+def test_aliased_re_exports_are_bound_to_their_alias():
+    module = libcst.parse_module("from .core import Agent as PublicAgent\nimport os.path as osp\n")
+    imports = [name for statement in module.body for name in get_import_names(statement.body[0])]
+
+    assert imports == [".core.Agent as PublicAgent", "os.path as osp"]
+    assert get_file_symbols(module_name="pkg", imports=imports) == {"pkg", "pkg.PublicAgent", "pkg.osp"}
+
+
+def test_star_re_exports_are_checked_in_the_venv(symbol_index, monkeypatch, tmp_path):
+    # langchain.agents re-exports create_agent with "from .factory import *"
+    monkeypatch.setattr(code_editor, "get_symbol_index", lambda library_name: symbol_index)
+    editor = PythonCodeEditor(workdir=str(tmp_path))
+    run_script = MagicMock(
+        return_value=MagicMock(stdout=json.dumps({"langchain.agents.create_agent": True}), stderr="")
+    )
+    monkeypatch.setattr(editor, "run_script_inside_env", run_script)
+
+    code = "import langchain\nlangchain.agents.create_agent(langchain.llms.OpenAI())\n"
+    result = editor.validate_code_imports(code=code, dependencies=["langchain"])
+
+    assert result == {
+        "langchain.agents": True,
+        "langchain.agents.create_agent": True,
+        "langchain.llms": True,
+        "langchain.llms.OpenAI": True,
+    }
+    # only the name missing from the index is checked in the venv
+    assert json.loads(run_script.call_args.args[1]) == ["langchain.agents.create_agent"]
+
+
+def test_imports_found_in_the_index_do_not_start_the_venv(symbol_index, monkeypatch, tmp_path):
+    monkeypatch.setattr(code_editor, "get_symbol_index", lambda library_name: symbol_index)
+    editor = PythonCodeEditor(workdir=str(tmp_path))
+    run_script = MagicMock()
+    monkeypatch.setattr(editor, "run_script_inside_env", run_script)
+
+    code = "import langchain\nlangchain.llms.OpenAI()\n"
+    result = editor.validate_code_imports(code=code, dependencies=["langchain"])
+
+    assert result == {"langchain.llms": True, "langchain.llms.OpenAI": True}
+    run_script.assert_not_called()
+
+
+def reference(*objects):
+    return MagicMock(objects=list(objects))
+
+
+def kg_object(uuid, name, references=None):
+    return MagicMock(uuid=uuid, properties={"name": name}, references=references)
+
+
+def test_build_symbol_index_from_kg(tmp_path):
+    repo_dir = tmp_path / "repo"
+    (repo_dir / "lib").mkdir(parents=True)
+    (repo_dir / "lib" / "__init__.py").touch()
+    method = kg_object("f1", "run")
+    file_obj = MagicMock(
+        properties={"link": str(repo_dir / "lib" / "tools.py")},
+        references={
+            "hasImport": reference(kg_object("i1", "os.path")),
+            "hasFunction": reference(method, kg_object("f2", "load_tools")),
+            "hasClass": reference(kg_object("c1", "Tool", {"hasFunction": reference(method)})),
+        },
+    )
+    other_file = MagicMock(properties={"link": "/other/repo/module.py"}, references={})
+    sibling_file = MagicMock(
+        properties={"link": str(tmp_path / "repo_experimental" / "lib" / "tools.py")},
+        references={"hasFunction": reference(kg_object("f3", "experimental_tool"))},
+    )
+    client = MagicMock()
+    client.collections.get.return_value.iterator.return_value = [file_obj, other_file, sibling_file]
+    settings = IngestionSettings(symbol_index_dir=str(tmp_path / "symbols"))
+
+    path = build_symbol_index(str(repo_dir), "lib", client, ingestion_settings=settings)
+
+    with open(path) as f:
+        assert f.read().splitlines() == [
+            "lib",
+            "lib.tools",
+            "lib.tools.Tool",
+            "lib.tools.Tool.run",
+            "lib.tools.load_tools",
+            "lib.tools.path",
+        ]
+    symbol_index = get_symbol_index("lib", ingestion_settings=settings)
+    assert "lib.tools.Tool.run" in symbol_index
+    assert get_symbol_index("lib", ingestion_settings=settings) is symbol_index
+    assert get_symbol_index("missing", ingestion_settings=settings) is None
+
+    # a rebuilt index is reopened
+    write_symbol_index(["lib", "lib.agents"], path)
+    os.utime(path, (0, 0))
+    reopened = get_symbol_index("lib", ingestion_settings=settings)
+    assert "lib.agents" in reopened
+    # threads that got the previous index before the rebuild can still use it
+    assert not symbol_index.file.closed
+    assert "lib.tools.Tool.run" in symbol_index
+
+    close_symbol_indexes()
+    assert reopened.file.closed
+    assert get_symbol_index("lib", ingestion_settings=settings) is not reopened
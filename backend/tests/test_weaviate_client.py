@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock
+
+import pytest
+from weaviate.exceptions import WeaviateConnectionError
+
+from codinit.weaviate_client import WeaviateConnectionManager
+
+
+def test_connection_manager_creates_client_lazily_and_reuses_it():
+    client_factory = MagicMock()
+    manager = WeaviateConnectionManager(client_factory=client_factory, health_check_interval=60)
+    client_factory.assert_not_called()
+
+    with manager.connection() as first, manager.connection() as second:
+        assert first is second
+    client_factory.assert_called_once()
+    first.close.assert_not_called()
+
+def test_connection_manager_reconnects_unhealthy_client():
+    unhealthy, healthy = MagicMock(), MagicMock()
+    unhealthy.is_ready.return_value = False
+    manager = WeaviateConnectionManager(client_factory=MagicMock(side_effect=[unhealthy, healthy]), health_check_interval=0)
+
+    assert manager.get_client() is unhealthy
+    assert manager.get_client() is healthy
+    unhealthy.close.assert_called_once()
+
+def test_connection_manager_checks_health_after_connection_error():
+    client = MagicMock()
+    manager = WeaviateConnectionManager(client_factory=MagicMock(return_value=client), health_check_interval=60)
+
+    with pytest.raises(WeaviateConnectionError):
+        with manager.connection():
+            raise WeaviateConnectionError("connection lost")
+    manager.get_client()
+
+    client.is_ready.assert_called_once()